@@ -8,9 +8,13 @@ from wgpu import (
     ShaderStage,
 )
 from wgut import (
+    create_bind_group_layout,
+    create_compute_pipeline,
+    create_pipeline_layout,
+    create_shader_module,
     get_adapter,
     read_buffer,
-    load_file,
+    load_shader,
     get_device,
     submit_command,
     write_buffer,
@@ -22,6 +26,7 @@ from pygfx import (
 from pygfx.utils.compute import ComputeShader
 
 from wgut.core import read_pygfx_buffer
+from wgut import compute
 
 
 class Timer:
@@ -70,16 +75,18 @@ with Timer("Get Device"):
     get_device()
 
 with Timer("Setup ComputePipeline"):
-    shader_source = (
-        load_file("compute.wgsl")
-        .replace("WORKGROUP_SIZE", str(workgroup_size))
-        .replace("Y_STRIDE", str(workgroup_size * dispatch_size) + "u")
+    shader_source = load_shader(
+        "compute.wgsl",
+        defines={
+            "WORKGROUP_SIZE": workgroup_size,
+            "Y_STRIDE": f"{workgroup_size * dispatch_size}u",
+        },
     )
 
-    shader_module = get_device().create_shader_module(code=shader_source)
+    shader_module = create_shader_module(shader_source)
 
-    bind_group_layout = get_device().create_bind_group_layout(
-        entries=[
+    bind_group_layout = create_bind_group_layout(
+        [
             {
                 "binding": 0,
                 "visibility": ShaderStage.COMPUTE,
@@ -93,11 +100,9 @@ with Timer("Setup ComputePipeline"):
         ]
     )
 
-    pipeline_layout = get_device().create_pipeline_layout(
-        bind_group_layouts=[bind_group_layout]
-    )
+    pipeline_layout = create_pipeline_layout([bind_group_layout])
 
-    pipeline = get_device().create_compute_pipeline(
+    pipeline = create_compute_pipeline(
         layout=pipeline_layout,
         compute={
             "module": shader_module,
@@ -186,3 +191,8 @@ with Timer("Read pygfx Buffer to np.array"):
     result = np.frombuffer(out.cast("i"), dtype=np.int32)
 
 print(result)
+
+with Timer("wgut.compute GPUArray map"):
+    result = compute.array(numpy_data).map("x * x").numpy()
+
+print("GPUArray Result is OK:", bool((result == 9).all()))
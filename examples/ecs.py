@@ -9,7 +9,6 @@ from pygfx import (
     TransformGizmo,
     WgpuRenderer,
     sphere_geometry,
-    load_mesh,
     OrbitController,
 )
 
@@ -20,10 +19,13 @@ from wgut import (
     render_system,
     window_system,
     ECS,
-    create_texture,
+    create_texture_async,
     render_gui_system,
     performance_monitor,
+    memory_monitor,
     create_canvas,
+    texture_upload_system,
+    load_cached_mesh,
 )
 
 
@@ -52,9 +54,9 @@ def setup(ecs: ECS, _):
     ball = Mesh(
         sphere_geometry(1),
         MeshStandardMaterial(
-            map=create_texture("./textures/Wood_025_basecolor.jpg"),
-            normal_map=create_texture("./textures/Wood_025_normal.jpg"),
-            roughness_map=create_texture("./textures/Wood_025_roughness.jpg"),
+            map=create_texture_async("./textures/Wood_025_basecolor.jpg"),
+            normal_map=create_texture_async("./textures/Wood_025_normal.jpg"),
+            roughness_map=create_texture_async("./textures/Wood_025_roughness.jpg"),
             pick_write=True,
         ),
     )
@@ -63,12 +65,12 @@ def setup(ecs: ECS, _):
     ball.add_event_handler(test_event, "click")
 
     # Bunny
-    bunny = load_mesh("./models/bunny.obj")[0]
+    bunny = load_cached_mesh("./models/bunny.obj")
     bunny.local.x += 1
     bunny.local.y -= 0.5
     bunny.local.scale = 10
     bunny.material = MeshStandardMaterial(
-        map=create_texture("./textures/texel_checker.png")
+        map=create_texture_async("./textures/texel_checker.png")
     )
     ecs.spawn([SceneObject(bunny)], label="Bunny")
     gizmo = TransformGizmo(object=bunny)
@@ -90,8 +92,10 @@ def setup(ecs: ECS, _):
     ECS()
     .on("setup", setup)
     .do(performance_monitor)
+    .do(memory_monitor)
     .do(ecs_explorer)
     .do(render_system, renderer)
+    .do(texture_upload_system)
     .do(render_gui_system)
     .do(window_system, canvas, "Hello ECS")
 )
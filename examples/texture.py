@@ -24,6 +24,8 @@ from wgut import (
     write_buffer,
     write_texture,
     create_canvas,
+    flush_mipmaps,
+    get_mip_level_count,
 )
 import numpy as np
 
@@ -124,17 +126,21 @@ class MyApp(Window):
             address_mode_u=AddressMode.repeat,  # type: ignore
             address_mode_v=AddressMode.repeat,  # type: ignore
             mag_filter=FilterMode.nearest,  # type: ignore
-            min_filter=FilterMode.nearest,  # type: ignore
-            mipmap_filter=MipmapFilterMode.nearest,  # type: ignore
+            min_filter=FilterMode.linear,  # type: ignore
+            mipmap_filter=MipmapFilterMode.linear,  # type: ignore
         )
 
         image = load_image("./textures/Wood_025_basecolor.jpg")
         texture = get_device().create_texture(
             size=image.size,
             format=TextureFormat.rgba8unorm_srgb,  # type: ignore
-            usage=TextureUsage.TEXTURE_BINDING | TextureUsage.COPY_DST,  # type: ignore
+            mip_level_count=get_mip_level_count(image.size),
+            usage=TextureUsage.TEXTURE_BINDING  # type: ignore
+            | TextureUsage.COPY_DST
+            | TextureUsage.RENDER_ATTACHMENT,
         )
-        write_texture(texture, image)
+        write_texture(texture, image, mipmaps=True)
+        flush_mipmaps()
 
         self.bind_group = get_device().create_bind_group(
             layout=bind_group_layout,
@@ -1,4 +1,5 @@
 from wgut.shadertoy import ShaderToy
+from wgut.shadertoy_offline import OfflineShaderToy
 from wgut.core import (
     get_adapter,
     get_shared,
@@ -9,32 +10,97 @@ from wgut.core import (
     write_buffer,
     write_pygfx_buffer,
     write_texture,
+    generate_mipmaps,
+    queue_mipmaps,
+    flush_mipmaps,
+    get_mip_level_count,
     load_image,
     create_texture,
+    create_texture_async,
+    process_texture_uploads,
+    pending_texture_uploads,
+    get_texture_cache_stats,
+    set_texture_cache_budget,
+    clear_texture_cache,
     create_canvas,
     load_file,
+    load_shader,
+    preprocess_shader,
+    ShaderPreprocessorError,
     submit_command,
+    create_command_encoder,
+    get_frame_encoder,
+    defer_command,
+    flush_commands,
+    end_frame,
+    AsyncReadback,
+    get_command_stats,
+    create_buffer,
+    track_gpu_memory,
+    get_gpu_memory_stats,
+    timestamp_writes,
+    get_gpu_times,
+    gpu_timing_supported,
+    create_shader_module,
+    create_bind_group_layout,
+    create_pipeline_layout,
+    create_render_pipeline,
+    create_compute_pipeline,
+    get_pipeline_cache_stats,
+    clear_pipeline_cache,
 )
 from wgut.window import Window
+from wgut.tools.gc_policy import GCPolicy
+from wgut.mesh_cache import load_cached_mesh, load_mesh_geometry, load_mesh_arrays
 from wgut.render_system import (
     SceneObject,
     render_system,
+    track_picking,
     ActiveCamera,
 )
 from wgut.render_gui_system import render_gui_system
+from wgut.transform_system import Transform, TransformStore, transform_system
+from wgut.bvh import BVH
+from wgut.picking import CPUPicker
+from wgut.spatial_index import (
+    SpatialIndex,
+    SpatialBounds,
+    Static,
+    spatial_index_system,
+)
 from wgut.window_system import window_system
+from wgut.texture_upload_system import texture_upload_system
+from wgut.asset_manager import AssetManager, AssetHandle, asset_system
 from wgut.ecs import ECS
 from wgut.performance_monitor import performance_monitor
+from wgut.memory_monitor import memory_monitor
 from wgut.ecs_explorer import ecs_explorer
+from wgut.compute import GPUArray, radix_sort, compact
+from wgut.particle_system import ParticleEmitter, particle_system
 
 __all__ = [
     "ShaderToy",
+    "OfflineShaderToy",
     "Window",
+    "GCPolicy",
+    "load_cached_mesh",
+    "load_mesh_geometry",
+    "load_mesh_arrays",
     "render_gui_system",
     "window_system",
+    "texture_upload_system",
+    "AssetManager",
+    "AssetHandle",
+    "asset_system",
     "ECS",
     "performance_monitor",
+    "memory_monitor",
     "ecs_explorer",
+    "GPUArray",
+    "radix_sort",
+    "compact",
+    "ParticleEmitter",
+    "particle_system",
     "get_adapter",
     "get_shared",
     "get_device",
@@ -44,12 +110,55 @@ __all__ = [
     "write_buffer",
     "write_pygfx_buffer",
     "write_texture",
+    "generate_mipmaps",
+    "queue_mipmaps",
+    "flush_mipmaps",
+    "get_mip_level_count",
     "load_image",
     "create_texture",
+    "create_texture_async",
+    "process_texture_uploads",
+    "pending_texture_uploads",
+    "get_texture_cache_stats",
+    "set_texture_cache_budget",
+    "clear_texture_cache",
     "create_canvas",
     "load_file",
+    "load_shader",
+    "preprocess_shader",
+    "ShaderPreprocessorError",
     "submit_command",
+    "create_command_encoder",
+    "get_frame_encoder",
+    "defer_command",
+    "flush_commands",
+    "end_frame",
+    "AsyncReadback",
+    "get_command_stats",
+    "create_buffer",
+    "track_gpu_memory",
+    "get_gpu_memory_stats",
+    "timestamp_writes",
+    "get_gpu_times",
+    "gpu_timing_supported",
+    "create_shader_module",
+    "create_bind_group_layout",
+    "create_pipeline_layout",
+    "create_render_pipeline",
+    "create_compute_pipeline",
+    "get_pipeline_cache_stats",
+    "clear_pipeline_cache",
     "SceneObject",
     "render_system",
     "ActiveCamera",
+    "Transform",
+    "TransformStore",
+    "transform_system",
+    "BVH",
+    "CPUPicker",
+    "track_picking",
+    "SpatialIndex",
+    "SpatialBounds",
+    "Static",
+    "spatial_index_system",
 ]
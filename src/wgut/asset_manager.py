@@ -0,0 +1,209 @@
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import pygfx as gfx
+from imgui_bundle import imgui
+
+from wgut.core import load_image, record_upload, track_gpu_memory
+from wgut.ecs import ECS
+from wgut.mesh_cache import load_mesh_arrays
+from wgut.tools import trace
+
+# A loader reads and decodes a file on a worker thread, an uploader turns the
+# result into a GPU resource on the main thread and returns it with its size.
+Loader = Callable[[str], Any]
+Uploader = Callable[[Any], tuple[Any, int]]
+
+
+def load_image_data(filename: str) -> np.ndarray:
+    with load_image(filename) as image:
+        return np.asarray(image)
+
+
+def upload_texture(data: np.ndarray) -> tuple[gfx.Texture, int]:
+    texture = gfx.Texture(data, dim=2)
+    return track_gpu_memory(texture, "texture", texture.nbytes), texture.nbytes
+
+
+def upload_geometry(arrays: dict[str, np.ndarray]) -> tuple[gfx.Geometry, int]:
+    return gfx.Geometry(**arrays), sum(array.nbytes for array in arrays.values())
+
+
+def _traced_load(loader: Loader, path: str) -> Any:
+    begin = perf_counter()
+    try:
+        return loader(path)
+    finally:
+        trace.complete(
+            f"load {os.path.basename(path)}", begin, perf_counter() - begin, "asset"
+        )
+
+
+@dataclass
+class Asset:
+    path: str
+    refcount: int = 0
+    value: Any = None
+    nbytes: int = 0
+    loading: bool = False
+    error: Exception | None = None
+
+
+class AssetHandle:
+    def __init__(self, manager: "AssetManager", asset: Asset):
+        self.__manager = manager
+        self.__asset = asset
+        self.__released = False
+
+    @property
+    def path(self) -> str:
+        return self.__asset.path
+
+    @property
+    def ready(self) -> bool:
+        return self.__asset.value is not None
+
+    @property
+    def value(self) -> Any:
+        return self.__asset.value
+
+    @property
+    def error(self) -> Exception | None:
+        return self.__asset.error
+
+    def release(self):
+        if not self.__released:
+            self.__released = True
+            self.__manager._release(self.__asset)
+
+    def __str__(self):
+        if self.__asset.error is not None:
+            state = "error"
+        elif self.ready:
+            state = "ready"
+        else:
+            state = "loading"
+        return f"Asset {os.path.basename(self.path)} ({state})"
+
+    def ecs_explorer_gui(self):
+        imgui.text(f"Path: {self.path}")
+        imgui.text(f"References: {self.__asset.refcount}")
+        imgui.text(f"GPU Memory: {self.__asset.nbytes / 2**20:.2f} MiB")
+        if self.__asset.error is not None:
+            imgui.text(f"Error: {self.__asset.error}")
+
+
+class AssetManager:
+    def __init__(self, budget_bytes: int = 1024 * 1024 * 1024, workers=None):
+        self.budget_bytes = budget_bytes
+        self.resident_bytes = 0
+        self.__pool = ThreadPoolExecutor(workers, thread_name_prefix="wgut-asset")
+        self.__assets: dict[str, Asset] = {}
+        # Loaded assets that nobody references, least recently released first
+        self.__unused: OrderedDict[str, Asset] = OrderedDict()
+        self.__ready: deque[tuple[Asset, Uploader, Future]] = deque()
+        self.__loaders: dict[str, tuple[Loader, Uploader]] = {}
+
+        for ext in (".png", ".jpg", ".jpeg", ".bmp", ".tga"):
+            self.register_loader(ext, load_image_data, upload_texture)
+        for ext in (".obj", ".ply", ".stl", ".off", ".glb", ".gltf"):
+            self.register_loader(ext, load_mesh_arrays, upload_geometry)
+
+    def register_loader(self, ext: str, loader: Loader, uploader: Uploader):
+        self.__loaders[ext.lower()] = (loader, uploader)
+
+    def __loader(self, path: str) -> tuple[Loader, Uploader]:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self.__loaders:
+            raise ValueError(f"No loader registered for '{ext}' files")
+        return self.__loaders[ext]
+
+    def load(self, filename: str) -> AssetHandle:
+        path = os.path.abspath(filename)
+        # Checked before the asset is referenced, a failed call leaves nothing
+        # to release
+        self.__loader(path)
+        asset = self.__assets.get(path)
+        if asset is None:
+            asset = Asset(path)
+            self.__assets[path] = asset
+        asset.refcount += 1
+        self.__unused.pop(path, None)
+
+        if asset.value is None and not asset.loading:
+            self.__submit(asset)
+        return AssetHandle(self, asset)
+
+    def __submit(self, asset: Asset):
+        loader, uploader = self.__loader(asset.path)
+        asset.loading = True
+        asset.error = None
+        future = self.__pool.submit(_traced_load, loader, asset.path)
+        future.add_done_callback(lambda f: self.__ready.append((asset, uploader, f)))
+
+    def _release(self, asset: Asset):
+        asset.refcount -= 1
+        if asset.refcount == 0:
+            if asset.value is not None:
+                self.__unused[asset.path] = asset
+            self.evict()
+
+    def update(self, upload_budget: int = 32 * 1024 * 1024) -> int:
+        uploaded = 0
+        # At least one asset is uploaded per call, even if it exceeds the budget
+        while len(self.__ready) > 0 and uploaded < upload_budget:
+            asset, uploader, future = self.__ready.popleft()
+            asset.loading = False
+            try:
+                asset.value, asset.nbytes = uploader(future.result())
+            except Exception as e:
+                print(f"WARNING: Loading {asset.path} failed: {e}")
+                asset.error = e
+                continue
+            self.resident_bytes += asset.nbytes
+            uploaded += asset.nbytes
+            if asset.refcount == 0:
+                self.__unused[asset.path] = asset
+        record_upload(uploaded)
+        self.evict()
+        return uploaded
+
+    def evict(self):
+        # Only unreferenced assets are evicted, referenced ones stay resident
+        # even when the budget is exceeded
+        while self.resident_bytes > self.budget_bytes and len(self.__unused) > 0:
+            _, asset = self.__unused.popitem(last=False)
+            self.resident_bytes -= asset.nbytes
+            asset.value = None
+            asset.nbytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "assets": len(self.__assets),
+            "loaded": sum(asset.value is not None for asset in self.__assets.values()),
+            "loading": sum(asset.loading for asset in self.__assets.values()),
+            "unused": len(self.__unused),
+            "resident_bytes": self.resident_bytes,
+            "budget_bytes": self.budget_bytes,
+        }
+
+    def shutdown(self):
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+
+def asset_system(
+    ecs: ECS, manager: AssetManager, upload_budget: int = 32 * 1024 * 1024
+):
+    def update(_ecs: ECS, _delta_time: float):
+        manager.update(upload_budget)
+
+    def handle_asset_manager(_ecs: ECS, fn: Callable[[AssetManager], None]):
+        fn(manager)
+
+    ecs.on("update", update)
+    ecs.on("call_with_asset_manager", handle_asset_manager)
@@ -0,0 +1,177 @@
+import numpy as np
+import numpy.typing as npt
+
+
+def expand_ranges(starts: npt.NDArray, counts: npt.NDArray) -> npt.NDArray[np.intp]:
+    # Concatenation of arange(start, start + count) for every range
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.intp)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total)
+
+
+def ray_aabb(
+    origins: npt.NDArray,
+    inverse_directions: npt.NDArray,
+    lo: npt.NDArray,
+    hi: npt.NDArray,
+    max_distance: npt.NDArray,
+) -> tuple[npt.NDArray[np.bool_], npt.NDArray]:
+    # Slab test, fmin and fmax ignore the NaN of rays parallel to a slab
+    with np.errstate(invalid="ignore"):
+        t1 = (lo - origins) * inverse_directions
+        t2 = (hi - origins) * inverse_directions
+    t_enter = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+    t_exit = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+    hit = (t_exit >= np.maximum(t_enter, 0.0)) & (t_enter <= max_distance)
+    return hit, t_enter
+
+
+class BVH:
+    def __init__(self, lo: npt.ArrayLike, hi: npt.ArrayLike, leaf_size: int = 8):
+        # Bounding volume hierarchy over the boxes of primitives, stored as
+        # flat arrays. Primitives are reordered so each leaf is a contiguous
+        # range of `self.order`.
+        lo = np.asarray(lo, dtype=np.float32).reshape(-1, 3)
+        hi = np.asarray(hi, dtype=np.float32).reshape(-1, 3)
+        self.size = len(lo)
+        self.leaf_size = leaf_size
+        self.order = np.arange(self.size)
+
+        centers = (lo + hi) / 2
+        start = [0]
+        count = [self.size]
+        left = [-1]
+        right = [-1]
+        depth = [0]
+        stack = [0] if self.size > leaf_size else []
+        while len(stack) > 0:
+            node = stack.pop()
+            begin, end = start[node], start[node] + count[node]
+            primitives = self.order[begin:end]
+            points = centers[primitives]
+            axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+            mid = (end - begin) // 2
+            self.order[begin:end] = primitives[
+                np.argpartition(points[:, axis], mid, kind="introselect")
+            ]
+            for child_begin, child_end in ((begin, begin + mid), (begin + mid, end)):
+                child = len(start)
+                start.append(child_begin)
+                count.append(child_end - child_begin)
+                left.append(-1)
+                right.append(-1)
+                depth.append(depth[node] + 1)
+                if child_end - child_begin > leaf_size:
+                    stack.append(child)
+            left[node] = len(start) - 2
+            right[node] = len(start) - 1
+
+        self.start = np.array(start, dtype=np.intp)
+        self.count = np.array(count, dtype=np.intp)
+        self.left = np.array(left, dtype=np.intp)
+        self.right = np.array(right, dtype=np.intp)
+        depths = np.array(depth)
+        self.__leaves = np.nonzero(self.left < 0)[0]
+        self.__leaves = self.__leaves[np.argsort(self.start[self.__leaves])]
+        # Internal nodes from the deepest level up, for refits
+        internal = np.nonzero(self.left >= 0)[0]
+        self.__levels = [
+            internal[depths[internal] == level]
+            for level in range(int(depths.max()) - 1, -1, -1)
+        ]
+        self.lo = np.zeros((len(start), 3), dtype=np.float32)
+        self.hi = np.zeros((len(start), 3), dtype=np.float32)
+        self.refit(lo, hi)
+
+    def refit(self, lo: npt.ArrayLike, hi: npt.ArrayLike):
+        # Updates the node bounds for moved primitives, the tree topology is
+        # kept, so queries stay correct but may get slower if primitives moved
+        # a lot since the build
+        if self.size == 0:
+            return
+        lo = np.asarray(lo, dtype=np.float32).reshape(-1, 3)[self.order]
+        hi = np.asarray(hi, dtype=np.float32).reshape(-1, 3)[self.order]
+        starts = self.start[self.__leaves]
+        self.lo[self.__leaves] = np.minimum.reduceat(lo, starts, axis=0)
+        self.hi[self.__leaves] = np.maximum.reduceat(hi, starts, axis=0)
+        for nodes in self.__levels:
+            self.lo[nodes] = np.minimum(
+                self.lo[self.left[nodes]], self.lo[self.right[nodes]]
+            )
+            self.hi[nodes] = np.maximum(
+                self.hi[self.left[nodes]], self.hi[self.right[nodes]]
+            )
+
+    def __traverse(self, test, count: int) -> tuple[npt.NDArray, npt.NDArray]:
+        # Breadth-first traversal of every query at once: `test(queries,
+        # nodes)` tells which (query, node) pairs overlap. Leaves yield all
+        # their primitives.
+        if self.size == 0 or count == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+        queries = np.arange(count)
+        nodes = np.zeros(count, dtype=np.intp)
+        found_queries = []
+        found_primitives = []
+        while len(queries) > 0:
+            hit = test(queries, nodes)
+            queries, nodes = queries[hit], nodes[hit]
+            leaf = self.left[nodes] < 0
+            leaf_queries, leaf_nodes = queries[leaf], nodes[leaf]
+            counts = self.count[leaf_nodes]
+            found_queries.append(np.repeat(leaf_queries, counts))
+            found_primitives.append(
+                self.order[expand_ranges(self.start[leaf_nodes], counts)]
+            )
+            queries, nodes = queries[~leaf], nodes[~leaf]
+            queries = np.concatenate([queries, queries])
+            nodes = np.concatenate([self.left[nodes], self.right[nodes]])
+        return np.concatenate(found_queries), np.concatenate(found_primitives)
+
+    def overlap_aabb(
+        self, lo: npt.ArrayLike, hi: npt.ArrayLike
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Candidate pairs of (query, primitive): every primitive of a leaf
+        # whose box overlaps the query, a superset of the primitives that do.
+        # Callers test the candidates exactly.
+        lo = np.asarray(lo, dtype=np.float32).reshape(-1, 3)
+        hi = np.asarray(hi, dtype=np.float32).reshape(-1, 3)
+
+        def test(queries, nodes):
+            return np.all(
+                (self.lo[nodes] <= hi[queries]) & (self.hi[nodes] >= lo[queries]),
+                axis=1,
+            )
+
+        return self.__traverse(test, len(lo))
+
+    def overlap_ray(
+        self,
+        origins: npt.ArrayLike,
+        directions: npt.ArrayLike,
+        max_distance: npt.ArrayLike = np.inf,
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Candidate pairs of (ray, primitive): every primitive of a leaf whose
+        # box is crossed by the ray, a superset of the primitives that are.
+        # Callers test the candidates exactly.
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        max_distance = np.broadcast_to(
+            np.asarray(max_distance, dtype=np.float32), (len(origins),)
+        )
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / directions
+
+        def test(rays, nodes):
+            hit, _ = ray_aabb(
+                origins[rays],
+                inverse[rays],
+                self.lo[nodes],
+                self.hi[nodes],
+                max_distance[rays],
+            )
+            return hit
+
+        return self.__traverse(test, len(origins))
@@ -0,0 +1,845 @@
+import re
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import numpy.typing as npt
+import pygfx as gfx
+import wgpu
+
+from wgut.core import (
+    create_buffer,
+    create_bind_group_layout,
+    create_command_encoder,
+    create_compute_pipeline,
+    create_pipeline_layout,
+    create_shader_module,
+    get_device,
+    read_buffer,
+    submit_command,
+    timestamp_writes,
+    write_buffer,
+)
+
+WORKGROUP_SIZE = 256
+MAX_WORKGROUPS_PER_DIMENSION = 65535
+# Storage buffers available to an elementwise kernel, one is the output
+MAX_INPUTS = 7
+
+_WGSL_TYPES = {
+    np.dtype(np.float32): "f32",
+    np.dtype(np.int32): "i32",
+    np.dtype(np.uint32): "u32",
+}
+
+_VARIABLES = ("x", "y", "z")
+
+_COMBINE = {
+    "+": "a + b",
+    "*": "a * b",
+    "min": "min(a, b)",
+    "max": "max(a, b)",
+}
+
+_IDENTITY = {
+    ("+", "f32"): "0.0",
+    ("+", "i32"): "0",
+    ("+", "u32"): "0u",
+    ("*", "f32"): "1.0",
+    ("*", "i32"): "1",
+    ("*", "u32"): "1u",
+    ("min", "f32"): "3.40282347e+38",
+    ("min", "i32"): "2147483647",
+    ("min", "u32"): "4294967295u",
+    ("max", "f32"): "-3.40282347e+38",
+    ("max", "i32"): "i32(-2147483647 - 1)",
+    ("max", "u32"): "0u",
+}
+
+KERNEL_HEADER = """
+struct Params {
+    n: u32,
+    stride: u32,
+    shift: u32,
+    blocks: u32,
+}
+
+@group(0) @binding(0) var<uniform> params: Params;
+"""
+
+
+def _wgsl_type(dtype: npt.DTypeLike) -> str:
+    dtype = np.dtype(dtype)
+    if dtype not in _WGSL_TYPES:
+        raise TypeError(f"Unsupported dtype {dtype} (use float32, int32 or uint32)")
+    return _WGSL_TYPES[dtype]
+
+
+def _to_supported_dtype(data: npt.NDArray) -> npt.NDArray:
+    if data.dtype == np.bool_:
+        return data.astype(np.uint32)
+    if data.dtype.kind == "f" and data.dtype != np.float32:
+        return data.astype(np.float32)
+    if data.dtype.kind == "i" and data.dtype != np.int32:
+        return data.astype(np.int32)
+    if data.dtype.kind == "u" and data.dtype != np.uint32:
+        return data.astype(np.uint32)
+    return data
+
+
+def _create_storage_buffer(nbytes: int) -> wgpu.GPUBuffer:
+    return create_buffer(
+        size=max(nbytes, 4),
+        usage=wgpu.BufferUsage.STORAGE  # type: ignore
+        | wgpu.BufferUsage.COPY_SRC
+        | wgpu.BufferUsage.COPY_DST,
+    )
+
+
+def _grid(n: int) -> tuple[int, int, int]:
+    groups = max(1, (n + WORKGROUP_SIZE - 1) // WORKGROUP_SIZE)
+    x = min(groups, MAX_WORKGROUPS_PER_DIMENSION)
+    y = (groups + x - 1) // x
+    return x, y, x * WORKGROUP_SIZE
+
+
+_PARAMS_BUFFERS: OrderedDict[tuple[int, int, int, int], wgpu.GPUBuffer] = OrderedDict()
+MAX_PARAMS_BUFFERS = 256
+
+
+def _params_buffer(n: int, stride: int, shift=0, blocks=0) -> wgpu.GPUBuffer:
+    # Keyed by content: queue writes land before the whole command buffer
+    # runs, so one mutable buffer per kernel would give every dispatch of an
+    # encoder the last params. Steady workloads allocate nothing.
+    key = (n, stride, shift, blocks)
+    buffer = _PARAMS_BUFFERS.get(key)
+    if buffer is not None:
+        _PARAMS_BUFFERS.move_to_end(key)
+        return buffer
+    data = np.array(key, dtype=np.uint32)
+    buffer = create_buffer(
+        size=data.nbytes,
+        usage=wgpu.BufferUsage.UNIFORM | wgpu.BufferUsage.COPY_DST,  # type: ignore
+    )
+    write_buffer(buffer, data)
+    _PARAMS_BUFFERS[key] = buffer
+    if len(_PARAMS_BUFFERS) > MAX_PARAMS_BUFFERS:
+        _PARAMS_BUFFERS.popitem(last=False)
+    return buffer
+
+
+def _layout(writable: tuple[bool, ...]) -> wgpu.GPUBindGroupLayout:
+    entries = [
+        {
+            "binding": 0,
+            "visibility": wgpu.ShaderStage.COMPUTE,
+            "buffer": {"type": wgpu.BufferBindingType.uniform},
+        }
+    ]
+    for binding, write in enumerate(writable, start=1):
+        buffer_type = (
+            wgpu.BufferBindingType.storage
+            if write
+            else wgpu.BufferBindingType.read_only_storage
+        )
+        entries.append(
+            {
+                "binding": binding,
+                "visibility": wgpu.ShaderStage.COMPUTE,
+                "buffer": {"type": buffer_type},
+            }
+        )
+    return create_bind_group_layout(entries)
+
+
+@lru_cache(maxsize=256)
+def _kernel(
+    source: str, writable: tuple[bool, ...]
+) -> tuple[wgpu.GPUComputePipeline, wgpu.GPUBindGroupLayout]:
+    layout = _layout(writable)
+    pipeline = create_compute_pipeline(
+        layout=create_pipeline_layout([layout]),
+        compute={"module": create_shader_module(source), "entry_point": "main"},
+    )
+    return pipeline, layout
+
+
+@lru_cache(maxsize=256)
+def _elementwise_source(expr: str, input_types: tuple[str, ...], output: str) -> str:
+    declarations = "".join(
+        f"@group(0) @binding({2 + index}) var<storage, read> in{index}: array<{ty}>;\n"
+        for index, ty in enumerate(input_types)
+    )
+    loads = "".join(
+        f"    let v{index} = in{index}[i];\n" for index in range(len(input_types))
+    )
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> out: array<{output}>;
+{declarations}
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(@builtin(global_invocation_id) id: vec3<u32>) {{
+    let i = id.x + id.y * params.stride;
+    if (i >= params.n) {{
+        return;
+    }}
+{loads}    out[i] = {output}({expr});
+}}
+"""
+
+
+@lru_cache(maxsize=64)
+def _reduce_source(op: str, ty: str) -> str:
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> out: array<{ty}>;
+@group(0) @binding(2) var<storage, read> values: array<{ty}>;
+
+var<workgroup> cache: array<{ty}, {WORKGROUP_SIZE}>;
+
+fn combine(a: {ty}, b: {ty}) -> {ty} {{
+    return {_COMBINE[op]};
+}}
+
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(
+    @builtin(global_invocation_id) id: vec3<u32>,
+    @builtin(local_invocation_id) lid: vec3<u32>,
+    @builtin(workgroup_id) wid: vec3<u32>,
+    @builtin(num_workgroups) groups: vec3<u32>,
+) {{
+    let i = id.x + id.y * params.stride;
+    var value = {_IDENTITY[(op, ty)]};
+    if (i < params.n) {{
+        value = values[i];
+    }}
+    cache[lid.x] = value;
+    workgroupBarrier();
+    for (var s = {WORKGROUP_SIZE // 2}u; s > 0u; s = s / 2u) {{
+        if (lid.x < s) {{
+            cache[lid.x] = combine(cache[lid.x], cache[lid.x + s]);
+        }}
+        workgroupBarrier();
+    }}
+    if (lid.x == 0u) {{
+        out[wid.x + wid.y * groups.x] = cache[0];
+    }}
+}}
+"""
+
+
+@lru_cache(maxsize=64)
+def _scan_source(op: str, ty: str, load: str = "values[i]") -> str:
+    # Inclusive scan of each workgroup block, the last value of each block is
+    # written to `sums` to be scanned by the next level. `load` can transform
+    # the elements as they are read.
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> out: array<{ty}>;
+@group(0) @binding(2) var<storage, read> values: array<{ty}>;
+@group(0) @binding(3) var<storage, read_write> sums: array<{ty}>;
+
+var<workgroup> cache: array<{ty}, {WORKGROUP_SIZE}>;
+
+fn combine(a: {ty}, b: {ty}) -> {ty} {{
+    return {_COMBINE[op]};
+}}
+
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(
+    @builtin(global_invocation_id) id: vec3<u32>,
+    @builtin(local_invocation_id) lid: vec3<u32>,
+) {{
+    let i = id.x + id.y * params.stride;
+    var value = {_IDENTITY[(op, ty)]};
+    if (i < params.n) {{
+        value = {load};
+    }}
+    cache[lid.x] = value;
+    workgroupBarrier();
+    for (var offset = 1u; offset < {WORKGROUP_SIZE}u; offset = offset * 2u) {{
+        var t = cache[lid.x];
+        if (lid.x >= offset) {{
+            t = combine(cache[lid.x - offset], t);
+        }}
+        workgroupBarrier();
+        cache[lid.x] = t;
+        workgroupBarrier();
+    }}
+    if (i < params.n) {{
+        out[i] = cache[lid.x];
+    }}
+    if (lid.x == {WORKGROUP_SIZE - 1}u) {{
+        sums[i / {WORKGROUP_SIZE}u] = cache[lid.x];
+    }}
+}}
+"""
+
+
+@lru_cache(maxsize=64)
+def _scan_add_source(op: str, ty: str) -> str:
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> out: array<{ty}>;
+@group(0) @binding(2) var<storage, read> sums: array<{ty}>;
+
+fn combine(a: {ty}, b: {ty}) -> {ty} {{
+    return {_COMBINE[op]};
+}}
+
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(@builtin(global_invocation_id) id: vec3<u32>) {{
+    let i = id.x + id.y * params.stride;
+    let block = i / {WORKGROUP_SIZE}u;
+    if (i >= params.n || block == 0u) {{
+        return;
+    }}
+    out[i] = combine(sums[block - 1u], out[i]);
+}}
+"""
+
+
+def dispatch(
+    encoder: wgpu.GPUCommandEncoder,
+    source: str,
+    n: int,
+    buffers: list[wgpu.GPUBuffer],
+    writable: tuple[bool, ...] | None = None,
+    shift=0,
+    label: str | None = None,
+):
+    # By default the first buffer is the output and the others are inputs
+    if writable is None:
+        writable = (True,) + (False,) * (len(buffers) - 1)
+    x, y, stride = _grid(n)
+    params = _params_buffer(n, stride, shift, x * y)
+    pipeline, layout = _kernel(source, writable)
+    entries = [{"binding": 0, "resource": {"buffer": params}}]
+    for binding, buffer in enumerate(buffers, start=1):
+        entries.append({"binding": binding, "resource": {"buffer": buffer}})
+    bind_group = get_device().create_bind_group(layout=layout, entries=entries)
+    # Labelled dispatches are timed on the GPU
+    compute_pass = encoder.begin_compute_pass(
+        timestamp_writes=None if label is None else timestamp_writes(label)
+    )
+    compute_pass.set_pipeline(pipeline)
+    compute_pass.set_bind_group(0, bind_group)
+    compute_pass.dispatch_workgroups(x, y)
+    compute_pass.end()
+
+
+def _literal(value, ty: str) -> str:
+    return f"{ty}({value})"
+
+
+class GPUArray:
+    def __init__(
+        self,
+        buffer: wgpu.GPUBuffer | None,
+        size: int,
+        dtype: npt.DTypeLike,
+        expr: str | None = None,
+        inputs: list["GPUArray"] | None = None,
+    ):
+        # Either holds a buffer, or an expression over the variables v0, v1, ...
+        # bound to materialized `inputs`, evaluated only when needed
+        self.__buffer = buffer
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self._expr = expr
+        self._inputs = inputs or []
+
+    @property
+    def shape(self) -> tuple[int]:
+        return (self.size,)
+
+    @property
+    def lazy(self) -> bool:
+        return self.__buffer is None
+
+    @property
+    def buffer(self) -> wgpu.GPUBuffer:
+        self.evaluate()
+        assert self.__buffer is not None
+        return self.__buffer
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        state = "lazy" if self.lazy else "evaluated"
+        return f"GPUArray(size={self.size}, dtype={self.dtype}, {state})"
+
+    def evaluate(self) -> "GPUArray":
+        if self.__buffer is not None:
+            return self
+        assert self._expr is not None
+        buffer = _create_storage_buffer(self.size * self.dtype.itemsize)
+        source = _elementwise_source(
+            self._expr,
+            tuple(_wgsl_type(input.dtype) for input in self._inputs),
+            _wgsl_type(self.dtype),
+        )
+        encoder = create_command_encoder()
+        dispatch(
+            encoder,
+            source,
+            self.size,
+            [buffer] + [input.buffer for input in self._inputs],
+        )
+        submit_command(encoder)
+        self.__buffer = buffer
+        self._expr = None
+        self._inputs = []
+        return self
+
+    def numpy(self) -> npt.NDArray:
+        data = read_buffer(self.buffer)
+        return np.frombuffer(data, dtype=self.dtype, count=self.size).copy()
+
+    def map(self, expr: str, *others: "GPUArray", dtype=None) -> "GPUArray":
+        return _elementwise(
+            expr, [self, *others], self.dtype if dtype is None else dtype
+        )
+
+    def reduce(self, op: str = "+"):
+        if op not in _COMBINE:
+            raise ValueError(f"Unknown reduce operation '{op}'")
+        ty = _wgsl_type(self.dtype)
+        source = _reduce_source(op, ty)
+        encoder = create_command_encoder()
+        # Each pass reduces a block per workgroup until one value remains
+        n = self.size
+        current = self.buffer
+        while True:
+            x, y, _ = _grid(n)
+            groups = x * y
+            out = _create_storage_buffer(groups * self.dtype.itemsize)
+            dispatch(encoder, source, n, [out, current])
+            current = out
+            if n <= WORKGROUP_SIZE:
+                break
+            n = groups
+        submit_command(encoder)
+        return np.frombuffer(read_buffer(current), dtype=self.dtype, count=1)[0]
+
+    def sum(self):
+        return self.reduce("+")
+
+    def min(self):
+        return self.reduce("min")
+
+    def max(self):
+        return self.reduce("max")
+
+    def scan(self, op: str = "+") -> "GPUArray":
+        if op not in _COMBINE:
+            raise ValueError(f"Unknown scan operation '{op}'")
+        encoder = create_command_encoder()
+        out = _scan(encoder, op, self.buffer, self.size, self.dtype)
+        submit_command(encoder)
+        return GPUArray(out, self.size, self.dtype)
+
+    def cumsum(self) -> "GPUArray":
+        return self.scan("+")
+
+    def __binary(self, other, op: str, swap=False) -> "GPUArray":
+        if isinstance(other, GPUArray):
+            expr = f"y {op} x" if swap else f"x {op} y"
+            return self.map(expr, other)
+        value = _literal(other, _wgsl_type(self.dtype))
+        expr = f"{value} {op} x" if swap else f"x {op} {value}"
+        return self.map(expr)
+
+    def __add__(self, other):
+        return self.__binary(other, "+")
+
+    def __radd__(self, other):
+        return self.__binary(other, "+", swap=True)
+
+    def __sub__(self, other):
+        return self.__binary(other, "-")
+
+    def __rsub__(self, other):
+        return self.__binary(other, "-", swap=True)
+
+    def __mul__(self, other):
+        return self.__binary(other, "*")
+
+    def __rmul__(self, other):
+        return self.__binary(other, "*", swap=True)
+
+    def __truediv__(self, other):
+        return self.__binary(other, "/")
+
+    def __rtruediv__(self, other):
+        return self.__binary(other, "/", swap=True)
+
+    def __neg__(self):
+        return self.map("-x")
+
+
+_SCRATCH_BUFFERS: dict[str, wgpu.GPUBuffer] = {}
+
+
+def _scratch_buffer(name: str, nbytes: int) -> wgpu.GPUBuffer:
+    # One buffer per name, reused from frame to frame and only replaced by a
+    # larger power of two, so varying sizes neither allocate every frame nor
+    # accumulate buffers
+    buffer = _SCRATCH_BUFFERS.get(name)
+    if buffer is None or buffer.size < nbytes:
+        buffer = _create_storage_buffer(max(16, 1 << (nbytes - 1).bit_length()))
+        _SCRATCH_BUFFERS[name] = buffer
+    return buffer
+
+
+def _scan(
+    encoder: wgpu.GPUCommandEncoder,
+    op: str,
+    values: wgpu.GPUBuffer,
+    n: int,
+    dtype: np.dtype,
+    temporary=False,
+    level=0,
+    load="values[i]",
+) -> wgpu.GPUBuffer:
+    # A temporary result lives in a scratch buffer, only valid until the next
+    # temporary scan is recorded
+    ty = _wgsl_type(dtype)
+    x, y, _ = _grid(n)
+    blocks = (n + WORKGROUP_SIZE - 1) // WORKGROUP_SIZE
+    sums = _scratch_buffer(f"scan{level}_sums", x * y * dtype.itemsize)
+    if temporary or level > 0:
+        out = _scratch_buffer(f"scan{level}_out", n * dtype.itemsize)
+    else:
+        out = _create_storage_buffer(n * dtype.itemsize)
+    dispatch(
+        encoder, _scan_source(op, ty, load), n, [out, values, sums], (True, False, True)
+    )
+    if blocks > 1:
+        # Scan the block totals, then add them to every following block
+        scanned_sums = _scan(encoder, op, sums, blocks, dtype, True, level + 1)
+        dispatch(encoder, _scan_add_source(op, ty), n, [out, scanned_sums])
+    return out
+
+
+def _elementwise(expr: str, args: list[GPUArray], dtype: npt.DTypeLike) -> GPUArray:
+    if len(args) > len(_VARIABLES):
+        raise ValueError(f"At most {len(_VARIABLES)} arrays can be combined")
+    size = args[0].size
+    if any(arg.size != size for arg in args):
+        raise ValueError("Arrays must have the same size")
+
+    # Lazy arguments are fused in the new expression instead of evaluated
+    inputs: list[GPUArray] = []
+    substitutions = {}
+    for name, arg in zip(_VARIABLES, args):
+        if arg.lazy:
+            arg_expr, arg_inputs = arg._expr, arg._inputs
+        else:
+            arg_expr, arg_inputs = "v0", [arg]
+        renames = {}
+        for index, input in enumerate(arg_inputs):
+            position = next(
+                (k for k, known in enumerate(inputs) if known is input), None
+            )
+            if position is None:
+                position = len(inputs)
+                inputs.append(input)
+            renames[f"v{index}"] = f"v{position}"
+        assert arg_expr is not None
+        arg_expr = re.sub(r"\bv\d+\b", lambda m: renames[m.group(0)], arg_expr)
+        substitutions[name] = f"{_wgsl_type(arg.dtype)}({arg_expr})"
+
+    if len(inputs) > MAX_INPUTS:
+        # Too many buffers for one kernel, evaluate the arguments first
+        return _elementwise(expr, [arg.evaluate() for arg in args], dtype)
+
+    fused = re.sub(
+        r"\b(" + "|".join(_VARIABLES[: len(args)]) + r")\b",
+        lambda m: substitutions[m.group(1)],
+        expr,
+    )
+    return GPUArray(None, size, dtype, fused, inputs)
+
+
+def array(data: npt.ArrayLike) -> GPUArray:
+    data = _to_supported_dtype(np.ascontiguousarray(data).ravel())
+    buffer = _create_storage_buffer(data.nbytes)
+    write_buffer(buffer, data)
+    return GPUArray(buffer, data.size, data.dtype)
+
+
+def empty(size: int, dtype: npt.DTypeLike = np.float32) -> GPUArray:
+    dtype = np.dtype(dtype)
+    return GPUArray(_create_storage_buffer(size * dtype.itemsize), size, dtype)
+
+
+def where(condition: GPUArray, x: GPUArray, y: GPUArray) -> GPUArray:
+    return _elementwise("select(z, y, x != 0)", [condition, x, y], x.dtype)
+
+
+RADIX_BITS = 4
+RADIX = 1 << RADIX_BITS
+
+# Maps raw 32 bits words to unsigned keys with the same ordering
+_SORT_KEYS = {
+    "u32": "return raw;",
+    "i32": "return raw ^ 0x80000000u;",
+    "f32": "return raw ^ select(0x80000000u, 0xffffffffu, (raw >> 31u) == 1u);",
+}
+
+
+def as_wgpu_buffer(buffer: wgpu.GPUBuffer | gfx.Buffer) -> wgpu.GPUBuffer:
+    if isinstance(buffer, gfx.Buffer):
+        # Creates the GPU buffer and sends pending data, like pygfx's
+        # ComputeShader does for its resources
+        gfx.renderers.wgpu.engine.update.ensure_wgpu_object(buffer)
+        gfx.renderers.wgpu.engine.update.update_resource(buffer)
+        return buffer._wgpu_object  # type: ignore
+    return buffer
+
+
+@lru_cache(maxsize=16)
+def _sort_key_source(key_type: str, descending: bool) -> str:
+    body = _SORT_KEYS[key_type]
+    if descending:
+        body = body.replace("return ", "return ~(").replace(";", ");")
+    return f"""
+fn sort_key(raw: u32) -> u32 {{
+    {body}
+}}
+
+fn digit(raw: u32) -> u32 {{
+    return (sort_key(raw) >> params.shift) & {RADIX - 1}u;
+}}
+"""
+
+
+@lru_cache(maxsize=16)
+def _histogram_source(key_type: str, descending: bool) -> str:
+    # Digit counts are stored digit major, so that one scan over the whole
+    # histogram gives the first output position of every (digit, block)
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> histogram: array<u32>;
+@group(0) @binding(2) var<storage, read> keys: array<u32>;
+
+var<workgroup> counts: array<atomic<u32>, {RADIX}>;
+{_sort_key_source(key_type, descending)}
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(
+    @builtin(global_invocation_id) id: vec3<u32>,
+    @builtin(local_invocation_id) lid: vec3<u32>,
+    @builtin(workgroup_id) wid: vec3<u32>,
+    @builtin(num_workgroups) groups: vec3<u32>,
+) {{
+    if (lid.x < {RADIX}u) {{
+        atomicStore(&counts[lid.x], 0u);
+    }}
+    workgroupBarrier();
+    let i = id.x + id.y * params.stride;
+    if (i < params.n) {{
+        atomicAdd(&counts[digit(keys[i])], 1u);
+    }}
+    workgroupBarrier();
+    if (lid.x < {RADIX}u) {{
+        let block = wid.x + wid.y * groups.x;
+        histogram[lid.x * params.blocks + block] = atomicLoad(&counts[lid.x]);
+    }}
+}}
+"""
+
+
+@lru_cache(maxsize=16)
+def _scatter_source(key_type: str, descending: bool, with_values: bool) -> str:
+    values = ""
+    copy_value = ""
+    if with_values:
+        values = """
+@group(0) @binding(5) var<storage, read_write> values_out: array<u32>;
+@group(0) @binding(6) var<storage, read> values_in: array<u32>;
+"""
+        copy_value = "values_out[destination] = values_in[i];"
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> keys_out: array<u32>;
+@group(0) @binding(2) var<storage, read> keys_in: array<u32>;
+@group(0) @binding(3) var<storage, read> offsets: array<u32>;
+@group(0) @binding(4) var<storage, read> histogram: array<u32>;
+{values}
+var<workgroup> digits: array<u32, {WORKGROUP_SIZE}>;
+{_sort_key_source(key_type, descending)}
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(
+    @builtin(global_invocation_id) id: vec3<u32>,
+    @builtin(local_invocation_id) lid: vec3<u32>,
+    @builtin(workgroup_id) wid: vec3<u32>,
+    @builtin(num_workgroups) groups: vec3<u32>,
+) {{
+    let i = id.x + id.y * params.stride;
+    var d = {RADIX}u;
+    if (i < params.n) {{
+        d = digit(keys_in[i]);
+    }}
+    digits[lid.x] = d;
+    workgroupBarrier();
+    if (i >= params.n) {{
+        return;
+    }}
+    // Rank among the previous elements of the block with the same digit,
+    // which keeps the sort stable
+    var rank = 0u;
+    for (var j = 0u; j < lid.x; j = j + 1u) {{
+        rank = rank + select(0u, 1u, digits[j] == d);
+    }}
+    let index = d * params.blocks + wid.x + wid.y * groups.x;
+    let destination = offsets[index] - histogram[index] + rank;
+    keys_out[destination] = keys_in[i];
+    {copy_value}
+}}
+"""
+
+
+def radix_sort(
+    keys: wgpu.GPUBuffer | gfx.Buffer,
+    values: wgpu.GPUBuffer | gfx.Buffer | None = None,
+    count: int | None = None,
+    key_type: str = "u32",
+    descending=False,
+    key_bits=32,
+    command_encoder: wgpu.GPUCommandEncoder | None = None,
+):
+    if key_type not in _SORT_KEYS:
+        raise ValueError(f"Unsupported key type '{key_type}'")
+    keys = as_wgpu_buffer(keys)
+    if values is not None:
+        values = as_wgpu_buffer(values)
+    if count is None:
+        count = keys.size // 4
+    if count < 2:
+        return
+
+    encoder = command_encoder
+    if encoder is None:
+        encoder = create_command_encoder()
+
+    x, y, _ = _grid(count)
+    blocks = x * y
+    histogram = _scratch_buffer("histogram", RADIX * blocks * 4)
+    keys_tmp = _scratch_buffer("keys", count * 4)
+    values_tmp = None
+    if values is not None:
+        values_tmp = _scratch_buffer("values", count * 4)
+
+    histogram_source = _histogram_source(key_type, descending)
+    scatter_source = _scatter_source(key_type, descending, values is not None)
+    passes = (key_bits + RADIX_BITS - 1) // RADIX_BITS
+    src_keys, dst_keys = keys, keys_tmp
+    src_values, dst_values = values, values_tmp
+    for index in range(passes):
+        shift = index * RADIX_BITS
+        dispatch(encoder, histogram_source, count, [histogram, src_keys], shift=shift)
+        offsets = _scan(
+            encoder, "+", histogram, RADIX * blocks, np.dtype(np.uint32), True
+        )
+        buffers = [dst_keys, src_keys, offsets, histogram]
+        writable = (True, False, False, False)
+        if values is not None:
+            buffers += [dst_values, src_values]
+            writable += (True, False)
+        dispatch(encoder, scatter_source, count, buffers, writable, shift=shift)
+        src_keys, dst_keys = dst_keys, src_keys
+        src_values, dst_values = dst_values, src_values
+
+    # With an odd number of passes the result ends up in the scratch buffers
+    if src_keys is not keys:
+        encoder.copy_buffer_to_buffer(src_keys, 0, keys, 0, count * 4)
+        if values is not None:
+            encoder.copy_buffer_to_buffer(src_values, 0, values, 0, count * 4)
+
+    if command_encoder is None:
+        submit_command(encoder)
+
+
+@lru_cache(maxsize=16)
+def _compact_source(element_words: int) -> str:
+    return f"""{KERNEL_HEADER}
+@group(0) @binding(1) var<storage, read_write> out: array<u32>;
+@group(0) @binding(2) var<storage, read_write> args: array<u32>;
+@group(0) @binding(3) var<storage, read> values: array<u32>;
+@group(0) @binding(4) var<storage, read> flags: array<u32>;
+@group(0) @binding(5) var<storage, read> positions: array<u32>;
+
+@compute @workgroup_size({WORKGROUP_SIZE})
+fn main(@builtin(global_invocation_id) id: vec3<u32>) {{
+    let i = id.x + id.y * params.stride;
+    if (i >= params.n) {{
+        return;
+    }}
+    if (flags[i] != 0u) {{
+        let destination = (positions[i] - 1u) * {element_words}u;
+        let source = i * {element_words}u;
+        for (var w = 0u; w < {element_words}u; w = w + 1u) {{
+            out[destination + w] = values[source + w];
+        }}
+    }}
+    if (i == params.n - 1u) {{
+        // Indirect dispatch arguments, followed by the number of elements
+        let count = positions[i];
+        args[0] = (count + {WORKGROUP_SIZE - 1}u) / {WORKGROUP_SIZE}u;
+        args[1] = 1u;
+        args[2] = 1u;
+        args[3] = count;
+    }}
+}}
+"""
+
+
+def create_indirect_buffer() -> wgpu.GPUBuffer:
+    return create_buffer(
+        size=16,
+        usage=wgpu.BufferUsage.STORAGE  # type: ignore
+        | wgpu.BufferUsage.INDIRECT
+        | wgpu.BufferUsage.COPY_SRC
+        | wgpu.BufferUsage.COPY_DST,
+    )
+
+
+def compact(
+    values: wgpu.GPUBuffer | gfx.Buffer,
+    flags: wgpu.GPUBuffer | gfx.Buffer,
+    out: wgpu.GPUBuffer | gfx.Buffer,
+    args: wgpu.GPUBuffer,
+    count: int | None = None,
+    element_size=4,
+    command_encoder: wgpu.GPUCommandEncoder | None = None,
+):
+    # Keeps the elements with a non zero flag, in order. `args` receives the
+    # workgroup count for dispatch_workgroups_indirect and the kept count.
+    assert element_size % 4 == 0, "Elements must be made of 32 bits words"
+    values = as_wgpu_buffer(values)
+    flags = as_wgpu_buffer(flags)
+    out = as_wgpu_buffer(out)
+    if count is None:
+        count = flags.size // 4
+    assert count > 0, "Nothing to compact"
+
+    encoder = command_encoder
+    if encoder is None:
+        encoder = create_command_encoder()
+
+    # Any non zero flag counts as one kept element
+    positions = _scan(
+        encoder,
+        "+",
+        flags,
+        count,
+        np.dtype(np.uint32),
+        True,
+        load="select(0u, 1u, values[i] != 0u)",
+    )
+    dispatch(
+        encoder,
+        _compact_source(element_size // 4),
+        count,
+        [out, args, values, flags, positions],
+        (True, True, False, False, False),
+    )
+
+    if command_encoder is None:
+        submit_command(encoder)
@@ -4,6 +4,17 @@ import pygfx as gfx
 import numpy.typing as npt
 import numpy as np
 from wgpu.gui.glfw import WgpuCanvas
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha256
+from functools import lru_cache
+import inspect
+import os
+import re
+from time import perf_counter
+from typing import Any, Callable
+from weakref import WeakSet, WeakValueDictionary, finalize
 
 
 _SHARED = None
@@ -12,7 +23,12 @@ _SHARED = None
 def get_shared():
     global _SHARED
     if _SHARED is None:
-        gfx.renderers.wgpu.select_power_preference("high-performance")
+        # pygfx is given the adapter so its features are probed on the one in
+        # use, GPU timings are only available when it supports them
+        adapter = wgpu.gpu.request_adapter_sync(power_preference="high-performance")
+        gfx.renderers.wgpu.select_adapter(adapter)
+        if "timestamp-query" in adapter.features:
+            gfx.renderers.wgpu.enable_wgpu_features("timestamp-query")
         _SHARED = gfx.renderers.wgpu.get_shared()
         assert _SHARED is not None
     return _SHARED
@@ -45,7 +61,132 @@ def get_device() -> wgpu.GPUDevice:
     return get_shared().device
 
 
+_GPU_MEMORY = {
+    "buffer_bytes": 0,
+    "buffer_count": 0,
+    "texture_bytes": 0,
+    "texture_count": 0,
+}
+
+
+def _release_gpu_memory(kind: str, nbytes: int):
+    _GPU_MEMORY[f"{kind}_bytes"] -= nbytes
+    _GPU_MEMORY[f"{kind}_count"] -= 1
+
+
+def track_gpu_memory(resource: Any, kind: str, nbytes: int) -> Any:
+    # Accounted until the resource is garbage collected, kind is "buffer" or
+    # "texture"
+    _GPU_MEMORY[f"{kind}_bytes"] += nbytes
+    _GPU_MEMORY[f"{kind}_count"] += 1
+    finalize(resource, _release_gpu_memory, kind, nbytes)
+    return resource
+
+
+def get_gpu_memory_stats() -> dict:
+    return dict(_GPU_MEMORY)
+
+
+def create_buffer(size: int, usage: int, label: str = "") -> wgpu.GPUBuffer:
+    buffer = get_device().create_buffer(size=size, usage=usage, label=label)  # type: ignore
+    return track_gpu_memory(buffer, "buffer", size)
+
+
+def _texture_nbytes(texture: gfx.Texture, generate_mipmaps: bool) -> int:
+    # A full mip chain adds about a third
+    return texture.nbytes * 4 // 3 if generate_mipmaps else texture.nbytes
+
+
+# Least recently used entries are dropped past the cap, objects still in use
+# stay alive through their users and are only compiled again if asked for
+_PIPELINE_CACHE: OrderedDict[tuple, Any] = OrderedDict()
+MAX_PIPELINE_CACHE = 1024
+_PIPELINE_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0, "compile_time": 0.0}
+
+
+def _cache_key(value) -> Any:
+    # GPU objects are kept in the key itself: they hash by identity and stay
+    # alive as long as the cached object that depends on them.
+    if isinstance(value, dict):
+        return tuple(sorted((k, _cache_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_key(v) for v in value)
+    return value
+
+
+def _cached(kind: str, key: Any, create):
+    key = (kind, key)
+    obj = _PIPELINE_CACHE.get(key)
+    if obj is not None:
+        _PIPELINE_CACHE_STATS["hits"] += 1
+        _PIPELINE_CACHE.move_to_end(key)
+        return obj
+    start = perf_counter()
+    obj = create()
+    _PIPELINE_CACHE_STATS["compile_time"] += perf_counter() - start
+    _PIPELINE_CACHE_STATS["misses"] += 1
+    _PIPELINE_CACHE[key] = obj
+    while len(_PIPELINE_CACHE) > MAX_PIPELINE_CACHE:
+        _PIPELINE_CACHE.popitem(last=False)
+        _PIPELINE_CACHE_STATS["evictions"] += 1
+    return obj
+
+
+def create_shader_module(code: str, label: str = "") -> wgpu.GPUShaderModule:
+    return _cached(
+        "shader_module",
+        (sha256(code.encode()).digest(), label),
+        lambda: get_device().create_shader_module(label=label, code=code),
+    )
+
+
+def create_bind_group_layout(entries: list[dict]) -> wgpu.GPUBindGroupLayout:
+    return _cached(
+        "bind_group_layout",
+        _cache_key(entries),
+        lambda: get_device().create_bind_group_layout(entries=entries),
+    )
+
+
+def create_pipeline_layout(
+    bind_group_layouts: list[wgpu.GPUBindGroupLayout],
+) -> wgpu.GPUPipelineLayout:
+    return _cached(
+        "pipeline_layout",
+        _cache_key(bind_group_layouts),
+        lambda: get_device().create_pipeline_layout(
+            bind_group_layouts=bind_group_layouts
+        ),
+    )
+
+
+def create_render_pipeline(**descriptor) -> wgpu.GPURenderPipeline:
+    return _cached(
+        "render_pipeline",
+        _cache_key(descriptor),
+        lambda: get_device().create_render_pipeline(**descriptor),
+    )
+
+
+def create_compute_pipeline(**descriptor) -> wgpu.GPUComputePipeline:
+    return _cached(
+        "compute_pipeline",
+        _cache_key(descriptor),
+        lambda: get_device().create_compute_pipeline(**descriptor),
+    )
+
+
+def get_pipeline_cache_stats() -> dict:
+    return {**_PIPELINE_CACHE_STATS, "size": len(_PIPELINE_CACHE)}
+
+
+def clear_pipeline_cache():
+    _PIPELINE_CACHE.clear()
+    _PIPELINE_CACHE_STATS.update(hits=0, misses=0, evictions=0, compile_time=0.0)
+
+
 def read_buffer(buffer: wgpu.GPUBuffer) -> memoryview:
+    flush_commands()
     return get_device().queue.read_buffer(buffer)
 
 
@@ -55,8 +196,10 @@ def read_pygfx_buffer(buffer: gfx.Buffer) -> memoryview:
 
 
 def write_buffer(buffer: wgpu.GPUBuffer, data: npt.NDArray | bytes, buffer_offset=0):
+    view = memoryview(data)
+    record_upload(view.nbytes)
     return get_device().queue.write_buffer(
-        buffer=buffer, data=memoryview(data), buffer_offset=buffer_offset
+        buffer=buffer, data=view, buffer_offset=buffer_offset
     )
 
 
@@ -67,47 +210,401 @@ def write_pygfx_buffer(
     write_buffer(wgpu_buffer, data, buffer_offset)
 
 
+_MIPMAP_SHADER = """
+@group(0) @binding(0) var src: texture_2d<f32>;
+@group(0) @binding(1) var src_sampler: sampler;
+
+struct VertexOutput {
+    @builtin(position) pos: vec4<f32>,
+    @location(0) uv: vec2<f32>,
+};
+
+@vertex
+fn vs_main(@builtin(vertex_index) index: u32) -> VertexOutput {
+    // One triangle covering the whole target
+    let uv = vec2<f32>(f32((index << 1u) & 2u), f32(index & 2u));
+    var out: VertexOutput;
+    out.pos = vec4<f32>(uv * vec2<f32>(2.0, -2.0) + vec2<f32>(-1.0, 1.0), 0.0, 1.0);
+    out.uv = uv;
+    return out;
+}
+
+@fragment
+fn fs_main(in: VertexOutput) -> @location(0) vec4<f32> {
+    return textureSample(src, src_sampler, in.uv);
+}
+"""
+
+_PENDING_MIPMAPS: list[wgpu.GPUTexture] = []
+_MIPMAP_SAMPLER: wgpu.GPUSampler | None = None
+
+
+def get_mip_level_count(size: tuple[int, ...]) -> int:
+    return max(size[0], size[1]).bit_length()
+
+
+def _get_mipmap_pipeline(
+    format: wgpu.TextureFormat,
+) -> tuple[wgpu.GPURenderPipeline, wgpu.GPUBindGroupLayout]:
+    bg_layout = create_bind_group_layout(
+        [
+            {
+                "binding": 0,
+                "visibility": wgpu.ShaderStage.FRAGMENT,
+                "texture": {},
+            },
+            {
+                "binding": 1,
+                "visibility": wgpu.ShaderStage.FRAGMENT,
+                "sampler": {},
+            },
+        ]
+    )
+    shader_module = create_shader_module(_MIPMAP_SHADER)
+    pipeline = create_render_pipeline(
+        layout=create_pipeline_layout([bg_layout]),
+        vertex={"module": shader_module, "entry_point": "vs_main", "buffers": []},
+        primitive={"topology": wgpu.PrimitiveTopology.triangle_list},
+        depth_stencil=None,
+        multisample=None,
+        fragment={
+            "module": shader_module,
+            "entry_point": "fs_main",
+            "targets": [{"format": format}],
+        },
+    )
+    return pipeline, bg_layout
+
+
+def generate_mipmaps(
+    texture: wgpu.GPUTexture,
+    command_encoder: wgpu.GPUCommandEncoder | None = None,
+):
+    global _MIPMAP_SAMPLER
+    if texture.mip_level_count < 2:
+        return
+
+    encoder = command_encoder
+    if encoder is None:
+        encoder = create_command_encoder()
+
+    if _MIPMAP_SAMPLER is None:
+        _MIPMAP_SAMPLER = get_device().create_sampler(
+            mag_filter=wgpu.FilterMode.linear,  # type: ignore
+            min_filter=wgpu.FilterMode.linear,  # type: ignore
+        )
+
+    pipeline, bg_layout = _get_mipmap_pipeline(texture.format)
+
+    def view(level: int, layer: int) -> wgpu.GPUTextureView:
+        return texture.create_view(
+            dimension=wgpu.TextureViewDimension.d2,  # type: ignore
+            base_mip_level=level,
+            mip_level_count=1,
+            base_array_layer=layer,
+            array_layer_count=1,
+        )
+
+    # Each level is rendered from the previous one with a linear filter
+    for layer in range(texture.size[2]):
+        for level in range(1, texture.mip_level_count):
+            bind_group = get_device().create_bind_group(
+                layout=bg_layout,
+                entries=[
+                    {"binding": 0, "resource": view(level - 1, layer)},
+                    {"binding": 1, "resource": _MIPMAP_SAMPLER},
+                ],
+            )
+            render_pass: wgpu.GPURenderPassEncoder = encoder.begin_render_pass(
+                color_attachments=[
+                    {
+                        "view": view(level, layer),
+                        "resolve_target": None,
+                        "clear_value": (0.0, 0.0, 0.0, 0.0),
+                        "load_op": wgpu.LoadOp.clear,
+                        "store_op": wgpu.StoreOp.store,
+                    }
+                ],
+            )
+            render_pass.set_pipeline(pipeline)
+            render_pass.set_bind_group(0, bind_group)
+            render_pass.draw(3)
+            render_pass.end()
+
+    if command_encoder is None:
+        submit_command(encoder)
+
+
+def queue_mipmaps(texture: wgpu.GPUTexture):
+    if texture not in _PENDING_MIPMAPS:
+        _PENDING_MIPMAPS.append(texture)
+
+
+def flush_mipmaps() -> int:
+    if len(_PENDING_MIPMAPS) == 0:
+        return 0
+    # All textures written since the last flush are recorded in the frame
+    # encoder
+    command_encoder = get_frame_encoder()
+    for texture in _PENDING_MIPMAPS:
+        generate_mipmaps(texture, command_encoder)
+    count = len(_PENDING_MIPMAPS)
+    _PENDING_MIPMAPS.clear()
+    return count
+
+
+_SCRATCH = np.empty(0, dtype=np.uint8)
+
+
+def _get_scratch(shape: tuple[int, ...], dtype: npt.DTypeLike) -> npt.NDArray:
+    # Reused between calls: queue.write_texture copies the data it is given
+    global _SCRATCH
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if _SCRATCH.nbytes < nbytes:
+        _SCRATCH = np.empty(nbytes, dtype=np.uint8)
+    return _SCRATCH[:nbytes].view(dtype).reshape(shape)
+
+
 def write_texture(
-    texture: wgpu.GPUTexture, image: img.Image | bytes | npt.NDArray, index=0
+    texture: wgpu.GPUTexture,
+    image: img.Image | bytes | npt.NDArray,
+    index=0,
+    mipmaps=False,
+    mip_level=0,
+    origin: tuple[int, int] = (0, 0),
+    size: tuple[int, int] | None = None,
+    layer_count=1,
 ):
-    size = texture.size[:2]
+    if size is None:
+        size = (
+            max(1, texture.size[0] >> mip_level) - origin[0],
+            max(1, texture.size[1] >> mip_level) - origin[1],
+        )
+
     if isinstance(image, img.Image):
-        if image.size != size:
+        if image.size != tuple(size):
             print(f"WARNING: Resize Image from {image.size} to {size}")
             image = image.resize(size)
         data = np.asarray(image)
         if image.mode == "RGB":
             # Add 'A' to get RGBA
-            data = np.dstack((data, np.full(data.shape[:-1], 255, dtype=np.uint8)))
+            rgba = _get_scratch((*data.shape[:-1], 4), np.uint8)
+            rgba[..., :3] = data
+            rgba[..., 3] = 255
+            data = rgba
     else:
         data = image
 
-    if not isinstance(data, bytes):
-        data = data.tobytes()
+    if isinstance(data, np.ndarray):
+        # A 4D array holds a range of layers
+        if data.ndim == 4:
+            layer_count = data.shape[0]
+        if not data.flags.c_contiguous:
+            contiguous = _get_scratch(data.shape, data.dtype)
+            np.copyto(contiguous, data)
+            data = contiguous
+
+    # Rows are uploaded tightly packed: unlike buffer to texture copies,
+    # queue.write_texture has no 256 bytes alignment constraint on bytes_per_row.
+    view = memoryview(data).cast("B")
+    bytes_per_row = view.nbytes // (layer_count * size[1])
+    record_upload(view.nbytes)
 
     get_device().queue.write_texture(
         {
             "texture": texture,
-            "mip_level": 0,
-            "origin": (0, 0, index),
+            "mip_level": mip_level,
+            "origin": (origin[0], origin[1], index),
         },
-        memoryview(data),
+        view,
         {
             "offset": 0,
-            "bytes_per_row": len(data) // size[1],
+            "bytes_per_row": bytes_per_row,
+            "rows_per_image": size[1],
         },
-        size,
+        (size[0], size[1], layer_count),
     )
 
+    if mipmaps and mip_level == 0:
+        queue_mipmaps(texture)
+
 
 def load_image(filename) -> img.Image:
     return img.open(filename)
 
 
-def create_texture(filename: str) -> gfx.Texture:
+_TEXTURE_CACHE: WeakValueDictionary[tuple, gfx.Texture] = WeakValueDictionary()
+# Most recently used textures are kept alive while they fit in the budget,
+# older ones only live as long as something else references them.
+_TEXTURE_CACHE_LRU: OrderedDict[tuple, gfx.Texture] = OrderedDict()
+_TEXTURE_CACHE_STATS = {"hits": 0, "misses": 0, "pinned_bytes": 0}
+_TEXTURE_CACHE_BUDGET = 512 * 1024 * 1024
+
+
+def _evict_textures():
+    while (
+        _TEXTURE_CACHE_STATS["pinned_bytes"] > _TEXTURE_CACHE_BUDGET
+        and len(_TEXTURE_CACHE_LRU) > 0
+    ):
+        key, texture = _TEXTURE_CACHE_LRU.popitem(last=False)
+        _TEXTURE_CACHE_STATS["pinned_bytes"] -= _cached_nbytes(key, texture)
+
+
+def _cached_nbytes(key: tuple, texture: gfx.Texture) -> int:
+    # Counted like the GPU memory tracker, the mip flag is part of the key
+    return _texture_nbytes(texture, key[2])
+
+
+def _cached_texture(
+    filename: str,
+    options: dict,
+    generate_mipmaps: bool,
+    create: Callable[[], gfx.Texture],
+) -> gfx.Texture:
+    path = os.path.abspath(filename)
+    key = (path, os.path.getmtime(path), generate_mipmaps, _cache_key(options))
+
+    texture = _TEXTURE_CACHE.get(key)
+    if texture is not None:
+        _TEXTURE_CACHE_STATS["hits"] += 1
+        if key in _TEXTURE_CACHE_LRU:
+            _TEXTURE_CACHE_LRU.move_to_end(key)
+            return texture
+    else:
+        _TEXTURE_CACHE_STATS["misses"] += 1
+        texture = create()
+        _TEXTURE_CACHE[key] = texture
+
+    _TEXTURE_CACHE_LRU[key] = texture
+    _TEXTURE_CACHE_STATS["pinned_bytes"] += _cached_nbytes(key, texture)
+    _evict_textures()
+    return texture
+
+
+def set_texture_cache_budget(budget_bytes: int):
+    global _TEXTURE_CACHE_BUDGET
+    _TEXTURE_CACHE_BUDGET = budget_bytes
+    _evict_textures()
+
+
+def get_texture_cache_stats() -> dict:
+    entries = list(_TEXTURE_CACHE.items())
+    return {
+        "hits": _TEXTURE_CACHE_STATS["hits"],
+        "misses": _TEXTURE_CACHE_STATS["misses"],
+        "size": len(entries),
+        "resident_bytes": sum(_cached_nbytes(*entry) for entry in entries),
+        "pinned_bytes": _TEXTURE_CACHE_STATS["pinned_bytes"],
+        "budget_bytes": _TEXTURE_CACHE_BUDGET,
+    }
+
+
+def clear_texture_cache():
+    _TEXTURE_CACHE.clear()
+    _TEXTURE_CACHE_LRU.clear()
+    _TEXTURE_CACHE_STATS["pinned_bytes"] = 0
+
+
+def _load_texture(filename: str, generate_mipmaps: bool) -> gfx.Texture:
     img = load_image(filename)
     data = np.asarray(img)
-    return gfx.Texture(data, dim=2)
+    texture = gfx.Texture(data, dim=2, generate_mipmaps=generate_mipmaps)
+    return track_gpu_memory(
+        texture, "texture", _texture_nbytes(texture, generate_mipmaps)
+    )
+
+
+def create_texture(filename: str, cached=True, generate_mipmaps=False) -> gfx.Texture:
+    # pygfx allocates the mip chain and generates it on the GPU, batched with
+    # the other pending uploads when the texture is synced.
+    if not cached:
+        return _load_texture(filename, generate_mipmaps)
+    return _cached_texture(
+        filename,
+        {"dim": 2, "loader": "sync"},
+        generate_mipmaps,
+        lambda: _load_texture(filename, generate_mipmaps),
+    )
+
+
+_DECODE_POOL: ThreadPoolExecutor | None = None
+_READY_UPLOADS: deque[tuple[gfx.Texture, Future]] = deque()
+_PENDING_UPLOADS = 0
+_CHANNELS = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+
+def _get_decode_pool() -> ThreadPoolExecutor:
+    global _DECODE_POOL
+    if _DECODE_POOL is None:
+        _DECODE_POOL = ThreadPoolExecutor(thread_name_prefix="wgut-decode")
+    return _DECODE_POOL
+
+
+def _decode_image(filename: str, mode: str) -> npt.NDArray:
+    image = load_image(filename)
+    if image.mode != mode:
+        image = image.convert(mode)
+    return np.asarray(image)
+
+
+def _load_texture_async(filename: str, generate_mipmaps: bool) -> gfx.Texture:
+    global _PENDING_UPLOADS
+    # Opening an image only reads its header, decoding happens in the pool
+    with load_image(filename) as image:
+        mode = image.mode if image.mode in _CHANNELS else "RGBA"
+        width, height = image.size
+    channels = _CHANNELS[mode]
+    shape = (height, width) if channels == 1 else (height, width, channels)
+
+    # The placeholder has the final size so set_data can swap the pixels in,
+    # pygfx textures cannot be resized. If it is drawn before decoding ends,
+    # its zeros are uploaded once at full size.
+    texture = gfx.Texture(
+        np.zeros(shape, dtype=np.uint8), dim=2, generate_mipmaps=generate_mipmaps
+    )
+    track_gpu_memory(texture, "texture", _texture_nbytes(texture, generate_mipmaps))
+    future = _get_decode_pool().submit(_decode_image, filename, mode)
+    future.add_done_callback(lambda f: _READY_UPLOADS.append((texture, f)))
+    _PENDING_UPLOADS += 1
+    return texture
+
+
+def create_texture_async(
+    filename: str, cached=True, generate_mipmaps=False
+) -> gfx.Texture:
+    # A texture still being decoded is a valid hit, its data will be swapped
+    # in by process_texture_uploads. Entries are not shared with
+    # create_texture, which keeps modes like "P" that are converted here.
+    if not cached:
+        return _load_texture_async(filename, generate_mipmaps)
+    return _cached_texture(
+        filename,
+        {"dim": 2, "loader": "async"},
+        generate_mipmaps,
+        lambda: _load_texture_async(filename, generate_mipmaps),
+    )
+
+
+def process_texture_uploads(byte_budget: int = 16 * 1024 * 1024) -> int:
+    global _PENDING_UPLOADS
+    uploaded = 0
+    # At least one texture is uploaded per call, even if it exceeds the budget
+    while len(_READY_UPLOADS) > 0 and uploaded < byte_budget:
+        texture, future = _READY_UPLOADS.popleft()
+        _PENDING_UPLOADS -= 1
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"WARNING: Texture decoding failed: {e}")
+            continue
+        texture.set_data(data)
+        uploaded += data.nbytes
+    record_upload(uploaded)
+    return uploaded
+
+
+def pending_texture_uploads() -> int:
+    return _PENDING_UPLOADS
 
 
 def load_file(filename):
@@ -117,8 +614,381 @@ def load_file(filename):
     return content
 
 
+class ShaderPreprocessorError(Exception):
+    def __init__(self, filename: str, line: int, message: str):
+        self.filename = filename
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f"{self.filename}:{self.line}: {self.message}"
+
+
+_DIRECTIVE = re.compile(r"^\s*#\s*(\w+)\s*(.*?)\s*$")
+_SHADER_CACHE: dict[tuple, tuple[list[tuple[str, float]], str]] = {}
+
+
+@lru_cache(maxsize=64)
+def _defines_pattern(names: tuple[str, ...]) -> re.Pattern:
+    return re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b")
+
+
+def _expand_defines(line: str, defines: dict[str, str]) -> str:
+    if len(defines) == 0:
+        return line
+    pattern = _defines_pattern(tuple(defines))
+    return pattern.sub(lambda m: defines[m.group(1)], line)
+
+
+def _preprocess(
+    source: str,
+    filename: str,
+    defines: dict[str, str],
+    included: list[str],
+) -> list[str]:
+    out = []
+    # Each entry tells if the enclosing block is active and if a branch was taken
+    stack: list[tuple[bool, bool]] = []
+    active = True
+    number = 0
+    for number, line in enumerate(source.splitlines(), start=1):
+        match = _DIRECTIVE.match(line)
+        if match is None:
+            if active:
+                out.append(_expand_defines(line, defines))
+            continue
+
+        directive, arg = match.groups()
+        if directive in ("ifdef", "ifndef"):
+            taken = (arg in defines) == (directive == "ifdef")
+            stack.append((active, taken))
+            active = active and taken
+        elif directive == "else":
+            if len(stack) == 0:
+                raise ShaderPreprocessorError(filename, number, "#else without #if")
+            parent, taken = stack[-1]
+            stack[-1] = (parent, True)
+            active = parent and not taken
+        elif directive == "endif":
+            if len(stack) == 0:
+                raise ShaderPreprocessorError(filename, number, "#endif without #if")
+            active, _ = stack.pop()
+        elif not active:
+            continue
+        elif directive == "define":
+            name, _, value = arg.partition(" ")
+            defines[name] = _expand_defines(value.strip(), defines)
+        elif directive == "undef":
+            defines.pop(arg, None)
+        elif directive == "include":
+            path = os.path.join(os.path.dirname(filename), arg.strip('"<>'))
+            path = os.path.abspath(path)
+            if not os.path.exists(path):
+                raise ShaderPreprocessorError(
+                    filename, number, f"Included file '{arg}' not found"
+                )
+            # Includes are expanded once, like '#pragma once'
+            if path not in included:
+                included.append(path)
+                out.extend(_preprocess(load_file(path), path, defines, included))
+        else:
+            raise ShaderPreprocessorError(
+                filename, number, f"Unknown directive '#{directive}'"
+            )
+
+    if len(stack) != 0:
+        raise ShaderPreprocessorError(filename, number, "Missing #endif")
+
+    return out
+
+
+def preprocess_shader(
+    source: str, defines: dict[str, Any] | None = None, filename: str = "<string>"
+) -> str:
+    defines = {name: str(value) for name, value in (defines or {}).items()}
+    return "\n".join(_preprocess(source, filename, defines, [])) + "\n"
+
+
+def _mtime(path: str) -> float | None:
+    # None for a deleted file, so the cache sees it as changed
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def load_shader(filename: str, defines: dict[str, Any] | None = None) -> str:
+    path = os.path.abspath(filename)
+    defines = {name: str(value) for name, value in (defines or {}).items()}
+    key = (path, tuple(sorted(defines.items())))
+
+    cached = _SHADER_CACHE.get(key)
+    if cached is not None:
+        files, source = cached
+        if all(_mtime(file) == mtime for file, mtime in files):
+            return source
+
+    included = [path]
+    source = "\n".join(_preprocess(load_file(path), path, defines, included)) + "\n"
+    _SHADER_CACHE[key] = ([(file, os.path.getmtime(file)) for file in included], source)
+    return source
+
+
+_FRAME_ENCODER: wgpu.GPUCommandEncoder | None = None
+_PENDING_COMMANDS: list[wgpu.GPUCommandBuffer] = []
+_COMMAND_STATS = {"submits": 0, "encoders": 0, "command_buffers": 0, "upload_bytes": 0}
+_LAST_COMMAND_STATS = dict(_COMMAND_STATS)
+
+
+def record_upload(nbytes: int):
+    # Bytes sent to the GPU this frame, reported with the command stats
+    _COMMAND_STATS["upload_bytes"] += nbytes
+
+
+def create_command_encoder(label: str = "") -> wgpu.GPUCommandEncoder:
+    _COMMAND_STATS["encoders"] += 1
+    return get_device().create_command_encoder(label=label)
+
+
+def get_frame_encoder() -> wgpu.GPUCommandEncoder:
+    # Shared by every system recording work this frame, it is finished and
+    # submitted with the other pending commands at the next flush
+    global _FRAME_ENCODER
+    if _FRAME_ENCODER is None:
+        _FRAME_ENCODER = create_command_encoder("wgut frame")
+    return _FRAME_ENCODER
+
+
+def _finish_frame_encoder():
+    global _FRAME_ENCODER
+    if _FRAME_ENCODER is not None:
+        _PENDING_COMMANDS.append(_FRAME_ENCODER.finish())
+        _FRAME_ENCODER = None
+
+
+def defer_command(command_encoder: wgpu.GPUCommandEncoder):
+    _finish_frame_encoder()
+    _PENDING_COMMANDS.append(command_encoder.finish())
+
+
+def _submit(command_buffers: list[wgpu.GPUCommandBuffer]):
+    get_device().queue.submit(command_buffers)
+    _COMMAND_STATS["submits"] += 1
+    _COMMAND_STATS["command_buffers"] += len(command_buffers)
+
+
+def flush_commands() -> int:
+    _finish_frame_encoder()
+    count = len(_PENDING_COMMANDS)
+    if count > 0:
+        _submit(list(_PENDING_COMMANDS))
+        _PENDING_COMMANDS.clear()
+    return count
+
+
+# Readbacks are mapped once their copy is submitted and read when the mapping
+# settles. A slot still mapped after this many frames is waited for, the GPU
+# is done with it by then.
+READBACK_FRAMES = 3
+
+_READBACKS: "WeakSet[AsyncReadback]" = WeakSet()
+
+
+class AsyncReadback:
+    def __init__(self, size: int, frames: int = READBACK_FRAMES, label: str = ""):
+        # A ring of MAP_READ buffers, a copy is skipped when its slot is still
+        # being read back
+        self.size = size
+        self.data: bytes | None = None
+        self.tag: Any = None
+        self.__buffers = [
+            create_buffer(
+                size=size,
+                usage=wgpu.BufferUsage.MAP_READ | wgpu.BufferUsage.COPY_DST,
+                label=label,
+            )
+            for _ in range(frames)
+        ]
+        # Per slot: the pending map, its age in frames, the copied size and
+        # tag. An age of -1 is a free slot, 0 a copy not submitted yet.
+        self.__mappings: list[Any] = [None] * frames
+        self.__ages = [-1] * frames
+        self.__sizes = [0] * frames
+        self.__tags: list[Any] = [None] * frames
+        self.__index = 0
+        _READBACKS.add(self)
+
+    def copy(
+        self,
+        source: wgpu.GPUBuffer,
+        offset: int = 0,
+        size: int | None = None,
+        tag: Any = None,
+        command_encoder: wgpu.GPUCommandEncoder | None = None,
+    ) -> bool:
+        # Recorded in the frame encoder by default, another encoder has to be
+        # submitted before end_frame. False when the copy was skipped.
+        index = self.__index
+        if self.__ages[index] >= 0:
+            return False
+        size = self.size if size is None else size
+        encoder = get_frame_encoder() if command_encoder is None else command_encoder
+        encoder.copy_buffer_to_buffer(source, offset, self.__buffers[index], 0, size)
+        self.__ages[index] = 0
+        self.__sizes[index] = size
+        self.__tags[index] = tag
+        self.__index = (index + 1) % len(self.__buffers)
+        return True
+
+    def _submitted(self):
+        # Called by end_frame once the frame is submitted, slots are read from
+        # the oldest so `data` ends up with the newest result
+        count = len(self.__buffers)
+        for step in range(count):
+            index = (self.__index + step) % count
+            age = self.__ages[index]
+            if age < 0:
+                continue
+            buffer = self.__buffers[index]
+            if age == 0:
+                mapping = buffer.map_async(wgpu.MapMode.READ)
+                # Before wgpu 0.24 map_async is a coroutine that needs an event
+                # loop, the slot is then mapped synchronously once old enough
+                if inspect.iscoroutine(mapping):
+                    mapping.close()
+                    mapping = None
+                self.__mappings[index] = mapping
+            elif buffer.map_state != "mapped":
+                if age < count - 1:
+                    self.__ages[index] = age + 1
+                    continue
+                mapping = self.__mappings[index]
+                if mapping is None:
+                    buffer.map_sync(wgpu.MapMode.READ)
+                else:
+                    mapping.sync_wait()
+            if buffer.map_state == "mapped":
+                self.data = bytes(buffer.read_mapped(0, self.__sizes[index]))
+                self.tag = self.__tags[index]
+                buffer.unmap()
+                self.__mappings[index] = None
+                self.__tags[index] = None
+                self.__ages[index] = -1
+            else:
+                self.__ages[index] = age + 1
+
+
+# Timestamps are read back asynchronously, a frame whose readback slot is still
+# busy is not timed
+MAX_TIMESTAMP_PASSES = 32
+
+
+@dataclass
+class _Timestamps:
+    query_set: wgpu.GPUQuerySet
+    resolve_buffer: wgpu.GPUBuffer
+    readback: AsyncReadback
+    names: list[str] = field(default_factory=list)
+
+
+_TIMESTAMPS: _Timestamps | None = None
+_TIMESTAMPS_CHECKED = False
+_GPU_TIMES: dict[str, float] = {}
+
+
+def gpu_timing_supported() -> bool:
+    return "timestamp-query" in get_device().features
+
+
+def _get_timestamps() -> _Timestamps | None:
+    # The query set and resolve buffer are reused every frame, the queue runs
+    # the resolve of a frame before the passes of the next one
+    global _TIMESTAMPS, _TIMESTAMPS_CHECKED
+    if not _TIMESTAMPS_CHECKED:
+        _TIMESTAMPS_CHECKED = True
+        if gpu_timing_supported():
+            count = 2 * MAX_TIMESTAMP_PASSES
+            _TIMESTAMPS = _Timestamps(
+                get_device().create_query_set(
+                    type=wgpu.QueryType.timestamp, count=count
+                ),
+                create_buffer(
+                    size=count * 8,
+                    usage=wgpu.BufferUsage.QUERY_RESOLVE | wgpu.BufferUsage.COPY_SRC,
+                ),
+                AsyncReadback(count * 8, label="timestamps"),
+            )
+    return _TIMESTAMPS
+
+
+def timestamp_writes(name: str) -> dict | None:
+    # Passed as `timestamp_writes` to begin_render_pass or begin_compute_pass,
+    # None when timings are not supported or too many passes are timed
+    timestamps = _get_timestamps()
+    if timestamps is None or len(timestamps.names) == MAX_TIMESTAMP_PASSES:
+        return None
+    index = 2 * len(timestamps.names)
+    timestamps.names.append(name)
+    return {
+        "query_set": timestamps.query_set,
+        "beginning_of_pass_write_index": index,
+        "end_of_pass_write_index": index + 1,
+    }
+
+
+def _resolve_timestamps():
+    timestamps = _TIMESTAMPS
+    if timestamps is None or len(timestamps.names) == 0:
+        return
+    count = 2 * len(timestamps.names)
+    encoder = get_frame_encoder()
+    encoder.resolve_query_set(
+        timestamps.query_set, 0, count, timestamps.resolve_buffer, 0
+    )
+    timestamps.readback.copy(
+        timestamps.resolve_buffer, size=count * 8, tag=timestamps.names
+    )
+    timestamps.names = []
+
+
+def _read_timestamps():
+    timestamps = _TIMESTAMPS
+    if timestamps is None or timestamps.readback.data is None:
+        return
+    data, names = timestamps.readback.data, timestamps.readback.tag
+    timestamps.readback.data = None
+    values = np.frombuffer(data, dtype=np.uint64).astype(np.int64)
+    durations = np.maximum(values[1::2] - values[0::2], 0) / 1e6
+    _GPU_TIMES.clear()
+    for name, duration in zip(names, durations):
+        _GPU_TIMES[name] = _GPU_TIMES.get(name, 0.0) + float(duration)
+
+
+def get_gpu_times() -> dict[str, float]:
+    # Milliseconds per timed pass, from the last frame read back
+    return dict(_GPU_TIMES)
+
+
+def end_frame():
+    _resolve_timestamps()
+    flush_commands()
+    for readback in list(_READBACKS):
+        readback._submitted()
+    _read_timestamps()
+    _LAST_COMMAND_STATS.update(_COMMAND_STATS)
+    for key in _COMMAND_STATS:
+        _COMMAND_STATS[key] = 0
+
+
+def get_command_stats() -> dict:
+    return dict(_LAST_COMMAND_STATS)
+
+
 def submit_command(command_encoder: wgpu.GPUCommandEncoder):
-    get_device().queue.submit([command_encoder.finish()])
+    # Pending commands go in the same submit, before this one
+    _finish_frame_encoder()
+    _submit([*_PENDING_COMMANDS, command_encoder.finish()])
+    _PENDING_COMMANDS.clear()
 
 
 def create_canvas(
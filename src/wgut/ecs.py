@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from wgut.tools import chrono
 from typing import (
     Any,
     Callable,
     Concatenate,
     Generator,
+    Iterable,
     Self,
     Sequence,
     Type,
@@ -46,6 +48,14 @@ class QueryOneWithNoResult(Exception):
         return f"Query with={self.types} and without={self.without} has no result"
 
 
+@dataclass
+class QueryStats:
+    calls: int = 0
+    # Entities read from the component tables, and the ones that matched
+    scanned: int = 0
+    matched: int = 0
+
+
 @dataclass
 class Group:
     ids: list[int]
@@ -61,6 +71,9 @@ class ECS:
         self.__components: dict[Type, dict[int, Any]] = {}
         self.__next_id = 0
         self.__systems: dict[str, list[System]] = {}
+        self.__system_names: dict[System, str] = {}
+        self.__query_names: dict[tuple, str] = {}
+        self.__query_stats: dict[str, QueryStats] = {}
 
     def spawn(self, components: list, label: str | None = None) -> int:
         id = self.__next_id
@@ -68,7 +81,8 @@ class ECS:
         if label is None:
             label = f"Entity {id}"
 
-        self.__add_component(id, Entity(id, label))
+        entity = Entity(id, label)
+        self.__add_component(id, entity)
 
         for component in components:
             assert type(component) is not Entity, (
@@ -76,11 +90,27 @@ class ECS:
             )
             self.__add_component(id, component)
 
+        # Listeners get the spawned components, reading them back from the
+        # ECS would scan every table
+        self.dispatch("entity_spawned", id, [entity, *components])
         return id
 
+    def entity_count(self) -> int:
+        return len(self.__components.get(Entity, {}))
+
+    def component_counts(self) -> dict[Type, int]:
+        return {ty: len(comps) for ty, comps in self.__components.items()}
+
+    def components(self, ty: Type) -> Iterable[Any]:
+        return self.__components.get(ty, {}).values()
+
+    def entities_with(self, ty: Type) -> Iterable[int]:
+        return self.__components.get(ty, {}).keys()
+
     def add_component(self, id: int | Entity, component) -> Self:
         id = self.__entity_exists(id)
         self.__add_component(id, component)
+        self.dispatch("component_added", id, type(component))
         return self
 
     def __entity_exists(self, id: int | Entity) -> int:
@@ -108,6 +138,7 @@ class ECS:
             return self
 
         self.__remove_component(id, ty)
+        self.dispatch("component_removed", id, ty)
         return self
 
     def __remove_component(self, id: int, ty: Type):
@@ -129,6 +160,8 @@ class ECS:
     def kill(self, id: int | Entity) -> Self:
         id = self.__entity_exists(id)
 
+        # Dispatched while the components can still be read
+        self.dispatch("entity_killed", id)
         for ty in list(self.__components):
             self.__remove_component(id, ty)
 
@@ -144,20 +177,24 @@ class ECS:
             returns_tuple = False
             types = [types]
 
-        ids = set(self.__components[Entity].keys())
-        for ty in types:
-            if ty in self.__components:
-                ids = ids & set(self.__components[ty].keys())
-            else:
-                ids = set()
-                break
-
         if not isinstance(without, Sequence):
             without = [without]
 
-        for ty in without:
-            if ty in self.__components:
-                ids = ids - set(self.__components[ty].keys())
+        if chrono.is_recording():
+            # Matching is timed in a zone named after the query, the results
+            # are produced lazily by the caller
+            name = self.query_name(types, without)
+            with chrono.zone(name):
+                ids = self.__match(types, without)
+            if chrono.is_profiling():
+                stats = self.__query_stats.get(name)
+                if stats is None:
+                    stats = self.__query_stats[name] = QueryStats()
+                stats.calls += 1
+                stats.scanned += self.__scanned(types, without)
+                stats.matched += len(ids)
+        else:
+            ids = self.__match(types, without)
 
         for id in ids:
             res = tuple(self.__components[ty][id] for ty in types)
@@ -166,6 +203,40 @@ class ECS:
             else:
                 yield res[0]
 
+    def __match(self, types: Sequence[Type], without: Sequence[Type]) -> set[int]:
+        ids = set(self.__components[Entity].keys())
+        for ty in types:
+            if ty in self.__components:
+                ids = ids & set(self.__components[ty].keys())
+            else:
+                return set()
+
+        for ty in without:
+            if ty in self.__components:
+                ids = ids - set(self.__components[ty].keys())
+        return ids
+
+    def __scanned(self, types: Sequence[Type], without: Sequence[Type]) -> int:
+        tables = [Entity, *types, *without]
+        return sum(len(self.__components.get(ty, ())) for ty in tables)
+
+    def query_name(self, types: Sequence[Type], without: Sequence[Type]) -> str:
+        key = (*types, None, *without)
+        name = self.__query_names.get(key)
+        if name is None:
+            name = "query " + ", ".join(ty.__name__ for ty in types)
+            if len(without) > 0:
+                name += " without " + ", ".join(ty.__name__ for ty in without)
+            self.__query_names[key] = name
+        return name
+
+    def query_stats(self) -> dict[str, QueryStats]:
+        # Only recorded while profiling, keyed by query name
+        return self.__query_stats
+
+    def reset_query_stats(self):
+        self.__query_stats.clear()
+
     def query_one(
         self, types: Sequence[Type] | Type, without: Sequence[type] | Type = []
     ) -> Any:
@@ -184,14 +255,33 @@ class ECS:
             self.__systems[event].remove(system)
         return self
 
+    def system_name(self, system: System) -> str:
+        name = self.__system_names.get(system)
+        if name is None:
+            name = getattr(system, "__qualname__", repr(system))
+            name = name.replace("<locals>.", "")
+            self.__system_names[system] = name
+        return name
+
     def dispatch(self, event: str, *args, **kwargs) -> Self:
         if event in self.__systems:
-            for system in self.__systems[event]:
-                system(self, *args, **kwargs)
+            if chrono.is_recording():
+                # Every system call is timed in a zone named after its event
+                with chrono.zone(event):
+                    for system in self.__systems[event]:
+                        with chrono.zone(self.system_name(system)):
+                            system(self, *args, **kwargs)
+            else:
+                for system in self.__systems[event]:
+                    system(self, *args, **kwargs)
         return self
 
     def do(self, system: System, *args, **kwargs) -> Self:
-        system(self, *args, **kwargs)
+        if chrono.is_recording():
+            with chrono.zone("do"), chrono.zone(self.system_name(system)):
+                system(self, *args, **kwargs)
+        else:
+            system(self, *args, **kwargs)
         return self
 
 
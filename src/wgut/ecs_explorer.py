@@ -1,21 +1,307 @@
+from bisect import bisect_left
+from typing import Type
+
 from imgui_bundle import imgui
-from wgut.ecs import ECS, Entity
+from wgut.ecs import ECS, Entity, EntityNotFound
+from wgut.tools import chrono
+
+
+Archetype = frozenset[Type]
+
+
+def archetype_name(archetype: Archetype) -> str:
+    names = sorted(ty.__name__ for ty in archetype if ty is not Entity)
+    return ", ".join(names) if names else "(empty)"
+
+
+class EntityIndex:
+    def __init__(self, ecs: ECS):
+        # Kept up to date from the ECS events instead of being rebuilt every
+        # frame, entity ids are allocated in increasing order
+        self.__ecs = ecs
+        self.ids: list[int] = sorted(ecs.entities_with(Entity))
+        self.labels: dict[int, str] = {
+            entity.id: str(entity) for entity in ecs.components(Entity)
+        }
+        self.version = 0
+
+        # The set of component types of every entity, and the entities of
+        # every such set
+        types: dict[int, set[Type]] = {id: set() for id in self.ids}
+        for ty in ecs.component_counts():
+            for id in ecs.entities_with(ty):
+                types[id].add(ty)
+        self.archetypes: dict[int, Archetype] = {}
+        self.members: dict[Archetype, set[int]] = {}
+        # Number of archetypes containing every type
+        self.type_archetypes: dict[Type, int] = {}
+        for id, archetype in types.items():
+            self.__move(id, frozenset(archetype))
+
+        # Sorted ids matching the current filter, only the ids touched by an
+        # event are inserted or removed
+        self.__filter_key: tuple[str, Type | None, Archetype | None] = ("", None, None)
+        self.__filtered: list[int] = list(self.ids)
+
+        ecs.on("entity_spawned", self.__spawned)
+        ecs.on("entity_killed", self.__killed)
+        ecs.on("component_added", self.__added)
+        ecs.on("component_removed", self.__removed)
+
+    def __move(self, id: int, archetype: Archetype | None):
+        previous = self.archetypes.pop(id, None)
+        if previous is not None:
+            members = self.members[previous]
+            members.discard(id)
+            if len(members) == 0:
+                del self.members[previous]
+                for ty in previous:
+                    self.type_archetypes[ty] -= 1
+        if archetype is not None:
+            self.archetypes[id] = archetype
+            members = self.members.get(archetype)
+            if members is None:
+                members = self.members[archetype] = set()
+                for ty in archetype:
+                    self.type_archetypes[ty] = self.type_archetypes.get(ty, 0) + 1
+            members.add(id)
+        self.version += 1
+
+    def __matches(self, id: int) -> bool:
+        text, ty, archetype = self.__filter_key
+        current = self.archetypes.get(id)
+        if current is None:
+            return False
+        if archetype is not None and current != archetype:
+            return False
+        if ty is not None and ty not in current:
+            return False
+        return not text or text in self.labels[id].lower()
+
+    def __update_filtered(self, id: int):
+        ids = self.__filtered
+        index = bisect_left(ids, id)
+        present = index < len(ids) and ids[index] == id
+        if self.__matches(id):
+            if not present:
+                ids.insert(index, id)
+        elif present:
+            ids.pop(index)
+
+    def __spawned(self, _ecs: ECS, id: int, components: list):
+        if len(self.ids) == 0 or self.ids[-1] < id:
+            self.ids.append(id)
+        else:
+            self.ids.insert(bisect_left(self.ids, id), id)
+        for component in components:
+            if isinstance(component, Entity):
+                self.labels[id] = str(component)
+        self.__move(id, frozenset(type(component) for component in components))
+        self.__update_filtered(id)
+
+    def __killed(self, _ecs: ECS, id: int):
+        index = bisect_left(self.ids, id)
+        if index < len(self.ids) and self.ids[index] == id:
+            self.ids.pop(index)
+        self.__move(id, None)
+        self.__update_filtered(id)
+        self.labels.pop(id, None)
+
+    def __added(self, _ecs: ECS, id: int, ty: Type):
+        self.__move(id, self.archetypes.get(id, frozenset()) | {ty})
+        self.__update_filtered(id)
+
+    def __removed(self, _ecs: ECS, id: int, ty: Type):
+        self.__move(id, self.archetypes.get(id, frozenset()) - {ty})
+        self.__update_filtered(id)
+
+    def filter(
+        self,
+        text: str = "",
+        ty: Type | None = None,
+        archetype: Archetype | None = None,
+    ) -> list[int]:
+        # Sorted ids of the matching entities, only recomputed when the filter
+        # itself changes
+        key = (text.lower(), ty, archetype)
+        if key != self.__filter_key:
+            self.__filter_key = key
+            ids = self.ids
+            if archetype is not None:
+                ids = sorted(self.members.get(archetype, ()))
+            elif ty is not None:
+                # The component table of the ECS is the type index
+                ids = sorted(self.__ecs.entities_with(ty))
+            if key[0]:
+                ids = [id for id in ids if key[0] in self.labels[id].lower()]
+            self.__filtered = list(ids)
+        return self.__filtered
+
+
+def component_gui(component):
+    if imgui.tree_node(f"{component}##{id(component)}"):
+        gui = getattr(component, "ecs_explorer_gui", None)
+        if gui is not None:
+            gui()
+        imgui.tree_pop()
+
+
+def types_table(ecs: ECS, index: EntityIndex) -> Type | None:
+    # Returns the type of the clicked row
+    clicked = None
+    total = max(len(index.ids), 1)
+    counts = sorted(ecs.component_counts().items(), key=lambda item: -item[1])
+    flags = imgui.TableFlags_.borders.value | imgui.TableFlags_.row_bg.value
+    if imgui.begin_table("##types", 4, flags):
+        imgui.table_setup_column("Type")
+        imgui.table_setup_column("Entities")
+        imgui.table_setup_column("Share")
+        imgui.table_setup_column("Archetypes")
+        imgui.table_headers_row()
+        for ty, count in counts:
+            imgui.table_next_row()
+            imgui.table_set_column_index(0)
+            span = imgui.SelectableFlags_.span_all_columns.value
+            if imgui.selectable(f"{ty.__name__}##type", False, span)[0]:
+                clicked = ty
+            imgui.table_set_column_index(1)
+            imgui.text(str(count))
+            imgui.table_set_column_index(2)
+            imgui.text(f"{count / total * 100:.1f}%")
+            imgui.table_set_column_index(3)
+            imgui.text(str(index.type_archetypes.get(ty, 0)))
+        imgui.end_table()
+    return clicked
+
+
+def archetypes_table(index: EntityIndex) -> Archetype | None:
+    # Returns the archetype of the clicked row
+    clicked = None
+    total = max(len(index.ids), 1)
+    rows = sorted(index.members.items(), key=lambda item: -len(item[1]))
+    flags = imgui.TableFlags_.borders.value | imgui.TableFlags_.row_bg.value
+    if imgui.begin_table("##archetypes", 3, flags):
+        imgui.table_setup_column("Components")
+        imgui.table_setup_column("Entities")
+        imgui.table_setup_column("Share")
+        imgui.table_headers_row()
+        for row, (archetype, members) in enumerate(rows):
+            imgui.table_next_row()
+            imgui.table_set_column_index(0)
+            span = imgui.SelectableFlags_.span_all_columns.value
+            label = f"{archetype_name(archetype)}##archetype{row}"
+            if imgui.selectable(label, False, span)[0]:
+                clicked = archetype
+            imgui.table_set_column_index(1)
+            imgui.text(str(len(members)))
+            imgui.table_set_column_index(2)
+            imgui.text(f"{len(members) / total * 100:.1f}%")
+        imgui.end_table()
+    return clicked
+
+
+def queries_table(ecs: ECS):
+    # Matching time per call comes from the profiler zones of the queries,
+    # wherever they were run
+    if not chrono.is_profiling():
+        imgui.text("No query costs, enable profiling")
+        return
+    times: dict[str, tuple[float, int]] = {}
+    for path, zone in chrono.get_zones().items():
+        name = path.rsplit("/", 1)[-1]
+        total, calls = times.get(name, (0.0, 0))
+        times[name] = (total + zone.total, calls + zone.calls)
+
+    def time_per_call(name: str) -> float:
+        total, calls = times.get(name, (0.0, 0))
+        return total / calls if calls > 0 else 0.0
+
+    rows = sorted(ecs.query_stats().items(), key=lambda item: -time_per_call(item[0]))
+    flags = imgui.TableFlags_.borders.value | imgui.TableFlags_.row_bg.value
+    if imgui.begin_table("##queries", 5, flags):
+        imgui.table_setup_column("Query")
+        imgui.table_setup_column("Calls")
+        imgui.table_setup_column("Scanned/call")
+        imgui.table_setup_column("Matched/call")
+        imgui.table_setup_column("ms/call")
+        imgui.table_headers_row()
+        for name, stats in rows:
+            imgui.table_next_row()
+            imgui.table_set_column_index(0)
+            imgui.text(name.removeprefix("query "))
+            imgui.table_set_column_index(1)
+            imgui.text(str(stats.calls))
+            imgui.table_set_column_index(2)
+            imgui.text(f"{stats.scanned / stats.calls:.0f}")
+            imgui.table_set_column_index(3)
+            imgui.text(f"{stats.matched / stats.calls:.0f}")
+            imgui.table_set_column_index(4)
+            imgui.text(f"{time_per_call(name) * 1000:.3f}")
+        imgui.end_table()
 
 
 def ecs_explorer(ecs: ECS):
+    index = EntityIndex(ecs)
+    text = ""
+    type_filter: Type | None = None
+    archetype_filter: Archetype | None = None
+    selected: int | None = None
+
     def gui(ecs: ECS):
+        nonlocal text, type_filter, archetype_filter, selected
         imgui.begin("ECS Explorer", None)
-        for (entity,) in ecs.query([Entity]):
-            if imgui.tree_node(str(entity)):
-                components = tuple(ecs[entity].values())
-                for component in components:
-                    if isinstance(component, Entity):
-                        continue
-                    if imgui.tree_node(str(component)):
-                        if "ecs_explorer_gui" in dir(component):
-                            component.ecs_explorer_gui()  # type: ignore
-                        imgui.tree_pop()
-                imgui.tree_pop()
+
+        if imgui.collapsing_header("Component types"):
+            ty = types_table(ecs, index)
+            if ty is not None:
+                type_filter, archetype_filter = ty, None
+        if imgui.collapsing_header("Archetypes"):
+            archetype = archetypes_table(index)
+            if archetype is not None:
+                type_filter, archetype_filter = None, archetype
+        if imgui.collapsing_header("Queries"):
+            queries_table(ecs)
+
+        _, text = imgui.input_text("Filter", text)
+        types = sorted(ecs.component_counts(), key=lambda ty: ty.__name__)
+        if archetype_filter is not None:
+            preview = f"[{archetype_name(archetype_filter)}]"
+        else:
+            preview = "Any" if type_filter is None else type_filter.__name__
+        if imgui.begin_combo("Component", preview):
+            if imgui.selectable("Any", type_filter is None)[0]:
+                type_filter, archetype_filter = None, None
+            for ty in types:
+                if imgui.selectable(ty.__name__, ty is type_filter)[0]:
+                    type_filter, archetype_filter = ty, None
+            imgui.end_combo()
+
+        ids = index.filter(text, type_filter, archetype_filter)
+        imgui.text(f"{len(ids)} / {len(index.ids)} entities")
+
+        # Only the visible rows are built
+        imgui.begin_child("##entities", (0, 300))
+        clipper = imgui.ListClipper()
+        clipper.begin(len(ids))
+        while clipper.step():
+            for row in range(clipper.display_start, clipper.display_end):
+                id = ids[row]
+                if imgui.selectable(index.labels[id], id == selected)[0]:
+                    selected = id
+        clipper.end()
+        imgui.end_child()
+
+        if selected is not None:
+            try:
+                components = ecs[selected]
+            except EntityNotFound:
+                selected = None
+            else:
+                imgui.separator_text(str(components[Entity]))
+                for component in components.values():
+                    if not isinstance(component, Entity):
+                        component_gui(component)
+
         imgui.end()
 
     ecs.on("render_gui", gui)
@@ -0,0 +1,117 @@
+import sys
+import tracemalloc
+from itertools import islice
+from typing import Any
+
+import numpy as np
+from imgui_bundle import imgui
+
+from wgut.core import get_gpu_memory_stats, get_texture_cache_stats
+from wgut.ecs import ECS
+
+# Components measured per type to estimate the size of the others
+SIZE_SAMPLES = 8
+
+
+def estimate_size(obj: Any) -> int:
+    # The object, its attributes and the data of NumPy arrays it holds, shared
+    # objects are counted for every owner
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, "__dict__", None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes)
+        for value in attributes.values():
+            if isinstance(value, np.ndarray):
+                size += value.nbytes
+            else:
+                size += sys.getsizeof(value)
+    return size
+
+
+def component_stats(ecs: ECS) -> list[tuple[str, int, int]]:
+    rows = []
+    for ty, count in ecs.component_counts().items():
+        samples = list(islice(ecs.components(ty), SIZE_SAMPLES))
+        mean = sum(estimate_size(sample) for sample in samples) / len(samples)
+        rows.append((ty.__name__, count, int(mean * count)))
+    rows.sort(key=lambda row: -row[2])
+    return rows
+
+
+def top_allocators(count: int = 10) -> list[tuple[str, int, int]]:
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.statistics("lineno")[:count]
+    return [(str(stat.traceback), stat.size, stat.count) for stat in stats]
+
+
+def memory_monitor(ecs: ECS, interval: float = 1.0):
+    # Sizes are sampled every `interval` seconds, tracemalloc snapshots are
+    # only taken on demand since they can take longer than a frame
+    components: list[tuple[str, int, int]] = []
+    gpu_stats = get_gpu_memory_stats()
+    allocators: list[tuple[str, int, int]] = []
+    elapsed = interval
+
+    def update(ecs: ECS, delta_time: float):
+        nonlocal components, gpu_stats, elapsed
+        elapsed += delta_time
+        if elapsed >= interval:
+            elapsed = 0.0
+            components = component_stats(ecs)
+            gpu_stats = get_gpu_memory_stats()
+
+    def gui(_ecs: ECS):
+        nonlocal allocators
+        imgui.begin("Memory Monitor", None)
+        if imgui.collapsing_header("ECS components"):
+            total = sum(row[2] for row in components)
+            imgui.text(f"Estimated: {total / 2**20:.2f} MiB")
+            flags = imgui.TableFlags_.borders.value | imgui.TableFlags_.row_bg.value
+            if imgui.begin_table("##components", 3, flags):
+                imgui.table_setup_column("Type")
+                imgui.table_setup_column("Count")
+                imgui.table_setup_column("Estimated (KiB)")
+                imgui.table_headers_row()
+                for name, count, nbytes in components:
+                    imgui.table_next_row()
+                    imgui.table_set_column_index(0)
+                    imgui.text(name)
+                    imgui.table_set_column_index(1)
+                    imgui.text(str(count))
+                    imgui.table_set_column_index(2)
+                    imgui.text(f"{nbytes / 1024:.1f}")
+                imgui.end_table()
+        if imgui.collapsing_header("GPU resources"):
+            imgui.text(
+                f"Buffers: {gpu_stats['buffer_count']}"
+                f" ({gpu_stats['buffer_bytes'] / 2**20:.2f} MiB)"
+            )
+            imgui.text(
+                f"Textures: {gpu_stats['texture_count']}"
+                f" ({gpu_stats['texture_bytes'] / 2**20:.2f} MiB)"
+            )
+            texture_stats = get_texture_cache_stats()
+            imgui.text(
+                f"Texture cache: {texture_stats['resident_bytes'] / 2**20:.2f} MiB"
+            )
+        if imgui.collapsing_header("Python heap"):
+            changed, tracing = imgui.checkbox("tracemalloc", tracemalloc.is_tracing())
+            if changed:
+                if tracing:
+                    tracemalloc.start()
+                else:
+                    tracemalloc.stop()
+                    allocators = []
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                imgui.text(
+                    f"Traced: {current / 2**20:.2f} MiB (peak {peak / 2**20:.2f} MiB)"
+                )
+                if imgui.button("Top allocators"):
+                    allocators = top_allocators()
+                for location, size, count in allocators:
+                    imgui.text(f"{size / 1024:10.1f} KiB {count:8d}  {location}")
+        imgui.end()
+
+    ecs.on("update", update)
+    ecs.on("render_gui", gui)
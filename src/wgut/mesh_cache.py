@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+from hashlib import sha256
+
+import numpy as np
+import numpy.typing as npt
+import pygfx as gfx
+import trimesh
+
+_ARRAYS = ("positions", "normals", "texcoords", "indices")
+
+
+def get_mesh_cache_dir() -> str:
+    default = os.path.join(os.path.expanduser("~"), ".cache", "wgut", "meshes")
+    return os.environ.get("WGUT_MESH_CACHE", default)
+
+
+def hash_file(filename: str) -> str:
+    digest = sha256()
+    with open(filename, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_digest(filename: str, cache_dir: str) -> str:
+    # The content hash is remembered per source path with the size and mtime
+    # it was computed for, the file is only hashed again when they change
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    index = os.path.join(
+        cache_dir, "sources", sha256(path.encode()).hexdigest() + ".json"
+    )
+    try:
+        with open(index) as file:
+            entry = json.load(file)
+        if entry["stamp"] == stamp:
+            return entry["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hash_file(path)
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(index))
+    with os.fdopen(fd, "w") as file:
+        json.dump({"stamp": stamp, "digest": digest}, file)
+    os.replace(tmp, index)
+    return digest
+
+
+def _convert_mesh(filename: str, directory: str):
+    mesh = trimesh.load(filename, force="mesh", process=False)
+    arrays = {
+        "positions": np.asarray(mesh.vertices, dtype=np.float32),
+        "normals": np.asarray(mesh.vertex_normals, dtype=np.float32),
+        "indices": np.asarray(mesh.faces, dtype=np.uint32),
+    }
+    uv = getattr(mesh.visual, "uv", None)
+    if uv is not None:
+        arrays["texcoords"] = np.asarray(uv, dtype=np.float32)
+
+    # Written in a temporary directory, then moved, so a crash or a concurrent
+    # process never sees a partial cache entry
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+        os.replace(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+def load_mesh_arrays(
+    filename: str, cache_dir: str | None = None
+) -> dict[str, npt.NDArray]:
+    if cache_dir is None:
+        cache_dir = get_mesh_cache_dir()
+    directory = os.path.join(cache_dir, _source_digest(filename, cache_dir))
+    if not os.path.isdir(directory):
+        _convert_mesh(filename, directory)
+
+    arrays = {}
+    for name in _ARRAYS:
+        path = os.path.join(directory, name + ".npy")
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode="r")
+    return arrays
+
+
+def load_mesh_geometry(filename: str, cache_dir: str | None = None) -> gfx.Geometry:
+    # Memory-mapped arrays are handed to pygfx as is, pages are only read
+    # when the buffers are uploaded
+    return gfx.Geometry(**load_mesh_arrays(filename, cache_dir))
+
+
+def load_cached_mesh(
+    filename: str,
+    material: gfx.Material | None = None,
+    cache_dir: str | None = None,
+) -> gfx.Mesh:
+    if material is None:
+        material = gfx.MeshStandardMaterial()
+    return gfx.Mesh(load_mesh_geometry(filename, cache_dir), material)
@@ -0,0 +1,246 @@
+import os
+from collections import deque
+
+import numpy as np
+import wgpu
+from imgui_bundle import imgui
+from pygfx import (
+    Geometry,
+    InstancedMesh,
+    Material,
+    MeshBasicMaterial,
+    icosahedron_geometry,
+)
+
+from wgut.compute import (
+    KERNEL_HEADER,
+    WORKGROUP_SIZE,
+    as_wgpu_buffer,
+    compact,
+    create_indirect_buffer,
+    dispatch,
+)
+from wgut.core import (
+    AsyncReadback,
+    create_buffer,
+    create_command_encoder,
+    get_frame_encoder,
+    load_shader,
+    submit_command,
+    write_buffer,
+)
+from wgut.ecs import ECS
+
+PARTICLE_SIZE = 32
+SHADER_PATH = os.path.join(os.path.dirname(__file__), "particles.wgsl")
+
+
+def _storage_buffer(nbytes: int, usage=0) -> wgpu.GPUBuffer:
+    return create_buffer(
+        size=nbytes,
+        usage=wgpu.BufferUsage.STORAGE  # type: ignore
+        | wgpu.BufferUsage.COPY_SRC
+        | wgpu.BufferUsage.COPY_DST
+        | usage,
+    )
+
+
+class ParticleEmitter:
+    def __init__(
+        self,
+        capacity: int,
+        rate: float = 1000.0,
+        lifetime: float = 2.0,
+        speed: float = 1.0,
+        spread: float = 0.3,
+        size: float = 0.02,
+        origin: tuple[float, float, float] = (0.0, 0.0, 0.0),
+        direction: tuple[float, float, float] = (0.0, 1.0, 0.0),
+        gravity: tuple[float, float, float] = (0.0, -1.0, 0.0),
+        initial_count: int = 0,
+        geometry: Geometry | None = None,
+        material: Material | None = None,
+    ):
+        self.capacity = capacity
+        self.rate = rate
+        self.lifetime = lifetime
+        self.speed = speed
+        self.spread = spread
+        self.size = size
+        self.origin = origin
+        self.direction = direction
+        self.gravity = gravity
+        self.__emit_accumulator = 0.0
+        self.__frame = 0
+
+        if geometry is None:
+            geometry = icosahedron_geometry(1.0, 1)
+        if material is None:
+            material = MeshBasicMaterial(color=(1.0, 0.3, 0.0))
+        self.mesh = InstancedMesh(geometry, material, capacity)
+        self.mesh.instance_buffer._wgpu_usage |= wgpu.BufferUsage.STORAGE  # type: ignore
+
+        self.__particles = _storage_buffer(capacity * PARTICLE_SIZE)
+        self.__compacted = _storage_buffer(capacity * PARTICLE_SIZE)
+        self.__flags = _storage_buffer(capacity * 4)
+        self.__settings = _storage_buffer(80)
+        self.__args = create_indirect_buffer()
+        # pygfx draws the instance range on its own, the alive count is read
+        # back asynchronously to size it. Particles emitted since the count
+        # was copied are drawn too, dead slots in the range are null matrices.
+        self.__alive_readback = AsyncReadback(16, label="particles alive")
+        self.__emitted: deque[tuple[int, int]] = deque()
+        self.__alive = min(initial_count, capacity)
+
+        defines = {"WORKGROUP_SIZE": WORKGROUP_SIZE}
+        self.__simulate_source = KERNEL_HEADER + load_shader(
+            SHADER_PATH, {**defines, "SIMULATE": 1}
+        )
+        self.__instances_source = KERNEL_HEADER + load_shader(SHADER_PATH, defines)
+
+        self.__initialize(min(initial_count, capacity))
+
+    def __initialize(self, count: int):
+        particles = np.zeros((max(count, 1), 8), dtype=np.float32)
+        if count > 0:
+            rng = np.random.default_rng()
+            directions = np.asarray(self.direction, dtype=np.float32) + self.spread * (
+                rng.random((count, 3), dtype=np.float32) * 2 - 1
+            )
+            directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+            speeds = self.speed * (0.5 + 0.5 * rng.random((count, 1), dtype=np.float32))
+            particles[:, 0:3] = self.origin
+            particles[:, 3] = rng.random(count, dtype=np.float32) * self.lifetime
+            particles[:, 4:7] = directions * speeds
+            particles[:, 7] = self.lifetime * (
+                0.75 + 0.5 * rng.random(count, dtype=np.float32)
+            )
+            write_buffer(self.__particles, particles[:count])
+        write_buffer(self.__args, np.array([0, 1, 1, count], dtype=np.uint32))
+
+    def __write_settings(self, delta_time: float, emit: int):
+        settings = np.zeros(20, dtype=np.float32)
+        settings[0:3] = self.origin
+        settings[3] = delta_time
+        settings[4:7] = self.direction
+        settings[7] = self.spread
+        settings[8:11] = self.gravity
+        settings[12] = self.lifetime
+        settings[13] = self.speed
+        settings[14] = self.size
+        words = settings.view(np.uint32)
+        words[15] = emit
+        words[16] = self.__frame * 2654435761 % 2**32
+        write_buffer(self.__settings, settings)
+
+    def update(
+        self,
+        delta_time: float,
+        command_encoder: wgpu.GPUCommandEncoder | None = None,
+    ):
+        # Only the number of particles to emit is computed on the CPU
+        self.__emit_accumulator += self.rate * delta_time
+        emit = min(int(self.__emit_accumulator), self.capacity)
+        self.__emit_accumulator -= emit
+        self.__frame += 1
+        self.__write_settings(delta_time, emit)
+
+        data = self.__alive_readback.data
+        if data is not None:
+            self.__alive_readback.data = None
+            self.__alive = int(np.frombuffer(data, dtype=np.uint32)[3])
+            # Tagged with the frame the count was copied in
+            while self.__emitted and self.__emitted[0][0] <= self.__alive_readback.tag:
+                self.__emitted.popleft()
+        self.__emitted.append((self.__frame, emit))
+        emitted = sum(count for _, count in self.__emitted)
+        drawn = min(self.__alive + emitted, self.capacity)
+        self.mesh.instance_buffer.draw_range = (0, drawn)
+
+        encoder = command_encoder
+        if encoder is None:
+            encoder = create_command_encoder()
+
+        dispatch(
+            encoder,
+            self.__simulate_source,
+            self.capacity,
+            [self.__particles, self.__flags, self.__args, self.__settings],
+            (True, True, False, False),
+            label="particles simulate",
+        )
+        compact(
+            self.__particles,
+            self.__flags,
+            self.__compacted,
+            self.__args,
+            count=self.capacity,
+            element_size=PARTICLE_SIZE,
+            command_encoder=encoder,
+        )
+        # Only the drawn slots need their matrix
+        dispatch(
+            encoder,
+            self.__instances_source,
+            max(drawn, 1),
+            [
+                as_wgpu_buffer(self.mesh.instance_buffer),
+                self.__compacted,
+                self.__args,
+                self.__settings,
+            ],
+            (True, False, False, False),
+            label="particles instances",
+        )
+        self.__alive_readback.copy(
+            self.__args, tag=self.__frame, command_encoder=encoder
+        )
+        self.__particles, self.__compacted = self.__compacted, self.__particles
+
+        if command_encoder is None:
+            submit_command(encoder)
+
+    @property
+    def indirect_args(self) -> wgpu.GPUBuffer:
+        # Workgroups to dispatch over alive particles, then their count
+        return self.__args
+
+    @property
+    def alive_count(self) -> int:
+        # As last read back, a few frames old
+        return self.__alive
+
+    def __str__(self):
+        return f"ParticleEmitter ({self.capacity})"
+
+    def ecs_explorer_gui(self):
+        changed, val = imgui.input_float("rate", self.rate)
+        if changed:
+            self.rate = max(val, 0.0)
+        changed, val = imgui.input_float("lifetime", self.lifetime)
+        if changed:
+            self.lifetime = max(val, 0.0)
+        changed, val = imgui.input_float("speed", self.speed)
+        if changed:
+            self.speed = val
+        changed, val = imgui.input_float("spread", self.spread)
+        if changed:
+            self.spread = val
+        changed, val = imgui.input_float("size", self.size)
+        if changed:
+            self.size = val
+        imgui.text(f"alive: {self.alive_count}")
+
+
+def particle_system(ecs: ECS):
+    def update(ecs: ECS, delta_time: float):
+        emitters = list(ecs.query(ParticleEmitter))
+        if len(emitters) == 0:
+            return
+        # Every emitter is recorded in the frame encoder, submitted once with
+        # the rest of the frame
+        command_encoder = get_frame_encoder()
+        for emitter in emitters:
+            emitter.update(delta_time, command_encoder)
+
+    ecs.on("update", update)
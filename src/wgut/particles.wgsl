@@ -0,0 +1,114 @@
+struct Particle {
+    // w: age
+    position: vec4<f32>,
+    // w: lifetime
+    velocity: vec4<f32>,
+}
+
+struct Settings {
+    // w: delta time
+    origin: vec4<f32>,
+    // w: spread
+    direction: vec4<f32>,
+    gravity: vec4<f32>,
+    lifetime: f32,
+    speed: f32,
+    size: f32,
+    emit: u32,
+    seed: u32,
+}
+
+struct Instance {
+    matrix: mat4x4<f32>,
+    global_id: i32,
+    pad1: i32,
+    pad2: i32,
+    pad3: i32,
+}
+
+fn pcg(value: u32) -> u32 {
+    let state = value * 747796405u + 2891336453u;
+    let word = ((state >> ((state >> 28u) + 4u)) ^ state) * 277803737u;
+    return (word >> 22u) ^ word;
+}
+
+fn random(seed: ptr<function, u32>) -> f32 {
+    *seed = pcg(*seed);
+    return f32(*seed) / 4294967295.0;
+}
+
+#ifdef SIMULATE
+@group(0) @binding(1) var<storage, read_write> particles: array<Particle>;
+@group(0) @binding(2) var<storage, read_write> flags: array<u32>;
+@group(0) @binding(3) var<storage, read> args: array<u32>;
+@group(0) @binding(4) var<storage, read> settings: Settings;
+
+fn spawn(i: u32) -> Particle {
+    var seed = pcg(i ^ settings.seed);
+    let jitter = vec3<f32>(random(&seed), random(&seed), random(&seed)) * 2.0 - 1.0;
+    let direction = normalize(settings.direction.xyz + jitter * settings.direction.w);
+    let speed = settings.speed * (0.5 + 0.5 * random(&seed));
+    let lifetime = settings.lifetime * (0.75 + 0.5 * random(&seed));
+    var particle: Particle;
+    particle.position = vec4<f32>(settings.origin.xyz, 0.0);
+    particle.velocity = vec4<f32>(direction * speed, lifetime);
+    return particle;
+}
+
+@compute @workgroup_size(WORKGROUP_SIZE)
+fn main(@builtin(global_invocation_id) id: vec3<u32>) {
+    let i = id.x + id.y * params.stride;
+    if (i >= params.n) {
+        return;
+    }
+    // Alive particles are packed at the front by the previous compaction,
+    // new ones are emitted right after them
+    let count = args[3];
+    let dt = settings.origin.w;
+    if (i < count) {
+        var particle = particles[i];
+        particle.position.w = particle.position.w + dt;
+        if (particle.position.w >= particle.velocity.w) {
+            flags[i] = 0u;
+            return;
+        }
+        let velocity = particle.velocity.xyz + settings.gravity.xyz * dt;
+        particle.velocity = vec4<f32>(velocity, particle.velocity.w);
+        particle.position = vec4<f32>(particle.position.xyz + velocity * dt, particle.position.w);
+        particles[i] = particle;
+        flags[i] = 1u;
+    } else if (i < count + settings.emit) {
+        particles[i] = spawn(i);
+        flags[i] = 1u;
+    } else {
+        flags[i] = 0u;
+    }
+}
+#else
+@group(0) @binding(1) var<storage, read_write> instances: array<Instance>;
+@group(0) @binding(2) var<storage, read> particles: array<Particle>;
+@group(0) @binding(3) var<storage, read> args: array<u32>;
+@group(0) @binding(4) var<storage, read> settings: Settings;
+
+@compute @workgroup_size(WORKGROUP_SIZE)
+fn main(@builtin(global_invocation_id) id: vec3<u32>) {
+    let i = id.x + id.y * params.stride;
+    if (i >= params.n) {
+        return;
+    }
+    let count = args[3];
+    // Dead slots get a null matrix, their triangles are degenerate
+    var matrix = mat4x4<f32>();
+    if (i < count) {
+        let particle = particles[i];
+        let scale = settings.size * (1.0 - particle.position.w / particle.velocity.w);
+        matrix = mat4x4<f32>(
+            vec4<f32>(scale, 0.0, 0.0, 0.0),
+            vec4<f32>(0.0, scale, 0.0, 0.0),
+            vec4<f32>(0.0, 0.0, scale, 0.0),
+            vec4<f32>(particle.position.xyz, 1.0),
+        );
+    }
+    instances[i].matrix = matrix;
+}
+#endif
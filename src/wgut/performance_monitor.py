@@ -1,60 +1,297 @@
+import gc
+import os
+from collections import deque
+from datetime import datetime
+
 from imgui_bundle import imgui, implot
 from wgut.ecs import ECS
-import numpy as np
+
+from wgut.tools import chrono, trace
+from wgut.tools.ring_buffer import RingBuffer
 
 from wgut.window import Window
+from wgut.core import (
+    get_command_stats,
+    get_gpu_times,
+    gpu_timing_supported,
+    get_pipeline_cache_stats,
+    get_texture_cache_stats,
+)
+
+SYSTEM_COLUMNS = ("Zone", "Event", "Last (ms)", "Mean (ms)", "Max (ms)", "Calls")
+
+
+def system_rows() -> list[tuple]:
+    # One row per zone below an event, with per frame times
+    frames = max(chrono.get_frame_count(), 1)
+    rows = []
+    for path, stats in chrono.get_zones().items():
+        event, _, name = path.partition("/")
+        if name:
+            rows.append(
+                (
+                    name,
+                    event,
+                    stats.last * 1000,
+                    stats.total / frames * 1000,
+                    stats.max * 1000,
+                    stats.calls,
+                )
+            )
+    return rows
+
+
+def systems_table():
+    flags = (
+        imgui.TableFlags_.sortable.value
+        | imgui.TableFlags_.borders.value
+        | imgui.TableFlags_.row_bg.value
+        | imgui.TableFlags_.resizable.value
+        | imgui.TableFlags_.scroll_y.value
+    )
+    if not imgui.begin_table("##systems", len(SYSTEM_COLUMNS), flags, (0, 300)):
+        return
+    for index, column in enumerate(SYSTEM_COLUMNS):
+        column_flags = imgui.TableColumnFlags_.width_stretch.value if index == 0 else 0
+        if index == 2:
+            column_flags |= (
+                imgui.TableColumnFlags_.default_sort.value
+                | imgui.TableColumnFlags_.prefer_sort_descending.value
+            )
+        imgui.table_setup_column(column, column_flags)
+    imgui.table_setup_scroll_freeze(0, 1)
+    imgui.table_headers_row()
+
+    rows = system_rows()
+    sort_specs = imgui.table_get_sort_specs()
+    if sort_specs is not None and sort_specs.specs_count > 0:
+        spec = sort_specs.get_specs(0)
+        rows.sort(
+            key=lambda row: row[spec.column_index],
+            reverse=spec.get_sort_direction() == imgui.SortDirection.descending,
+        )
+
+    for row in rows:
+        imgui.table_next_row()
+        for index, value in enumerate(row):
+            imgui.table_set_column_index(index)
+            if isinstance(value, float):
+                imgui.text(f"{value:.3f}")
+            else:
+                imgui.text(str(value))
+    imgui.end_table()
+
+
+def time_plot(label: str, times: RingBuffer, limit: float = 0.025):
+    if implot.begin_plot(f"##{label}", (-1, 100)):
+        implot.setup_axes("##f", "##t", implot.AxisFlags_.auto_fit.value)
+        implot.setup_axes_limits(-times.length, 0, 0, limit)
+        implot.plot_line(f"##{label}(f)", times.xs(), times.values())
+        implot.end_plot()
+
+
+def time_stats(times: RingBuffer):
+    stats = times.stats()
+    imgui.text(
+        f"Mean: {stats['mean'] * 1000:.2f}ms"
+        f"  p50: {stats['p50'] * 1000:.2f}ms"
+        f"  p95: {stats['p95'] * 1000:.2f}ms"
+        f"  p99: {stats['p99'] * 1000:.2f}ms"
+        f"  Max: {stats['max'] * 1000:.2f}ms"
+    )
+
 
-frame_times = []
+# Frames needed before the rolling median is trusted
+HITCH_MIN_SAMPLES = 60
 
 
-def performance_monitor(ecs: ECS):
-    frame_times = [0.0] * 100
-    render_times = [0.0] * 100
-    update_times = [0.0] * 100
+def gc_collections() -> list[int]:
+    return [generation["collections"] for generation in gc.get_stats()]
+
+
+def hitch_snapshot(
+    ecs: ECS, window: Window, median: float, collections: list[int]
+) -> dict:
+    systems = {
+        path: stats.last * 1000
+        for path, stats in chrono.get_zones().items()
+        if stats.last > 0.0
+    }
+    command_stats = get_command_stats()
+    return {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "frame_time": window.last_frame_time,
+        "median": median,
+        "update_time": window.last_update_time,
+        "render_time": window.last_render_time,
+        "systems": dict(sorted(systems.items(), key=lambda item: -item[1])),
+        "gc_collections": collections,
+        "gc_pause": window.last_gc_time,
+        "gc_count": list(gc.get_count()),
+        "entities": ecs.entity_count(),
+        "upload_bytes": command_stats["upload_bytes"],
+        "submits": command_stats["submits"],
+    }
+
+
+def export_hitches(hitches, filename: str | None = None) -> str:
+    if filename is None:
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        filename = os.path.join(trace.get_trace_dir(), f"wgut-hitches-{now}.json")
+    trace.write_json(filename, list(hitches), indent=2)
+    return filename
+
+
+def hitch_gui(hitch: dict):
+    ratio = hitch["frame_time"] / hitch["median"]
+    label = f"{hitch['time']}: {hitch['frame_time'] * 1000:.1f}ms ({ratio:.1f}x)"
+    if imgui.tree_node(f"{label}##{hitch['time']}"):
+        imgui.text(f"Median: {hitch['median'] * 1000:.2f}ms")
+        imgui.text(f"Update: {hitch['update_time'] * 1000:.2f}ms")
+        imgui.text(f"Render: {hitch['render_time'] * 1000:.2f}ms")
+        imgui.text(f"Entities: {hitch['entities']}")
+        imgui.text(f"Uploads: {hitch['upload_bytes'] / 1024:.1f} KiB")
+        imgui.text(f"GC collections: {hitch['gc_collections']}")
+        imgui.text(f"GC pause: {hitch['gc_pause'] * 1000:.2f}ms")
+        if len(hitch["systems"]) == 0:
+            imgui.text("No system timings, enable profiling")
+        for path, time in list(hitch["systems"].items())[:10]:
+            imgui.text(f"{time:8.3f}ms  {path}")
+        imgui.tree_pop()
+
+
+def performance_monitor(
+    ecs: ECS,
+    history: int = 2048,
+    hitch_factor: float = 2.0,
+    hitch_log_size: int = 64,
+):
+    frame_times = RingBuffer(history)
+    render_times = RingBuffer(history)
+    update_times = RingBuffer(history)
+    gc_times = RingBuffer(history)
+    gpu_times: dict[str, RingBuffer] = {}
+    hitches: deque[dict] = deque(maxlen=hitch_log_size)
+    last_collections = gc_collections()
     implot.create_context()
 
     def setup(ecs: ECS, window: Window):
         def gui(ecs: ECS):
-            render_times.append(window.last_render_time)
-            render_times.pop(0)
-            frame_times.append(window.last_frame_time)
-            frame_times.pop(0)
-            update_times.append(window.last_update_time)
-            update_times.pop(0)
+            nonlocal hitch_factor, last_collections
+            render_times.push(window.last_render_time)
+            frame_times.push(window.last_frame_time)
+            update_times.push(window.last_update_time)
+            gc_times.push(window.last_gc_time)
+            last_gpu_times = get_gpu_times()
+            for name in last_gpu_times:
+                if name not in gpu_times:
+                    gpu_times[name] = RingBuffer(history)
+            for name, times in gpu_times.items():
+                times.push(last_gpu_times.get(name, 0.0))
+            # A hitch is a frame much longer than the rolling median
+            collections = gc_collections()
+            median = frame_times.stats()["p50"]
+            if (
+                len(frame_times) >= HITCH_MIN_SAMPLES
+                and median > 0.0
+                and window.last_frame_time > hitch_factor * median
+            ):
+                delta = [a - b for a, b in zip(collections, last_collections)]
+                hitches.append(hitch_snapshot(ecs, window, median, delta))
+            last_collections = collections
+
             imgui.begin("Performance Monitor", None)
             if imgui.collapsing_header("Frame time"):
-                imgui.text(f"Frame Time: {frame_times[-1]:.5f}s")
-                if implot.begin_plot("##Frame time", (-1, 100)):
-                    implot.setup_axes("##f", "##ft", implot.AxisFlags_.auto_fit.value)
-                    implot.setup_axes_limits(-100, 0, 0, 0.025)
-                    implot.plot_line(
-                        "##ft(f)",
-                        np.linspace(-100, 0, 100, dtype=np.float64),
-                        np.array(frame_times),
-                    )
-                    implot.end_plot()
+                imgui.text(f"Frame Time: {frame_times.last:.5f}s")
+                mean = frame_times.mean
+                imgui.text(
+                    f"FPS: {1.0 / mean if mean > 0 else 0.0:.1f}"
+                    f"  1% low: {frame_times.low_rate(0.01):.1f}"
+                )
+                time_stats(frame_times)
+                time_plot("Frame time", frame_times)
             if imgui.collapsing_header("Update time"):
-                imgui.text(f"Render Time: {update_times[-1]:.5f}s")
-                if implot.begin_plot("##Update time", (-1, 100)):
-                    implot.setup_axes("##f", "##rt", implot.AxisFlags_.auto_fit.value)
-                    implot.setup_axes_limits(-100, 0, 0, 0.025)
-                    implot.plot_line(
-                        "##rt(f)",
-                        np.linspace(-100, 0, 100, dtype=np.float64),
-                        np.array(update_times),
-                    )
-                    implot.end_plot()
+                imgui.text(f"Update Time: {update_times.last:.5f}s")
+                time_stats(update_times)
+                time_plot("Update time", update_times)
             if imgui.collapsing_header("Render time"):
-                imgui.text(f"Render Time: {render_times[-1]:.5f}s")
-                if implot.begin_plot("##Render time", (-1, 100)):
-                    implot.setup_axes("##f", "##rt", implot.AxisFlags_.auto_fit.value)
-                    implot.setup_axes_limits(-100, 0, 0, 0.025)
-                    implot.plot_line(
-                        "##rt(f)",
-                        np.linspace(-100, 0, 100, dtype=np.float64),
-                        np.array(render_times),
+                imgui.text(f"Render Time: {render_times.last:.5f}s")
+                time_stats(render_times)
+                time_plot("Render time", render_times)
+            if imgui.collapsing_header("GC pauses"):
+                imgui.text(f"GC Pause: {gc_times.last * 1000:.3f}ms")
+                if window.gc_policy is not None:
+                    imgui.text(
+                        f"Idle full collections: {window.gc_policy.full_collections}"
+                        f" ({window.gc_policy.full_collection_time * 1000:.2f}ms)"
                     )
+                time_stats(gc_times)
+                time_plot("GC pauses", gc_times, 0.005)
+            if imgui.collapsing_header("GPU time"):
+                if not gpu_timing_supported():
+                    imgui.text("Timestamp queries are not supported")
+                for name, times in gpu_times.items():
+                    imgui.text(f"{name}: {times.last:.3f}ms")
+                if len(gpu_times) > 0 and implot.begin_plot("##GPU time", (-1, 150)):
+                    implot.setup_axes("##f", "##gt", implot.AxisFlags_.auto_fit.value)
+                    implot.setup_axes_limits(-history, 0, 0, 10)
+                    for name, times in gpu_times.items():
+                        implot.plot_line(name, times.xs(), times.values())
                     implot.end_plot()
+            if imgui.collapsing_header(f"Hitches ({len(hitches)})"):
+                changed, val = imgui.input_float("Median factor", hitch_factor)
+                if changed:
+                    hitch_factor = max(val, 1.0)
+                if imgui.button("Export JSON"):
+                    print(f"Writing hitches to {export_hitches(hitches)}")
+                imgui.same_line()
+                if imgui.button("Clear##hitches"):
+                    hitches.clear()
+                for hitch in reversed(hitches):
+                    hitch_gui(hitch)
+            if imgui.collapsing_header("Systems"):
+                changed, profiling = imgui.checkbox("Profile", chrono.is_profiling())
+                if changed:
+                    chrono.set_profiling(profiling)
+                imgui.same_line()
+                if imgui.button("Reset"):
+                    chrono.reset_zones()
+                systems_table()
+            if imgui.collapsing_header("Trace"):
+                changed, tracing = imgui.checkbox("Record", trace.is_tracing())
+                if changed:
+                    trace.set_tracing(tracing)
+                imgui.same_line()
+                if imgui.button("Dump trace"):
+                    print(f"Trace written to {trace.dump_trace()}")
+                imgui.same_line()
+                if imgui.button("Clear"):
+                    trace.clear_trace()
+            if imgui.collapsing_header("Commands"):
+                command_stats = get_command_stats()
+                imgui.text(f"Submits: {command_stats['submits']}")
+                imgui.text(f"Encoders: {command_stats['encoders']}")
+                imgui.text(f"Command Buffers: {command_stats['command_buffers']}")
+                imgui.text(f"Uploads: {command_stats['upload_bytes'] / 1024:.1f} KiB")
+            if imgui.collapsing_header("Pipeline cache"):
+                cache_stats = get_pipeline_cache_stats()
+                imgui.text(f"Cached objects: {cache_stats['size']}")
+                imgui.text(f"Hits: {cache_stats['hits']}")
+                imgui.text(f"Misses: {cache_stats['misses']}")
+                imgui.text(f"Evictions: {cache_stats['evictions']}")
+                imgui.text(f"Compile Time: {cache_stats['compile_time']:.5f}s")
+            if imgui.collapsing_header("Texture cache"):
+                texture_stats = get_texture_cache_stats()
+                imgui.text(f"Cached textures: {texture_stats['size']}")
+                imgui.text(f"Hits: {texture_stats['hits']}")
+                imgui.text(f"Misses: {texture_stats['misses']}")
+                imgui.text(
+                    f"Resident: {texture_stats['resident_bytes'] / 2**20:.1f} MiB"
+                )
+                imgui.text(
+                    f"Pinned: {texture_stats['pinned_bytes'] / 2**20:.1f}"
+                    f" / {texture_stats['budget_bytes'] / 2**20:.1f} MiB"
+                )
 
             imgui.end()
 
@@ -0,0 +1,312 @@
+import weakref
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+from pygfx import Camera, Geometry, InstancedMesh, Mesh, WgpuRenderer, WorldObject
+
+from wgut.bvh import BVH, ray_aabb
+
+
+def pointer_ray(
+    camera: Camera, pos: tuple[float, float], size: tuple[float, float]
+) -> tuple[npt.NDArray, npt.NDArray]:
+    # World space origin and normalized direction under a logical pixel
+    x = 2 * pos[0] / size[0] - 1
+    y = 1 - 2 * pos[1] / size[1]
+    inverse = np.linalg.inv(camera.camera_matrix)
+    near = inverse @ np.array([x, y, 0.0, 1.0])
+    far = inverse @ np.array([x, y, 1.0, 1.0])
+    near = near[:3] / near[3]
+    direction = far[:3] / far[3] - near
+    return near, direction / np.linalg.norm(direction)
+
+
+def ray_triangles(
+    origin: npt.NDArray, direction: npt.NDArray, vertices: npt.NDArray
+) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    # Möller-Trumbore on (T, 3, 3) vertices, both faces are hit. Returns the
+    # distances, inf when missed, and the barycentric coordinates.
+    v0, v1, v2 = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+    edge1 = v1 - v0
+    edge2 = v2 - v0
+    p = np.cross(direction, edge2)
+    determinant = np.einsum("ij,ij->i", edge1, p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / determinant
+        s = origin - v0
+        u = np.einsum("ij,ij->i", s, p) * inverse
+        q = np.cross(s, edge1)
+        v = (q @ direction) * inverse
+        t = np.einsum("ij,ij->i", edge2, q) * inverse
+    hit = (np.abs(determinant) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf), u, v
+
+
+class MeshTriangles:
+    def __init__(self, geometry: Geometry):
+        # Triangle BVH of a geometry in local space. Rebuilt when the indices
+        # change and refit when only the positions change.
+        self.__geometry = weakref.ref(geometry)
+        self.bvh: BVH | None = None
+        self.__indices_rev = -1
+        self.__positions_rev = -1
+
+    def update(self):
+        geometry = self.__geometry()
+        assert geometry is not None
+        indices = geometry.indices
+        positions = geometry.positions
+        if indices.rev != self.__indices_rev:
+            self.__indices_rev = indices.rev
+            data = np.asarray(indices.data)
+            self.face_size = data.shape[-1] if data.ndim == 2 else 3
+            faces = data.reshape(-1, self.face_size)
+            if self.face_size == 4:
+                # Quads are split into (0, 1, 2) and (0, 2, 3)
+                faces = np.stack([faces[:, [0, 1, 2]], faces[:, [0, 2, 3]]], axis=1)
+            self.triangles = faces.reshape(-1, 3)
+            self.bvh = None
+        if self.bvh is None or positions.rev != self.__positions_rev:
+            self.__positions_rev = positions.rev
+            points = np.asarray(positions.data, dtype=np.float32)[:, :3]
+            self.vertices = points[self.triangles]
+            lo, hi = self.vertices.min(axis=1), self.vertices.max(axis=1)
+            if self.bvh is None:
+                self.bvh = BVH(lo, hi)
+            else:
+                self.bvh.refit(lo, hi)
+
+    def bounds(self) -> npt.NDArray | None:
+        # Local box of the geometry, the root of the BVH
+        self.update()
+        assert self.bvh is not None
+        if self.bvh.size == 0:
+            return None
+        return np.stack([self.bvh.lo[0], self.bvh.hi[0]])
+
+    def raycast(self, origin: npt.NDArray, direction: npt.NDArray) -> dict | None:
+        # `direction` does not need to be normalized, distances are in units
+        # of its length
+        self.update()
+        assert self.bvh is not None
+        _, candidates = self.bvh.overlap_ray(origin, direction)
+        if len(candidates) == 0:
+            return None
+        t, u, v = ray_triangles(origin, direction, self.vertices[candidates])
+        best = int(np.argmin(t))
+        if not np.isfinite(t[best]):
+            return None
+        triangle = int(candidates[best])
+        w = 1.0 - u[best] - v[best]
+        coord = [float(w), float(u[best]), float(v[best])]
+        if self.face_size == 4:
+            if triangle % 2 == 0:
+                coord.append(0.0)
+            else:
+                coord = [coord[0], 0.0, coord[1], coord[2]]
+            face = triangle // 2
+        else:
+            face = triangle
+        return {"face_index": face, "face_coord": coord, "distance": float(t[best])}
+
+
+@dataclass
+class _Group:
+    # A mesh and its rows in the flat arrays of the picker, one per instance
+    obj: Mesh
+    layer: int
+    start: int
+    count: int
+    stamp: tuple = ()
+
+
+def _visible(obj: WorldObject | None) -> bool:
+    while obj is not None:
+        if not obj.visible:
+            return False
+        obj = obj.parent
+    return True
+
+
+class CPUPicker:
+    def __init__(self, renderer: WgpuRenderer):
+        # Drop-in for WgpuRenderer.get_pick_info that casts the pointer ray on
+        # the CPU instead of reading the pick texture back. Objects are added
+        # and removed explicitly, with the descendants they have at that time.
+        # Only visible meshes whose material has pick_write are picked, higher
+        # layers are drawn over lower ones so they win.
+        self.renderer = renderer
+        self.camera: Camera | None = None
+        self.__roots: dict[WorldObject, int] = {}
+        self.__groups: list[_Group] = []
+        self.__members_changed = True
+        # Moves are looked for at most once per frame, by the first pick
+        self.__moved = True
+        self.__entries: list[tuple[Mesh, int, int]] = []
+        self.__matrices = np.zeros((0, 4, 4), dtype=np.float32)
+        self.__lo = np.zeros((0, 3), dtype=np.float32)
+        self.__hi = np.zeros((0, 3), dtype=np.float32)
+        self.__bvh: BVH | None = None
+        self.__triangles: weakref.WeakKeyDictionary[Geometry, MeshTriangles] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def add(self, obj: WorldObject, layer: int = 0):
+        if self.__roots.get(obj) != layer:
+            self.__roots[obj] = layer
+            self.__members_changed = True
+
+    def remove(self, obj: WorldObject):
+        if self.__roots.pop(obj, None) is not None:
+            self.__members_changed = True
+
+    def new_frame(self):
+        self.__moved = True
+
+    def __stamp(self, group: _Group) -> tuple:
+        geometry = group.obj.geometry
+        positions = geometry.positions  # type: ignore
+        instances = getattr(group.obj, "instance_buffer", None)
+        return (
+            group.obj.world.last_modified,
+            -1 if instances is None else instances.rev,
+            positions.rev,
+            geometry.indices.rev,  # type: ignore
+        )
+
+    def __update(self, group: _Group) -> bool:
+        # Writes the matrices and world boxes of a group, false when the
+        # number of instances changed
+        obj = group.obj
+        world = obj.world.matrix
+        if isinstance(obj, InstancedMesh):
+            # pygfx stores instance matrices transposed
+            instances = obj.instance_buffer.data["matrix"]  # type: ignore
+            if len(instances) != group.count:
+                return False
+            matrices = world @ np.transpose(instances, (0, 2, 1))
+        else:
+            matrices = world[None]
+        rows = slice(group.start, group.start + group.count)
+        self.__matrices[rows] = matrices
+        box = self.__mesh_triangles(obj.geometry).bounds()  # type: ignore
+        if box is None:
+            # Empty geometries are a point, they have no triangle to hit
+            box = np.zeros((2, 3), dtype=np.float32)
+        center = (box[0] + box[1]) / 2
+        extent = (box[1] - box[0]) / 2
+        rotation = self.__matrices[rows, :3, :3]
+        center = rotation @ center + self.__matrices[rows, :3, 3]
+        extent = np.abs(rotation) @ extent
+        self.__lo[rows] = center - extent
+        self.__hi[rows] = center + extent
+        return True
+
+    def __rebuild(self):
+        # Walks the added objects, only when they change
+        self.__groups = []
+        self.__entries = []
+        for root, layer in self.__roots.items():
+            for obj in root.iter():
+                if not isinstance(obj, Mesh) or obj.geometry is None:
+                    continue
+                if not getattr(obj.material, "pick_write", False):
+                    continue
+                count = 1
+                if isinstance(obj, InstancedMesh):
+                    count = len(obj.instance_buffer.data)  # type: ignore
+                group = _Group(obj, layer, len(self.__entries), count)
+                self.__groups.append(group)
+                instances = range(count) if isinstance(obj, InstancedMesh) else [-1]
+                self.__entries.extend((obj, instance, layer) for instance in instances)
+        size = len(self.__entries)
+        self.__matrices = np.zeros((size, 4, 4), dtype=np.float32)
+        self.__lo = np.zeros((size, 3), dtype=np.float32)
+        self.__hi = np.zeros((size, 3), dtype=np.float32)
+        for group in self.__groups:
+            group.stamp = self.__stamp(group)
+            self.__update(group)
+        self.__bvh = BVH(self.__lo, self.__hi)
+
+    def __refresh(self):
+        # The object BVH is rebuilt when objects are added or removed and
+        # refit when some of them moved
+        if self.__members_changed:
+            self.__members_changed = False
+            self.__moved = False
+            self.__rebuild()
+            return
+        if not self.__moved:
+            return
+        self.__moved = False
+        moved = False
+        for group in self.__groups:
+            stamp = self.__stamp(group)
+            if stamp == group.stamp:
+                continue
+            group.stamp = stamp
+            moved = True
+            if not self.__update(group):
+                self.__rebuild()
+                return
+        if moved:
+            assert self.__bvh is not None
+            self.__bvh.refit(self.__lo, self.__hi)
+
+    def __mesh_triangles(self, geometry: Geometry) -> MeshTriangles:
+        triangles = self.__triangles.get(geometry)
+        if triangles is None:
+            triangles = MeshTriangles(geometry)
+            self.__triangles[geometry] = triangles
+        return triangles
+
+    def raycast(self, origin: npt.ArrayLike, direction: npt.ArrayLike) -> dict | None:
+        self.__refresh()
+        assert self.__bvh is not None
+        origin = np.asarray(origin, dtype=np.float32)
+        direction = np.asarray(direction, dtype=np.float32)
+        _, candidates = self.__bvh.overlap_ray(origin, direction)
+        if len(candidates) == 0:
+            return None
+        lo, hi = self.__lo, self.__hi
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / direction
+        _, enter = ray_aabb(
+            origin, inverse, lo[candidates], hi[candidates], np.float32(np.inf)
+        )
+        layers = np.array([self.__entries[index][2] for index in candidates])
+        # Nearest boxes of the top layer first, stops once a hit is closer
+        # than the next box
+        order = np.lexsort((enter, -layers))
+        best: dict | None = None
+        for position in order:
+            index = candidates[position]
+            obj, instance, layer = self.__entries[index]
+            if best is not None and (
+                layer < best["layer"] or enter[position] > best["distance"]
+            ):
+                break
+            if not _visible(obj):
+                continue
+            inverse_matrix = np.linalg.inv(self.__matrices[index])
+            local_origin = inverse_matrix[:3, :3] @ origin + inverse_matrix[:3, 3]
+            local_direction = inverse_matrix[:3, :3] @ direction
+            hit = self.__mesh_triangles(obj.geometry).raycast(  # type: ignore
+                local_origin, local_direction
+            )
+            if hit is None:
+                continue
+            if best is None or hit["distance"] < best["distance"]:
+                best = {**hit, "world_object": obj, "layer": layer}
+                if instance >= 0:
+                    best["instance_index"] = instance
+                best["world_position"] = origin + hit["distance"] * direction
+        return best
+
+    def get_pick_info(self, pos: tuple[float, float]) -> dict:
+        if self.camera is None:
+            return {"world_object": None}
+        origin, direction = pointer_ray(self.camera, pos, self.renderer.logical_size)
+        info = self.raycast(origin, direction)
+        return {"world_object": None} if info is None else info
@@ -2,7 +2,7 @@ from imgui_bundle import imgui
 from wgpu.utils.imgui import ImguiRenderer
 
 from wgut.ecs import ECS
-from wgut import get_device
+from wgut import flush_commands, get_device
 from wgut.window import Window
 
 
@@ -11,6 +11,7 @@ def render_gui_system(ecs: ECS):
         imgui_renderer = ImguiRenderer(get_device(), window.get_canvas())
 
         def render(_ecs: ECS):
+            flush_commands()
             imgui_renderer.render()
 
         def update(_ecs: ECS, delta_time: float):
@@ -8,7 +8,9 @@ from pygfx import (
     WorldObject,
     Scene,
 )
+from wgut.core import flush_commands
 from wgut.ecs import ECS
+from wgut.picking import CPUPicker
 from time import perf_counter
 
 
@@ -66,10 +68,61 @@ class SceneObject:
         imgui.pop_id()
 
 
-def render_system(ecs: ECS, renderer: WgpuRenderer):
+def track_picking(ecs: ECS, picker: CPUPicker):
+    # Keeps the picker members in sync with the SceneObject components
+    members: dict[int, WorldObject] = {}
+
+    def add(id: int, so: SceneObject):
+        if id in members:
+            picker.remove(members[id])
+        members[id] = so.obj
+        picker.add(so.obj, so.layer)
+
+    def remove(id: int):
+        obj = members.pop(id, None)
+        if obj is not None:
+            picker.remove(obj)
+
+    for id, so in zip(ecs.entities_with(SceneObject), ecs.components(SceneObject)):
+        add(id, so)
+
+    def spawned(_ecs: ECS, id: int, components: list):
+        for component in components:
+            if isinstance(component, SceneObject):
+                add(id, component)
+
+    def killed(_ecs: ECS, id: int):
+        remove(id)
+
+    def added(ecs: ECS, id: int, ty: type):
+        if ty is SceneObject:
+            add(id, ecs[id][SceneObject])
+
+    def removed(_ecs: ECS, id: int, ty: type):
+        if ty is SceneObject:
+            remove(id)
+
+    ecs.on("entity_spawned", spawned)
+    ecs.on("entity_killed", killed)
+    ecs.on("component_added", added)
+    ecs.on("component_removed", removed)
+
+
+def render_system(ecs: ECS, renderer: WgpuRenderer, picking: str = "gpu"):
+    # With "cpu" picking, pointer events find their target by casting a ray
+    # on the CPU instead of reading the pick texture back from the GPU. pygfx
+    # still dispatches hover and click events from them.
+    if picking not in ("gpu", "cpu"):
+        raise ValueError(f"Unknown picking backend: {picking}")
+
     def setup(ecs: ECS, _):
         scenes = {0: Scene()}
         stats = {}
+        picker = None
+        if picking == "cpu":
+            picker = CPUPicker(renderer)
+            renderer.get_pick_info = picker.get_pick_info  # type: ignore
+            track_picking(ecs, picker)
 
         def clear():
             for scn in scenes.values():
@@ -107,6 +160,9 @@ def render_system(ecs: ECS, renderer: WgpuRenderer):
             camera = cam_so.obj
 
             assert isinstance(camera, Camera), "The ActiveCamera is not a Camera"
+            if picker is not None:
+                picker.camera = camera
+                picker.new_frame()
 
             clear()
             for (so,) in ecs.query([SceneObject]):
@@ -114,6 +170,9 @@ def render_system(ecs: ECS, renderer: WgpuRenderer):
                     scenes[so.layer] = Scene()
                 scenes[so.layer].add(so.obj)
 
+            # pygfx submits on its own, work recorded by the update systems
+            # has to reach the queue first
+            flush_commands()
             renderer.clear(all=True)
             for layer in sorted(scenes.keys()):
                 renderer.render(scenes[layer], camera, flush=False)
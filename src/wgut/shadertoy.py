@@ -4,9 +4,18 @@ from wgpu.gui.glfw import WgpuCanvas
 from wgpu.utils.imgui import ImguiRenderer
 
 from wgut.core import (
+    create_buffer,
+    create_bind_group_layout,
+    create_command_encoder,
+    create_pipeline_layout,
+    create_render_pipeline,
+    create_shader_module,
+    preprocess_shader,
     submit_command,
+    timestamp_writes,
     write_buffer,
     get_device,
+    get_gpu_times,
 )
 from wgut.window import Window
 import wgpu
@@ -56,25 +65,103 @@ fn fs_main(in: VertexOutput) -> @location(0) vec4<f32> {
 """
 
 
+def create_pipeline(
+    shader: str, format: wgpu.TextureFormat
+) -> tuple[wgpu.GPURenderPipeline, wgpu.GPUBindGroupLayout]:
+    bg_layout = create_bind_group_layout(
+        [
+            {
+                "binding": binding,
+                "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
+                "buffer": {"type": wgpu.BufferBindingType.uniform},
+            }
+            for binding in range(5)
+        ]
+    )
+
+    p_layout = create_pipeline_layout([bg_layout])
+
+    shader_module = create_shader_module(shader)
+
+    pipeline = create_render_pipeline(
+        layout=p_layout,
+        vertex={
+            "module": shader_module,
+            "entry_point": "vs_main",
+            "buffers": [],
+        },
+        primitive={
+            "topology": wgpu.PrimitiveTopology.triangle_list,
+            "front_face": wgpu.FrontFace.ccw,
+            "cull_mode": wgpu.CullMode.back,
+        },
+        depth_stencil=None,
+        multisample=None,
+        fragment={
+            "module": shader_module,
+            "entry_point": "fs_main",
+            "targets": [
+                {
+                    "format": format,
+                    "blend": {
+                        "color": {},
+                        "alpha": {},
+                    },
+                },
+            ],
+        },
+    )
+
+    return pipeline, bg_layout
+
+
+def create_bind_group(
+    layout: wgpu.GPUBindGroupLayout, buffers: list[wgpu.GPUBuffer]
+) -> wgpu.GPUBindGroup:
+    return get_device().create_bind_group(
+        layout=layout,
+        entries=[
+            {
+                "binding": binding,
+                "resource": {
+                    "buffer": buffer,
+                    "offset": 0,
+                    "size": buffer.size,
+                },
+            }
+            for binding, buffer in enumerate(buffers)
+        ],
+    )
+
+
+def create_uniform_buffer(data: NDArray) -> wgpu.GPUBuffer:
+    buffer = create_buffer(
+        size=data.nbytes,
+        usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.UNIFORM,  # type: ignore
+    )
+    write_buffer(buffer, data)
+    return buffer
+
+
+def get_i_date(now: datetime) -> NDArray:
+    return np.array(
+        [
+            now.year,
+            now.month,
+            now.day,
+            now.second + now.minute * 60 + now.hour * 3600 + now.microsecond * 0.000001,
+        ],
+        dtype=np.float32,
+    )
+
+
 class ShaderToy(Window):
-    def __init__(self, canvas: WgpuCanvas, source: str):
+    def __init__(self, canvas: WgpuCanvas, source: str, defines: dict | None = None):
         super().__init__(canvas)
-        self.shader = shader_header + source + shader_footer
+        self.shader = shader_header + preprocess_shader(source, defines) + shader_footer
 
     def getIDate(self):
-        now = datetime.now()
-        return np.array(
-            [
-                now.year,
-                now.month,
-                now.day,
-                now.second
-                + now.minute * 60
-                + now.hour * 3600
-                + now.microsecond * 0.000001,
-            ],
-            dtype=np.float32,
-        )
+        return get_i_date(datetime.now())
 
     def getIMouse(self):
         return np.array(
@@ -98,12 +185,7 @@ class ShaderToy(Window):
         return np.array([resolution[0], resolution[1], 0.0], dtype=np.float32)  # type: ignore
 
     def create_buffer(self, data: NDArray):
-        buffer = get_device().create_buffer(
-            size=data.nbytes,
-            usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.UNIFORM,  # type: ignore
-        )
-        write_buffer(buffer, data)
-        return buffer
+        return create_uniform_buffer(data)
 
     def setup(self):
         self.set_title("ShaderToy")
@@ -119,112 +201,18 @@ class ShaderToy(Window):
         self.iDateBuffer = self.create_buffer(self.getIDate())
         self.iMouseBuffer = self.create_buffer(self.getIMouse())
 
-        bg_layout = get_device().create_bind_group_layout(
-            entries=[
-                {
-                    "binding": 0,
-                    "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
-                    "buffer": {"type": wgpu.BufferBindingType.uniform},
-                },
-                {
-                    "binding": 1,
-                    "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
-                    "buffer": {"type": wgpu.BufferBindingType.uniform},
-                },
-                {
-                    "binding": 2,
-                    "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
-                    "buffer": {"type": wgpu.BufferBindingType.uniform},
-                },
-                {
-                    "binding": 3,
-                    "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
-                    "buffer": {"type": wgpu.BufferBindingType.uniform},
-                },
-                {
-                    "binding": 4,
-                    "visibility": wgpu.ShaderStage.VERTEX | wgpu.ShaderStage.FRAGMENT,
-                    "buffer": {"type": wgpu.BufferBindingType.uniform},
-                },
-            ]
-        )
-
-        p_layout = get_device().create_pipeline_layout(bind_group_layouts=[bg_layout])
-
-        shader_module = get_device().create_shader_module(code=self.shader)
-
-        self.pipeline = get_device().create_render_pipeline(
-            layout=p_layout,
-            vertex={
-                "module": shader_module,
-                "entry_point": "vs_main",
-                "buffers": [],
-            },
-            primitive={
-                "topology": wgpu.PrimitiveTopology.triangle_list,
-                "front_face": wgpu.FrontFace.ccw,
-                "cull_mode": wgpu.CullMode.back,
-            },
-            depth_stencil=None,
-            multisample=None,
-            fragment={
-                "module": shader_module,
-                "entry_point": "fs_main",
-                "targets": [
-                    {
-                        "format": self.get_texture_format(),
-                        "blend": {
-                            "color": {},
-                            "alpha": {},
-                        },
-                    },
-                ],
-            },
+        self.pipeline, bg_layout = create_pipeline(
+            self.shader, self.get_texture_format()
         )
 
-        self.bind_group = get_device().create_bind_group(
-            layout=bg_layout,
-            entries=[
-                {
-                    "binding": 0,
-                    "resource": {
-                        "buffer": self.iResolutionBuffer,
-                        "offset": 0,
-                        "size": self.iResolutionBuffer.size,
-                    },
-                },
-                {
-                    "binding": 1,
-                    "resource": {
-                        "buffer": self.iTimeBuffer,
-                        "offset": 0,
-                        "size": self.iTimeBuffer.size,
-                    },
-                },
-                {
-                    "binding": 2,
-                    "resource": {
-                        "buffer": self.iTimeDeltaBuffer,
-                        "offset": 0,
-                        "size": self.iTimeDeltaBuffer.size,
-                    },
-                },
-                {
-                    "binding": 3,
-                    "resource": {
-                        "buffer": self.iDateBuffer,
-                        "offset": 0,
-                        "size": self.iDateBuffer.size,
-                    },
-                },
-                {
-                    "binding": 4,
-                    "resource": {
-                        "buffer": self.iMouseBuffer,
-                        "offset": 0,
-                        "size": self.iMouseBuffer.size,
-                    },
-                },
+        self.bind_group = create_bind_group(
+            bg_layout,
+            [
+                self.iResolutionBuffer,
+                self.iTimeBuffer,
+                self.iTimeDeltaBuffer,
+                self.iDateBuffer,
+                self.iMouseBuffer,
             ],
         )
 
@@ -260,7 +248,7 @@ class ShaderToy(Window):
 
     def render(self):
         # command_encoder = CommandBufferBuilder()
-        command_encoder = get_device().create_command_encoder()
+        command_encoder = create_command_encoder()
 
         # render_pass = command_encoder.begin_render_pass(screen).build()
         render_pass: wgpu.GPURenderPassEncoder = command_encoder.begin_render_pass(
@@ -273,6 +261,7 @@ class ShaderToy(Window):
                     "store_op": wgpu.StoreOp.store,
                 }
             ],
+            timestamp_writes=timestamp_writes("shadertoy"),
         )
 
         render_pass.set_pipeline(self.pipeline)
@@ -294,6 +283,9 @@ class ShaderToy(Window):
         else:
             imgui.text("FPS: NaN")
         imgui.text(f"i_delta_time: {self.frame_time:.5f}s")
+        gpu_time = get_gpu_times().get("shadertoy")
+        if gpu_time is not None:
+            imgui.text(f"GPU Time: {gpu_time:.3f}ms")
         imgui.end()
         imgui.end_frame()
         imgui.render()
@@ -0,0 +1,233 @@
+import argparse
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Generator, Iterable
+
+import numpy as np
+import numpy.typing as npt
+import PIL.Image as img
+import wgpu
+
+from wgut.core import (
+    create_buffer,
+    create_command_encoder,
+    get_device,
+    load_shader,
+    preprocess_shader,
+    submit_command,
+    track_gpu_memory,
+    write_buffer,
+)
+from wgut.shadertoy import (
+    create_bind_group,
+    create_pipeline,
+    create_uniform_buffer,
+    get_i_date,
+    shader_footer,
+    shader_header,
+)
+
+# Copies from textures to buffers need rows aligned on 256 bytes
+COPY_BYTES_PER_ROW_ALIGNMENT = 256
+
+
+class OfflineShaderToy:
+    def __init__(
+        self,
+        source: str,
+        size: tuple[int, int] = (1920, 1080),
+        time_step: float = 1 / 60,
+        frames_in_flight: int = 3,
+        start_date: datetime | None = None,
+        defines: dict | None = None,
+    ):
+        assert frames_in_flight > 0, "At least one frame must be in flight"
+        self.size = size
+        self.time_step = time_step
+        self.frames_in_flight = frames_in_flight
+        self.start_date = datetime.now() if start_date is None else start_date
+        self.shader = shader_header + preprocess_shader(source, defines) + shader_footer
+
+        device = get_device()
+        width, height = size
+        self.format = wgpu.TextureFormat.rgba8unorm_srgb
+        self.target = device.create_texture(
+            size=(width, height, 1),
+            format=self.format,  # type: ignore
+            usage=wgpu.TextureUsage.RENDER_ATTACHMENT | wgpu.TextureUsage.COPY_SRC,  # type: ignore
+        )
+        track_gpu_memory(self.target, "texture", width * height * 4)
+        self.target_view = self.target.create_view()
+
+        self.row_bytes = width * 4
+        self.padded_row_bytes = (
+            (self.row_bytes + COPY_BYTES_PER_ROW_ALIGNMENT - 1)
+            // COPY_BYTES_PER_ROW_ALIGNMENT
+            * COPY_BYTES_PER_ROW_ALIGNMENT
+        )
+        self.readback_buffers = [
+            create_buffer(
+                size=self.padded_row_bytes * height,
+                usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.MAP_READ,  # type: ignore
+            )
+            for _ in range(frames_in_flight)
+        ]
+
+        self.iResolutionBuffer = create_uniform_buffer(
+            np.array([width, height, 0.0], dtype=np.float32)
+        )
+        self.iTimeBuffer = create_uniform_buffer(np.zeros(1, dtype=np.float32))
+        self.iTimeDeltaBuffer = create_uniform_buffer(
+            np.array([time_step], dtype=np.float32)
+        )
+        self.iDateBuffer = create_uniform_buffer(get_i_date(self.start_date))
+        self.iMouseBuffer = create_uniform_buffer(
+            np.array([0.0, 0.0, -1.0, -1.0], dtype=np.float32)
+        )
+
+        self.pipeline, bg_layout = create_pipeline(self.shader, self.format)  # type: ignore
+        self.bind_group = create_bind_group(
+            bg_layout,
+            [
+                self.iResolutionBuffer,
+                self.iTimeBuffer,
+                self.iTimeDeltaBuffer,
+                self.iDateBuffer,
+                self.iMouseBuffer,
+            ],
+        )
+
+    def submit_frame(self, index: int, readback_buffer: wgpu.GPUBuffer):
+        time = index * self.time_step
+        write_buffer(self.iTimeBuffer, np.array([time], dtype=np.float32))
+        write_buffer(
+            self.iDateBuffer,
+            get_i_date(self.start_date + timedelta(seconds=time)),
+        )
+
+        command_encoder = create_command_encoder()
+        render_pass: wgpu.GPURenderPassEncoder = command_encoder.begin_render_pass(
+            color_attachments=[
+                {
+                    "view": self.target_view,
+                    "resolve_target": None,
+                    "clear_value": (0.0, 0.0, 0.0, 1.0),
+                    "load_op": wgpu.LoadOp.clear,
+                    "store_op": wgpu.StoreOp.store,
+                }
+            ],
+        )
+        render_pass.set_pipeline(self.pipeline)
+        render_pass.set_bind_group(0, self.bind_group)
+        render_pass.draw(6)
+        render_pass.end()
+
+        command_encoder.copy_texture_to_buffer(
+            {"texture": self.target, "mip_level": 0, "origin": (0, 0, 0)},
+            {
+                "buffer": readback_buffer,
+                "offset": 0,
+                "bytes_per_row": self.padded_row_bytes,
+                "rows_per_image": self.size[1],
+            },
+            (self.size[0], self.size[1], 1),
+        )
+        submit_command(command_encoder)
+
+    def read_frame(self, readback_buffer: wgpu.GPUBuffer) -> npt.NDArray:
+        readback_buffer.map_sync(wgpu.MapMode.READ)  # type: ignore
+        data = np.frombuffer(readback_buffer.read_mapped(copy=False), dtype=np.uint8)
+        frame = (
+            data.reshape(self.size[1], self.padded_row_bytes)[:, : self.row_bytes]
+            .reshape(self.size[1], self.size[0], 4)
+            .copy()
+        )
+        readback_buffer.unmap()
+        return frame
+
+    def render(self, frame_count: int) -> Generator[npt.NDArray, None, None]:
+        # Keep up to `frames_in_flight` frames queued on the GPU and only wait
+        # on the oldest one, so rendering and readback overlap.
+        in_flight = []
+        for index in range(frame_count):
+            if len(in_flight) == self.frames_in_flight:
+                yield self.read_frame(in_flight.pop(0))
+            readback_buffer = self.readback_buffers[index % self.frames_in_flight]
+            self.submit_frame(index, readback_buffer)
+            in_flight.append(readback_buffer)
+        while len(in_flight) > 0:
+            yield self.read_frame(in_flight.pop(0))
+
+
+def write_png_sequence(
+    frames: Iterable[npt.NDArray], pattern: str, workers: int = 4
+) -> int:
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: list[Future] = []
+        for index, frame in enumerate(frames):
+            pending.append(
+                pool.submit(img.fromarray(frame, "RGBA").save, pattern.format(index))
+            )
+            # Bound the number of frames waiting for encoding
+            if len(pending) > workers * 2:
+                pending.pop(0).result()
+            count += 1
+        for future in pending:
+            future.result()
+    return count
+
+
+def write_raw(frames: Iterable[npt.NDArray], file: BinaryIO) -> int:
+    count = 0
+    for frame in frames:
+        file.write(memoryview(frame))
+        count += 1
+    file.flush()
+    return count
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Render a ShaderToy shader offline to PNG files or raw RGBA frames"
+    )
+    parser.add_argument("shader", help="WGSL file defining main_image")
+    parser.add_argument("-n", "--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--in-flight", type=int, default=3)
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="frame_{:05d}.png",
+        help="PNG filename pattern (str.format with the frame index), "
+        "'-' for raw RGBA on stdout or any other path for a raw RGBA file",
+    )
+    args = parser.parse_args(argv)
+
+    toy = OfflineShaderToy(
+        load_shader(args.shader),
+        size=(args.width, args.height),
+        time_step=1.0 / args.fps,
+        frames_in_flight=args.in_flight,
+    )
+    frames = toy.render(args.frames)
+
+    if args.output == "-":
+        count = write_raw(frames, sys.stdout.buffer)
+    elif args.output.lower().endswith(".png"):
+        count = write_png_sequence(frames, args.output)
+    else:
+        with open(args.output, "wb") as file:
+            count = write_raw(frames, file)
+
+    print(
+        f"Rendered {count} frames at {args.width}x{args.height}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
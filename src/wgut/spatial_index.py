@@ -0,0 +1,445 @@
+from typing import Callable, Type
+
+import numpy as np
+import numpy.typing as npt
+
+from wgut.bvh import BVH, expand_ranges
+from wgut.ecs import ECS, EntityNotFound
+from wgut.transform_system import Transform, TransformStore, get_transform_store
+
+# Cell coordinates are packed on 21 bits each
+CELL_BITS = 21
+CELL_OFFSET = 1 << (CELL_BITS - 1)
+# Above this many cells, a grid query tests every dynamic entity instead
+MAX_QUERY_CELLS = 4096
+
+
+class Static:
+    # Entities that rarely move, they are kept in a BVH instead of the grid
+    def __str__(self):
+        return "Static"
+
+
+class SpatialBounds:
+    def __init__(self, radius: float):
+        self.radius = radius
+
+    def __str__(self):
+        return f"SpatialBounds ({self.radius})"
+
+
+def pack_cells(cells: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    cells = (cells + CELL_OFFSET) & ((1 << CELL_BITS) - 1)
+    return (
+        (cells[..., 0] << (2 * CELL_BITS))
+        | (cells[..., 1] << CELL_BITS)
+        | cells[..., 2]
+    )
+
+
+def ray_spheres(
+    origins: npt.NDArray,
+    directions: npt.NDArray,
+    centers: npt.NDArray,
+    radii: npt.NDArray,
+) -> npt.NDArray:
+    # Distances to the spheres along normalized rays, inf when missed. Rays
+    # starting inside a sphere hit it at 0.
+    offsets = origins - centers
+    b = np.einsum("ij,ij->i", offsets, directions)
+    c = np.einsum("ij,ij->i", offsets, offsets) - radii * radii
+    discriminant = b * b - c
+    with np.errstate(invalid="ignore"):
+        far = -b + np.sqrt(discriminant)
+    t = np.maximum(-b - np.sqrt(np.maximum(discriminant, 0.0)), 0.0)
+    return np.where((discriminant >= 0) & (far >= 0), t, np.inf)
+
+
+def first_per_group(groups: npt.NDArray, keys: npt.NDArray, count: int = 1):
+    # Indices of the `count` smallest keys of every group
+    order = np.lexsort((keys, groups))
+    sorted_groups = groups[order]
+    starts = np.searchsorted(sorted_groups, sorted_groups, side="left")
+    rank = np.arange(len(order)) - starts
+    return order[rank < count], rank[rank < count]
+
+
+class Members:
+    def __init__(self):
+        # Entities of one side of the index, in insertion order
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.intp)
+        self.radii = np.zeros(0, dtype=np.float32)
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def set(self, entries: dict[int, tuple[int, float]]):
+        # Entities mapped to their transform row and radius
+        self.ids = np.fromiter(entries.keys(), dtype=np.int64, count=len(entries))
+        self.rows = np.array([entry[0] for entry in entries.values()], dtype=np.intp)
+        self.radii = np.array(
+            [entry[1] for entry in entries.values()], dtype=np.float32
+        )
+
+    def bounds(self) -> tuple[npt.NDArray, npt.NDArray]:
+        radii = self.radii[:, None]
+        return self.positions - radii, self.positions + radii
+
+
+class SpatialIndex:
+    def __init__(
+        self,
+        ecs: ECS,
+        cell_size: float = 1.0,
+        radius: float = 0.0,
+        store: TransformStore | None = None,
+    ):
+        # Positions come from the Transform components. Entities without
+        # SpatialBounds are spheres of `radius`. Membership follows the ECS
+        # events and arrays are only refreshed by the first query after a
+        # change.
+        self.__ecs = ecs
+        self.cell_size = cell_size
+        self.radius = radius
+        self.store = get_transform_store() if store is None else store
+        # Transform row and radius of the members, by static flag
+        self.__entries: dict[bool, dict[int, tuple[int, float]]] = {
+            True: {},
+            False: {},
+        }
+        self.__pending: set[int] = set(ecs.entities_with(Transform))
+        # Static flags of the sides whose membership changed
+        self.__changed: set[bool] = set()
+        self.__version = -1
+
+        self.dynamic = Members()
+        self.__keys = np.zeros(0, dtype=np.int64)
+        self.__order = np.zeros(0, dtype=np.intp)
+        self.__sorted_keys = np.zeros(0, dtype=np.int64)
+        self.__dynamic_bvh: BVH | None = None
+        self.__dynamic_bvh_version = -1
+
+        self.static = Members()
+        self.__static_bvh: BVH | None = None
+
+        ecs.on("entity_spawned", self.__spawned)
+        ecs.on("entity_killed", self.__killed)
+        ecs.on("component_added", self.__component_changed)
+        ecs.on("component_removed", self.__component_changed)
+
+    def __spawned(self, _ecs: ECS, id: int, _components: list):
+        self.__pending.add(id)
+
+    def __remove(self, id: int):
+        for static, entries in self.__entries.items():
+            if entries.pop(id, None) is not None:
+                self.__changed.add(static)
+
+    def __killed(self, _ecs: ECS, id: int):
+        # The entity is still in the ECS when the event is dispatched
+        self.__pending.discard(id)
+        self.__remove(id)
+
+    def __component_changed(self, _ecs: ECS, id: int, ty: Type):
+        if ty in (Transform, Static, SpatialBounds):
+            self.__pending.add(id)
+
+    def __apply_pending(self) -> set[bool]:
+        for id in self.__pending:
+            try:
+                components = self.__ecs[id]
+            except EntityNotFound:
+                self.__remove(id)
+                continue
+            transform = components.get(Transform)
+            if transform is None:
+                self.__remove(id)
+                continue
+            bounds = components.get(SpatialBounds)
+            radius = self.radius if bounds is None else bounds.radius
+            static = Static in components
+            entry = (transform.index, radius)
+            if self.__entries[not static].pop(id, None) is not None:
+                self.__changed.add(not static)
+            if self.__entries[static].get(id) != entry:
+                self.__entries[static][id] = entry
+                self.__changed.add(static)
+        self.__pending.clear()
+        changed = self.__changed
+        self.__changed = set()
+        return changed
+
+    def refresh(self):
+        # Called by every query, cheap when nothing moved. A membership change
+        # only rebuilds its own side, spawning dynamic entities keeps the
+        # static BVH.
+        changed = self.__apply_pending()
+        self.store.flush()
+        if not changed and self.__version == self.store.version:
+            return
+        self.__version = self.store.version
+
+        if True in changed:
+            self.static.set(self.__entries[True])
+            self.__static_bvh = None
+        if False in changed:
+            self.dynamic.set(self.__entries[False])
+            self.__dynamic_bvh = None
+
+        # Statics only get a refit when they move
+        positions = self.store.world[self.static.rows, :3, 3]
+        if self.__static_bvh is None:
+            self.static.positions = positions
+            self.__static_bvh = BVH(*self.static.bounds())
+        elif not np.array_equal(positions, self.static.positions):
+            self.static.positions = positions
+            self.__static_bvh.refit(*self.static.bounds())
+
+        # The grid order is kept between frames, re-sorting an almost sorted
+        # order only costs a merge pass
+        self.dynamic.positions = self.store.world[self.dynamic.rows, :3, 3]
+        keys = pack_cells(
+            np.floor(self.dynamic.positions / self.cell_size).astype(np.int64)
+        )
+        if False in changed:
+            self.__order = np.argsort(keys, kind="stable")
+        elif not np.array_equal(keys, self.__keys):
+            resorted = np.argsort(keys[self.__order], kind="stable")
+            self.__order = self.__order[resorted]
+        self.__keys = keys
+        self.__sorted_keys = keys[self.__order]
+
+    def __dynamic_tree(self) -> BVH:
+        # Rays are not a good fit for the grid, dynamic entities also get a
+        # BVH that is built on demand and refit while membership is unchanged
+        if self.__dynamic_bvh is None:
+            self.__dynamic_bvh = BVH(*self.dynamic.bounds())
+        elif self.__dynamic_bvh_version != self.__version:
+            self.__dynamic_bvh.refit(*self.dynamic.bounds())
+        self.__dynamic_bvh_version = self.__version
+        return self.__dynamic_bvh
+
+    def __grid_candidates(
+        self, lo: npt.NDArray, hi: npt.NDArray
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # (query, dynamic index) pairs for entities in the cells covered by the
+        # boxes, the boxes must already include the entity radii
+        if len(self.dynamic) == 0 or len(lo) == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+        low = np.floor(lo / self.cell_size).astype(np.int64)
+        high = np.floor(hi / self.cell_size).astype(np.int64)
+        spans = np.maximum(high - low + 1, 0)
+        cells = spans.prod(axis=1)
+        large = cells > min(MAX_QUERY_CELLS, len(self.dynamic))
+
+        queries = []
+        candidates = []
+        brute = np.nonzero(large)[0]
+        if len(brute) > 0:
+            queries.append(np.repeat(brute, len(self.dynamic)))
+            candidates.append(np.tile(np.arange(len(self.dynamic)), len(brute)))
+
+        small = np.nonzero(~large & (cells > 0))[0]
+        if len(small) > 0:
+            span = spans[small].max(axis=0)
+            offsets = np.indices(tuple(int(n) for n in span)).reshape(3, -1).T
+            valid = np.all(offsets[None] < spans[small, None], axis=2)
+            query, offset = np.nonzero(valid)
+            keys = pack_cells(low[small[query]] + offsets[offset])
+            begin = np.searchsorted(self.__sorted_keys, keys, side="left")
+            end = np.searchsorted(self.__sorted_keys, keys, side="right")
+            counts = end - begin
+            queries.append(np.repeat(small[query], counts))
+            candidates.append(self.__order[expand_ranges(begin, counts)])
+
+        if len(queries) == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+        return np.concatenate(queries), np.concatenate(candidates)
+
+    def __candidates(
+        self, lo: npt.NDArray, hi: npt.NDArray
+    ) -> list[tuple[Members, npt.NDArray, npt.NDArray]]:
+        # Candidate pairs of both sides, boxes are grown by the largest dynamic
+        # radius for the grid since it only stores centers
+        margin = float(self.dynamic.radii.max()) if len(self.dynamic) > 0 else 0.0
+        dynamic = self.__grid_candidates(lo - margin, hi + margin)
+        static = (
+            self.__static_bvh.overlap_aabb(lo, hi)
+            if self.__static_bvh is not None
+            else (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+        )
+        return [(self.dynamic, *dynamic), (self.static, *static)]
+
+    def query_aabb_batch(
+        self, lo: npt.ArrayLike, hi: npt.ArrayLike
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Pairs of (query index, entity id) for entities overlapping the boxes
+        self.refresh()
+        lo = np.asarray(lo, dtype=np.float32).reshape(-1, 3)
+        hi = np.asarray(hi, dtype=np.float32).reshape(-1, 3)
+        queries = []
+        ids = []
+        for members, query, candidate in self.__candidates(lo, hi):
+            radii = members.radii[candidate, None]
+            positions = members.positions[candidate]
+            inside = np.all(
+                (positions + radii >= lo[query]) & (positions - radii <= hi[query]),
+                axis=1,
+            )
+            queries.append(query[inside])
+            ids.append(members.ids[candidate[inside]])
+        return np.concatenate(queries), np.concatenate(ids)
+
+    def query_aabb(self, lo: npt.ArrayLike, hi: npt.ArrayLike) -> npt.NDArray:
+        return self.query_aabb_batch(lo, hi)[1]
+
+    def __within(
+        self, centers: npt.NDArray, radius: npt.NDArray, bounds: bool
+    ) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # (query, entity id, distance) for entities within `radius`, counting
+        # their own radius when `bounds` is set
+        queries = []
+        ids = []
+        distances = []
+        extent = radius[:, None]
+        for members, query, candidate in self.__candidates(
+            centers - extent, centers + extent
+        ):
+            distance = np.linalg.norm(
+                members.positions[candidate] - centers[query], axis=1
+            )
+            limit = radius[query]
+            if bounds:
+                limit = limit + members.radii[candidate]
+            inside = distance <= limit
+            queries.append(query[inside])
+            ids.append(members.ids[candidate[inside]])
+            distances.append(distance[inside])
+        return np.concatenate(queries), np.concatenate(ids), np.concatenate(distances)
+
+    def query_radius_batch(
+        self, centers: npt.ArrayLike, radius: npt.ArrayLike
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Pairs of (query index, entity id) for entities whose sphere overlaps
+        # the query spheres
+        self.refresh()
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 3)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float32), (len(centers),))
+        queries, ids, _ = self.__within(centers, radius, True)
+        return queries, ids
+
+    def query_radius(self, center: npt.ArrayLike, radius: float) -> npt.NDArray:
+        return self.query_radius_batch(center, radius)[1]
+
+    def nearest_k_batch(
+        self, points: npt.ArrayLike, k: int
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Ids and center distances of the k nearest entities of every point,
+        # sorted by distance, padded with -1 and inf. The search radius doubles
+        # until k entities are found.
+        self.refresh()
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        ids = np.full((len(points), k), -1, dtype=np.int64)
+        distances = np.full((len(points), k), np.inf, dtype=np.float32)
+        total = len(self.dynamic) + len(self.static)
+        if total == 0 or k == 0:
+            return ids, distances
+
+        positions = np.concatenate([self.dynamic.positions, self.static.positions])
+        lo, hi = positions.min(axis=0), positions.max(axis=0)
+        pending = np.arange(len(points))
+        radius = np.full(len(points), self.cell_size, dtype=np.float32)
+        while len(pending) > 0:
+            # Past this radius, every entity has been seen
+            farthest = np.linalg.norm(
+                np.maximum(np.abs(points[pending] - lo), np.abs(points[pending] - hi)),
+                axis=1,
+            )
+            query, found, distance = self.__within(
+                points[pending], radius[pending], False
+            )
+            counts = np.bincount(query, minlength=len(pending))
+            done = (counts >= min(k, total)) | (radius[pending] >= farthest)
+            selected = done[query]
+            first, rank = first_per_group(query[selected], distance[selected], k)
+            rows = pending[query[selected][first]]
+            ids[rows, rank] = found[selected][first]
+            distances[rows, rank] = distance[selected][first]
+            pending = pending[~done]
+            radius[pending] *= 2
+        return ids, distances
+
+    def nearest_k(
+        self, point: npt.ArrayLike, k: int
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        ids, distances = self.nearest_k_batch(point, k)
+        found = ids[0] >= 0
+        return ids[0][found], distances[0][found]
+
+    def raycast_batch(
+        self,
+        origins: npt.ArrayLike,
+        directions: npt.ArrayLike,
+        max_distance: npt.ArrayLike = np.inf,
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        # Id and distance of the first entity hit by every ray, -1 and inf
+        # when nothing is hit
+        self.refresh()
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+        max_distance = np.broadcast_to(
+            np.asarray(max_distance, dtype=np.float32), (len(origins),)
+        )
+        ids = np.full(len(origins), -1, dtype=np.int64)
+        distances = np.full(len(origins), np.inf, dtype=np.float32)
+        sides = [(self.static, self.__static_bvh)]
+        if len(self.dynamic) > 0:
+            sides.append((self.dynamic, self.__dynamic_tree()))
+        for members, tree in sides:
+            if tree is None:
+                continue
+            rays, candidates = tree.overlap_ray(origins, directions, max_distance)
+            t = ray_spheres(
+                origins[rays],
+                directions[rays],
+                members.positions[candidates],
+                members.radii[candidates],
+            )
+            hit = t <= max_distance[rays]
+            rays, candidates, t = rays[hit], candidates[hit], t[hit]
+            first, _ = first_per_group(rays, t)
+            rays, candidates, t = rays[first], candidates[first], t[first]
+            closer = t < distances[rays]
+            ids[rays[closer]] = members.ids[candidates[closer]]
+            distances[rays[closer]] = t[closer]
+        return ids, distances
+
+    def raycast(
+        self,
+        origin: npt.ArrayLike,
+        direction: npt.ArrayLike,
+        max_distance: float = np.inf,
+    ) -> tuple[int, float] | None:
+        ids, distances = self.raycast_batch(origin, direction, max_distance)
+        if ids[0] < 0:
+            return None
+        return int(ids[0]), float(distances[0])
+
+
+def spatial_index_system(
+    ecs: ECS,
+    cell_size: float = 1.0,
+    radius: float = 0.0,
+    store: TransformStore | None = None,
+):
+    index = SpatialIndex(ecs, cell_size, radius, store)
+
+    def handle_spatial_index(_ecs: ECS, fn: Callable[[SpatialIndex], None]):
+        fn(index)
+
+    ecs.on("call_with_spatial_index", handle_spatial_index)
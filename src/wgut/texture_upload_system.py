@@ -0,0 +1,10 @@
+from wgut.core import flush_mipmaps, process_texture_uploads
+from wgut.ecs import ECS
+
+
+def texture_upload_system(ecs: ECS, byte_budget: int = 16 * 1024 * 1024):
+    def update(_ecs: ECS, _delta_time: float):
+        process_texture_uploads(byte_budget)
+        flush_mipmaps()
+
+    ecs.on("update", update)
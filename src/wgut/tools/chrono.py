@@ -1,5 +1,8 @@
+from dataclasses import dataclass
 from time import perf_counter
 
+from wgut.tools import trace
+
 __start = 0.0
 __started = False
 
@@ -19,3 +22,87 @@ def stop() -> float:
         __started = False
         return T
     return 0.0
+
+
+@dataclass
+class ZoneStats:
+    calls: int = 0
+    total: float = 0.0
+    current: float = 0.0
+    last: float = 0.0
+    max: float = 0.0
+
+
+_profiling = False
+_zones: dict[str, ZoneStats] = {}
+_stack: list[str] = []
+_frames = 0
+
+
+def set_profiling(enabled: bool):
+    global _profiling
+    _profiling = enabled
+
+
+def is_profiling() -> bool:
+    return _profiling
+
+
+def is_recording() -> bool:
+    return _profiling or trace.is_tracing()
+
+
+class zone:
+    # Zones opened inside another one are recorded as "parent/child"
+    __slots__ = ("name", "path", "begin")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = None
+        self.begin = 0.0
+
+    def __enter__(self):
+        if _profiling or trace.is_tracing():
+            self.path = f"{_stack[-1]}/{self.name}" if _stack else self.name
+            _stack.append(self.path)
+            self.begin = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self.path is not None:
+            elapsed = perf_counter() - self.begin
+            _stack.pop()
+            trace.complete(self.name, self.begin, elapsed)
+            if _profiling:
+                stats = _zones.get(self.path)
+                if stats is None:
+                    stats = _zones[self.path] = ZoneStats()
+                stats.calls += 1
+                stats.total += elapsed
+                stats.current += elapsed
+            self.path = None
+
+
+def new_frame():
+    global _frames
+    if not _profiling:
+        return
+    _frames += 1
+    for stats in _zones.values():
+        stats.last = stats.current
+        stats.max = max(stats.max, stats.current)
+        stats.current = 0.0
+
+
+def get_zones() -> dict[str, ZoneStats]:
+    return _zones
+
+
+def get_frame_count() -> int:
+    return _frames
+
+
+def reset_zones():
+    global _frames
+    _zones.clear()
+    _frames = 0
@@ -0,0 +1,78 @@
+import gc
+from time import perf_counter
+
+from wgut.tools import trace
+
+# gen-2 threshold used to keep automatic full collections from happening
+DISABLED_THRESHOLD = 1 << 30
+
+_pause_begin = 0.0
+_frame_pause = 0.0
+
+
+def _on_collection(phase: str, info: dict):
+    global _pause_begin, _frame_pause
+    if phase == "start":
+        _pause_begin = perf_counter()
+    else:
+        pause = perf_counter() - _pause_begin
+        _frame_pause += pause
+        trace.complete(f"gc gen {info['generation']}", _pause_begin, pause, "gc")
+
+
+def monitor_pauses():
+    if _on_collection not in gc.callbacks:
+        gc.callbacks.append(_on_collection)
+
+
+def take_frame_pause() -> float:
+    # Time spent collecting since the previous call
+    global _frame_pause
+    pause = _frame_pause
+    _frame_pause = 0.0
+    return pause
+
+
+class GCPolicy:
+    def __init__(
+        self, frame_time: float = 1 / 60, budget: float = 0.002, max_delay: int = 10
+    ):
+        # Full collections only run when they are expected to fit in the time
+        # left in the frame and in `budget`, or when they have been delayed for
+        # `max_delay` times the usual gen-2 threshold
+        self.frame_time = frame_time
+        self.budget = budget
+        self.max_delay = max_delay
+        self.full_collection_time = 0.0
+        self.full_collections = 0
+        self.__thresholds = gc.get_threshold()
+
+    def enable(self):
+        # Objects created so far are moved to the permanent generation and are
+        # never scanned again
+        gc.collect()
+        gc.freeze()
+        self.__thresholds = gc.get_threshold()
+        gc.set_threshold(self.__thresholds[0], self.__thresholds[1], DISABLED_THRESHOLD)
+
+    def disable(self):
+        gc.set_threshold(*self.__thresholds)
+        gc.unfreeze()
+
+    def collect(self, elapsed: float) -> int | None:
+        remaining = min(self.frame_time - elapsed, self.budget)
+        pending = gc.get_count()[2]
+        due = pending >= self.__thresholds[2]
+        overdue = pending >= self.__thresholds[2] * self.max_delay
+        if (due and self.full_collection_time <= remaining) or overdue:
+            begin = perf_counter()
+            gc.collect(2)
+            self.full_collection_time = perf_counter() - begin
+            self.full_collections += 1
+            return 2
+        # Young objects are collected now rather than in the middle of the
+        # next update
+        if remaining > 0.0 and gc.get_count()[0] > 0:
+            gc.collect(0)
+            return 0
+        return None
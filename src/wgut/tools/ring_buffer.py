@@ -0,0 +1,96 @@
+import numpy as np
+import numpy.typing as npt
+
+
+class RingBuffer:
+    def __init__(self, length: int = 2048, stats_interval: int = 30):
+        # Every sample is written twice so the last `length` samples are always
+        # a contiguous view, plotting never copies
+        self.length = length
+        self.stats_interval = stats_interval
+        self.x = np.arange(1 - length, 1, dtype=np.float64)
+        self.__data = np.zeros(2 * length, dtype=np.float64)
+        self.__index = 0
+        self.__count = 0
+        self.__sum = 0.0
+        self.__stats: dict[str, float] | None = None
+        self.__sorted = np.zeros(0, dtype=np.float64)
+        self.__pushes = 0
+
+    def push(self, value: float):
+        old = float(self.__data[self.__index])
+        self.__data[self.__index] = value
+        self.__data[self.__index + self.length] = value
+        self.__index = (self.__index + 1) % self.length
+        if self.__count < self.length:
+            self.__count += 1
+        else:
+            self.__sum -= old
+        self.__sum += value
+        self.__pushes += 1
+        # A new maximum shows up at once, the others wait for the refresh
+        if self.__stats is not None and value > self.__stats["max"]:
+            self.__stats["max"] = value
+
+    def __len__(self) -> int:
+        return self.__count
+
+    @property
+    def last(self) -> float:
+        return float(self.__data[self.__index + self.length - 1])
+
+    @property
+    def mean(self) -> float:
+        return self.__sum / self.__count if self.__count > 0 else 0.0
+
+    def values(self) -> npt.NDArray[np.float64]:
+        end = self.__index + self.length
+        return self.__data[end - self.__count : end]
+
+    def xs(self) -> npt.NDArray[np.float64]:
+        return self.x[self.length - self.__count :]
+
+    def __refresh(self):
+        # Percentiles and lows need the window sorted, it is only redone every
+        # `stats_interval` samples
+        if self.__stats is not None and self.__pushes < self.stats_interval:
+            return
+        self.__pushes = 0
+        values = self.values()
+        # Also drops the rounding errors accumulated by the running sum
+        self.__sum = float(values.sum())
+        self.__sorted = np.sort(values)
+        if len(values) == 0:
+            self.__stats = {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        else:
+            p50, p95, p99 = np.percentile(self.__sorted, (50, 95, 99))
+            self.__stats = {
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(self.__sorted[-1]),
+            }
+
+    def stats(self) -> dict[str, float]:
+        self.__refresh()
+        assert self.__stats is not None
+        return {"mean": self.mean, **self.__stats}
+
+    def low_rate(self, fraction: float = 0.01) -> float:
+        # Average rate over the slowest `fraction` of the samples, the
+        # "1% low" FPS when samples are frame times
+        self.__refresh()
+        if len(self.__sorted) == 0:
+            return 0.0
+        count = max(int(len(self.__sorted) * fraction), 1)
+        mean = self.__sorted[-count:].mean()
+        return float(1.0 / mean) if mean > 0 else 0.0
+
+    def clear(self):
+        self.__data[:] = 0.0
+        self.__index = 0
+        self.__count = 0
+        self.__sum = 0.0
+        self.__stats = None
+        self.__sorted = np.zeros(0, dtype=np.float64)
+        self.__pushes = 0
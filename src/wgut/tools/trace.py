@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+
+DEFAULT_CAPACITY = 1 << 16
+# Minimum delay between two dumps triggered by hitches
+HITCH_DUMP_INTERVAL = 10.0
+
+# Events are stored as tuples and only converted to trace-event dicts when
+# dumped, recording is a single append
+_events: deque[tuple] = deque(maxlen=DEFAULT_CAPACITY)
+_tracing = os.environ.get("WGUT_TRACE", "") not in ("", "0")
+_last_hitch_dump = -HITCH_DUMP_INTERVAL
+_WRITER: ThreadPoolExecutor | None = None
+
+
+def set_tracing(enabled: bool, capacity: int | None = None):
+    global _tracing, _events
+    _tracing = enabled
+    if capacity is not None and capacity != _events.maxlen:
+        _events = deque(_events, maxlen=capacity)
+
+
+def is_tracing() -> bool:
+    return _tracing
+
+
+def complete(name: str, begin: float, duration: float, category: str = "zone"):
+    if _tracing:
+        _events.append(("X", name, category, begin, duration, threading.get_ident()))
+
+
+def instant(name: str, category: str = "frame", args: dict | None = None):
+    if _tracing:
+        _events.append(
+            ("i", name, category, perf_counter(), args, threading.get_ident())
+        )
+
+
+def clear_trace():
+    _events.clear()
+
+
+def _thread_names() -> list[tuple[int | None, str]]:
+    return [(thread.ident, thread.name) for thread in threading.enumerate()]
+
+
+def _trace_events(
+    records: list[tuple], threads: list[tuple[int | None, str]]
+) -> list[dict]:
+    pid = os.getpid()
+    events = []
+    for phase, name, category, time, extra, tid in records:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": phase,
+            "ts": time * 1e6,
+            "pid": pid,
+            "tid": tid,
+        }
+        if phase == "X":
+            event["dur"] = extra * 1e6
+        else:
+            event["s"] = "p"
+            if extra is not None:
+                event["args"] = extra
+        events.append(event)
+    for ident, name in threads:
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": ident,
+                "args": {"name": name},
+            }
+        )
+    return events
+
+
+def get_trace_events() -> list[dict]:
+    return _trace_events(list(_events), _thread_names())
+
+
+def write_json(filename: str, data, indent: int | None = None) -> Future[str]:
+    # Written on a worker thread so a dump does not lengthen the frame that
+    # triggered it. `data` is either the object or a function building it,
+    # it must not be modified afterwards.
+    global _WRITER
+    if _WRITER is None:
+        _WRITER = ThreadPoolExecutor(1, thread_name_prefix="wgut-trace")
+
+    def write() -> str:
+        with open(filename, "w") as file:
+            json.dump(data() if callable(data) else data, file, indent=indent)
+        return filename
+
+    return _WRITER.submit(write)
+
+
+def get_trace_dir() -> str:
+    return os.environ.get("WGUT_TRACE_DIR", os.getcwd())
+
+
+def dump_trace(filename: str | None = None, background: bool = False) -> str:
+    # The file opens in https://ui.perfetto.dev or chrome://tracing. Only the
+    # raw records are copied here, with `background` they are converted and
+    # written on a worker thread.
+    if filename is None:
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        filename = os.path.join(get_trace_dir(), f"wgut-trace-{now}.json")
+    records = list(_events)
+    threads = _thread_names()
+
+    def data() -> dict:
+        return {"traceEvents": _trace_events(records, threads), "displayTimeUnit": "ms"}
+
+    written = write_json(filename, data)
+    if not background:
+        written.result()
+    return filename
+
+
+def dump_trace_on_hitch() -> str | None:
+    global _last_hitch_dump
+    if not _tracing or perf_counter() - _last_hitch_dump < HITCH_DUMP_INTERVAL:
+        return None
+    _last_hitch_dump = perf_counter()
+    filename = dump_trace(background=True)
+    print(f"Hitch detected, writing trace to {filename}")
+    return filename
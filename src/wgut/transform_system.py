@@ -0,0 +1,319 @@
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+from imgui_bundle import imgui
+from pygfx import InstancedMesh, WorldObject
+
+from wgut.ecs import ECS
+from wgut.render_system import SceneObject
+
+
+def compose(
+    positions: npt.NDArray, rotations: npt.NDArray, scales: npt.NDArray
+) -> npt.NDArray[np.float32]:
+    # Matrices from translations, quaternions (x, y, z, w) and scales, all at once
+    x, y, z, w = rotations.T
+    matrices = np.zeros((len(positions), 4, 4), dtype=np.float32)
+    matrices[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    matrices[:, 0, 1] = 2 * (x * y - z * w)
+    matrices[:, 0, 2] = 2 * (x * z + y * w)
+    matrices[:, 1, 0] = 2 * (x * y + z * w)
+    matrices[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    matrices[:, 1, 2] = 2 * (y * z - x * w)
+    matrices[:, 2, 0] = 2 * (x * z - y * w)
+    matrices[:, 2, 1] = 2 * (y * z + x * w)
+    matrices[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    matrices[:, :3, :3] *= scales[:, None, :]
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+class TransformStore:
+    def __init__(self, capacity: int = 1024):
+        self.count = 0
+        self.position = np.zeros((capacity, 3), dtype=np.float32)
+        self.rotation = np.zeros((capacity, 4), dtype=np.float32)
+        self.scale = np.ones((capacity, 3), dtype=np.float32)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.local = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.world = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Where world matrices are written: a pygfx object, or an instance of
+        # an InstancedMesh
+        self.objects: list[WorldObject | None] = [None] * capacity
+        self.instance_slot = np.full(capacity, -1, dtype=np.int32)
+        self.instance_mesh = np.full(capacity, -1, dtype=np.int32)
+        self.meshes: list[InstancedMesh] = []
+        self.__free: list[int] = []
+        self.__levels: list[npt.NDArray[np.intp]] | None = None
+        # Incremented whenever world matrices or live rows change
+        self.version = 0
+
+    def __grow(self):
+        capacity = 2 * len(self.alive)
+        defaults = {"scale": 1, "parent": -1, "instance_slot": -1, "instance_mesh": -1}
+        for name in (
+            "position",
+            "rotation",
+            "scale",
+            "parent",
+            "local",
+            "world",
+            "dirty",
+            "alive",
+            "instance_slot",
+            "instance_mesh",
+        ):
+            array = getattr(self, name)
+            grown = np.full(
+                (capacity, *array.shape[1:]), defaults.get(name, 0), dtype=array.dtype
+            )
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+        self.objects.extend([None] * (capacity - len(self.objects)))
+
+    def allocate(self, position, rotation, scale, parent: int = -1) -> int:
+        if len(self.__free) > 0:
+            index = self.__free.pop()
+        else:
+            if self.count == len(self.alive):
+                self.__grow()
+            index = self.count
+            self.count += 1
+        self.position[index] = position
+        self.rotation[index] = rotation
+        self.scale[index] = scale
+        self.parent[index] = -1
+        self.alive[index] = True
+        self.dirty[index] = True
+        self.__levels = None
+        self.version += 1
+        if parent >= 0:
+            self.set_parent(index, parent)
+        return index
+
+    def release(self, index: int):
+        # Children are moved to the root
+        children = np.nonzero(self.parent[: self.count] == index)[0]
+        self.parent[children] = -1
+        self.dirty[children] = True
+        self.alive[index] = False
+        self.dirty[index] = False
+        self.parent[index] = -1
+        self.objects[index] = None
+        self.instance_slot[index] = -1
+        self.instance_mesh[index] = -1
+        self.__free.append(index)
+        self.__levels = None
+        self.version += 1
+
+    def set_parent(self, index: int, parent: int):
+        ancestor = parent
+        while ancestor >= 0:
+            if ancestor == index:
+                raise ValueError("A transform cannot be its own ancestor")
+            ancestor = int(self.parent[ancestor])
+        self.parent[index] = parent
+        self.dirty[index] = True
+        self.__levels = None
+
+    def bind_object(self, index: int, obj: WorldObject):
+        self.objects[index] = obj
+        self.instance_mesh[index] = -1
+        self.instance_slot[index] = -1
+        self.dirty[index] = True
+
+    def bind_instance(self, index: int, mesh: InstancedMesh, slot: int):
+        if mesh not in self.meshes:
+            self.meshes.append(mesh)
+        self.objects[index] = None
+        self.instance_mesh[index] = self.meshes.index(mesh)
+        self.instance_slot[index] = slot
+        self.dirty[index] = True
+
+    def mark_dirty(self, indices: npt.ArrayLike):
+        self.dirty[indices] = True
+
+    def levels(self) -> list[npt.NDArray[np.intp]]:
+        # Indices grouped by depth in the hierarchy, parents before children.
+        # Only recomputed when the hierarchy changes.
+        if self.__levels is None:
+            parent = self.parent[: self.count]
+            has_parent = parent >= 0
+            depth = np.zeros(self.count, dtype=np.int32)
+            for _ in range(self.count):
+                next_depth = np.where(has_parent, depth[parent] + 1, 0)
+                if np.array_equal(next_depth, depth):
+                    break
+                depth = next_depth
+            alive = np.nonzero(self.alive[: self.count])[0]
+            order = alive[np.argsort(depth[alive], kind="stable")]
+            bounds = np.nonzero(np.diff(depth[order]))[0] + 1
+            self.__levels = np.split(order, bounds)
+        return self.__levels
+
+    def update(self) -> npt.NDArray[np.intp]:
+        # Returns the indices whose world matrix changed
+        dirty = self.dirty[: self.count]
+        if not dirty.any():
+            return np.zeros(0, dtype=np.intp)
+        indices = np.nonzero(dirty)[0]
+        self.local[indices] = compose(
+            self.position[indices], self.rotation[indices], self.scale[indices]
+        )
+
+        changed = dirty.copy()
+        for level in self.levels():
+            if len(level) == 0:
+                continue
+            parents = self.parent[level]
+            if parents[0] < 0:
+                selected = level[changed[level]]
+                self.world[selected] = self.local[selected]
+            else:
+                changed[level] |= changed[parents]
+                selected = level[changed[level]]
+                self.world[selected] = (
+                    self.world[self.parent[selected]] @ self.local[selected]
+                )
+        dirty[:] = False
+        self.version += 1
+        return np.nonzero(changed)[0]
+
+    def write(self, changed: npt.NDArray[np.intp]):
+        for index in changed:
+            obj = self.objects[index]
+            if obj is not None:
+                obj.local.matrix = self.world[index]
+
+        meshes = self.instance_mesh[changed]
+        for mesh_index, mesh in enumerate(self.meshes):
+            selected = changed[meshes == mesh_index]
+            if len(selected) == 0:
+                continue
+            slots = self.instance_slot[selected]
+            buffer = mesh.instance_buffer
+            # pygfx stores instance matrices transposed
+            buffer.data["matrix"][slots] = np.transpose(  # type: ignore
+                self.world[selected], (0, 2, 1)
+            )
+            first = int(slots.min())
+            buffer.update_range(first, int(slots.max()) - first + 1)
+
+    def flush(self):
+        # Brings world matrices up to date, also usable during the update to
+        # read them before the render
+        self.write(self.update())
+
+
+_DEFAULT_STORE: TransformStore | None = None
+
+
+def get_transform_store() -> TransformStore:
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        _DEFAULT_STORE = TransformStore()
+    return _DEFAULT_STORE
+
+
+class Transform:
+    def __init__(
+        self,
+        position: Sequence[float] = (0.0, 0.0, 0.0),
+        rotation: Sequence[float] = (0.0, 0.0, 0.0, 1.0),
+        scale: Sequence[float] = (1.0, 1.0, 1.0),
+        parent: "Transform | None" = None,
+        store: TransformStore | None = None,
+    ):
+        # A handle on a row of the store, batch updates can write the store
+        # arrays directly and call mark_dirty
+        self.store = get_transform_store() if store is None else store
+        self.index = self.store.allocate(
+            position, rotation, scale, -1 if parent is None else parent.index
+        )
+
+    @property
+    def position(self) -> npt.NDArray[np.float32]:
+        return self.store.position[self.index].copy()
+
+    @position.setter
+    def position(self, value: Sequence[float]):
+        self.store.position[self.index] = value
+        self.store.dirty[self.index] = True
+
+    @property
+    def rotation(self) -> npt.NDArray[np.float32]:
+        return self.store.rotation[self.index].copy()
+
+    @rotation.setter
+    def rotation(self, value: Sequence[float]):
+        self.store.rotation[self.index] = value
+        self.store.dirty[self.index] = True
+
+    @property
+    def scale(self) -> npt.NDArray[np.float32]:
+        return self.store.scale[self.index].copy()
+
+    @scale.setter
+    def scale(self, value: Sequence[float]):
+        self.store.scale[self.index] = value
+        self.store.dirty[self.index] = True
+
+    def set_parent(self, parent: "Transform | None"):
+        self.store.set_parent(self.index, -1 if parent is None else parent.index)
+
+    @property
+    def world_matrix(self) -> npt.NDArray[np.float32]:
+        return self.store.world[self.index].copy()
+
+    def bind_instance(self, mesh: InstancedMesh, slot: int):
+        self.store.bind_instance(self.index, mesh, slot)
+
+    def release(self):
+        self.store.release(self.index)
+
+    def __str__(self):
+        return f"Transform ({self.index})"
+
+    def ecs_explorer_gui(self):
+        for name in ("position", "scale"):
+            changed, value = imgui.input_float3(name, list(getattr(self, name)))
+            if changed:
+                setattr(self, name, value)
+        parent = int(self.store.parent[self.index])
+        imgui.text(f"Parent: {parent if parent >= 0 else 'None'}")
+
+
+def transform_system(ecs: ECS, store: TransformStore | None = None):
+    if store is None:
+        store = get_transform_store()
+
+    def bind(components: dict):
+        transform = components.get(Transform)
+        scene_object = components.get(SceneObject)
+        if transform is not None and scene_object is not None:
+            if store.objects[transform.index] is None:
+                store.bind_object(transform.index, scene_object.obj)
+
+    def spawned(_ecs: ECS, _id: int, components: list):
+        bind({type(component): component for component in components})
+
+    def added(ecs: ECS, id: int, _ty: type):
+        bind(ecs[id])
+
+    def killed(ecs: ECS, id: int):
+        transform = ecs[id].get(Transform)
+        if transform is not None:
+            transform.release()
+
+    def render(_ecs: ECS):
+        # Runs before render_system when registered first
+        store.flush()
+
+    ecs.on("entity_spawned", spawned)
+    ecs.on("component_added", added)
+    ecs.on("entity_killed", killed)
+    ecs.on("render", render)
@@ -2,7 +2,9 @@ from wgpu.gui.glfw import WgpuCanvas, run
 import wgpu
 from wgpu import GPUCanvasContext, GPUTexture
 
-from .core import get_device
+from .core import end_frame, get_device
+from .tools import chrono, trace
+from .tools.gc_policy import GCPolicy, monitor_pauses, take_frame_pause
 import time
 
 
@@ -13,6 +15,11 @@ class Window:
         self.last_render_time = 0.0
         self.last_update_time = 0.0
         self.last_frame_time = 0.0
+        # Frames longer than this dump the trace, when tracing is enabled
+        self.trace_hitch_time: float | None = None
+        # Opt-in, set before run() to collect garbage between frames
+        self.gc_policy: GCPolicy | None = None
+        self.last_gc_time = 0.0
 
         self.canvas = canvas
         self.present_context: GPUCanvasContext = self.canvas.get_context("wgpu")  # type: ignore
@@ -44,7 +51,10 @@ class Window:
         return self.present_context.get_current_texture()
 
     def run(self):
+        monitor_pauses()
         self.setup()
+        if self.gc_policy is not None:
+            self.gc_policy.enable()
         prev_time = None
 
         def main_loop():
@@ -52,11 +62,25 @@ class Window:
             current_time = time.perf_counter()
             if prev_time is not None:
                 self.last_frame_time = current_time - prev_time
+                trace.complete("frame", prev_time, self.last_frame_time, "frame")
+                if (
+                    self.trace_hitch_time is not None
+                    and self.last_frame_time > self.trace_hitch_time
+                ):
+                    trace.dump_trace_on_hitch()
             self.update(self.last_frame_time)
             mid = time.perf_counter()
             self.last_update_time = mid - current_time
+            trace.complete("update", current_time, self.last_update_time, "window")
             self.render()
+            # Commands still pending are submitted together
+            end_frame()
+            chrono.new_frame()
             self.last_render_time = time.perf_counter() - mid
+            trace.complete("render", mid, self.last_render_time, "window")
+            if self.gc_policy is not None:
+                self.gc_policy.collect(time.perf_counter() - current_time)
+            self.last_gc_time = take_frame_pause()
             prev_time = current_time
             self.canvas.request_draw()  # pyright: ignore
 
@@ -1,6 +1,7 @@
 from wgpu.gui.glfw import WgpuCanvas
 from wgut.ecs import ECS
 from wgut import Window
+from wgut.tools.gc_policy import GCPolicy
 
 
 class WindowSystemApp(Window):
@@ -25,7 +26,13 @@ class WindowSystemApp(Window):
         return "WindowSystemApp"
 
 
-def window_system(ecs: ECS, canvas: WgpuCanvas, title="WGUT Window"):
+def window_system(
+    ecs: ECS,
+    canvas: WgpuCanvas,
+    title="WGUT Window",
+    gc_policy: GCPolicy | None = None,
+):
     app = WindowSystemApp(ecs, canvas)
     app.set_title(title)
+    app.gc_policy = gc_policy
     app.run()
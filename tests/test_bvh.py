@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from wgut.bvh import BVH, expand_ranges, ray_aabb
+
+
+def random_boxes(count: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, (count, 3)).astype(np.float32)
+    extents = rng.uniform(0.05, 1.0, (count, 3)).astype(np.float32)
+    return centers - extents, centers + extents
+
+
+def pairs(queries: np.ndarray, primitives: np.ndarray) -> set[tuple[int, int]]:
+    return set(zip(queries.tolist(), primitives.tolist()))
+
+
+def exact_aabb(lo, hi, query_lo, query_hi) -> set[tuple[int, int]]:
+    overlap = np.all(
+        (lo[None] <= query_hi[:, None]) & (hi[None] >= query_lo[:, None]), axis=2
+    )
+    return pairs(*np.nonzero(overlap))
+
+
+def exact_ray(lo, hi, origins, directions) -> set[tuple[int, int]]:
+    with np.errstate(divide="ignore"):
+        inverse = 1.0 / directions
+    found = set()
+    for ray in range(len(origins)):
+        hit, _ = ray_aabb(
+            np.broadcast_to(origins[ray], lo.shape),
+            np.broadcast_to(inverse[ray], lo.shape),
+            lo,
+            hi,
+            np.float32(np.inf),
+        )
+        found |= {(ray, primitive) for primitive in np.nonzero(hit)[0].tolist()}
+    return found
+
+
+def test_expand_ranges():
+    starts = np.array([5, 0, 9])
+    counts = np.array([2, 0, 3])
+    assert expand_ranges(starts, counts).tolist() == [5, 6, 9, 10, 11]
+
+
+@pytest.mark.parametrize("count", [1, 7, 500])
+def test_leaves_cover_every_primitive(count):
+    lo, hi = random_boxes(count)
+    bvh = BVH(lo, hi, leaf_size=4)
+    assert sorted(bvh.order.tolist()) == list(range(count))
+    # The root bounds every primitive
+    assert np.all(bvh.lo[0] <= lo) and np.all(bvh.hi[0] >= hi)
+
+
+def test_overlap_aabb_candidates_contain_exact_pairs():
+    lo, hi = random_boxes(500)
+    bvh = BVH(lo, hi)
+    query_lo, query_hi = random_boxes(50, seed=1)
+    query_hi += 2.0
+    queries, primitives = bvh.overlap_aabb(query_lo, query_hi)
+    candidates = pairs(queries, primitives)
+    assert len(candidates) == len(queries)
+    assert exact_aabb(lo, hi, query_lo, query_hi) <= candidates
+
+
+def test_overlap_ray_candidates_contain_exact_pairs():
+    lo, hi = random_boxes(500, seed=2)
+    bvh = BVH(lo, hi)
+    rng = np.random.default_rng(3)
+    origins = rng.uniform(-15, 15, (50, 3)).astype(np.float32)
+    directions = rng.normal(size=(50, 3)).astype(np.float32)
+    # Axis aligned rays have infinite inverse components
+    directions[:5, 1:] = 0.0
+    rays, primitives = bvh.overlap_ray(origins, directions)
+    assert exact_ray(lo, hi, origins, directions) <= pairs(rays, primitives)
+
+
+def test_overlap_ray_max_distance():
+    lo = np.array([[0, -1, -1], [10, -1, -1]], dtype=np.float32)
+    hi = lo + 2.0
+    bvh = BVH(lo, hi, leaf_size=1)
+    _, primitives = bvh.overlap_ray((-5, 0, 0), (1, 0, 0), max_distance=8.0)
+    assert primitives.tolist() == [0]
+    _, primitives = bvh.overlap_ray((-5, 0, 0), (-1, 0, 0))
+    assert len(primitives) == 0
+
+
+def test_refit_after_moves():
+    lo, hi = random_boxes(300, seed=4)
+    bvh = BVH(lo, hi)
+    offsets = np.random.default_rng(5).normal(0, 4, (300, 3)).astype(np.float32)
+    lo, hi = lo + offsets, hi + offsets
+    bvh.refit(lo, hi)
+    assert np.all(bvh.lo[0] <= lo) and np.all(bvh.hi[0] >= hi)
+    query_lo, query_hi = random_boxes(40, seed=6)
+    query_hi += 3.0
+    candidates = pairs(*bvh.overlap_aabb(query_lo, query_hi))
+    assert exact_aabb(lo, hi, query_lo, query_hi) <= candidates
+
+
+def test_empty():
+    bvh = BVH(np.zeros((0, 3)), np.zeros((0, 3)))
+    queries, primitives = bvh.overlap_aabb((-1, -1, -1), (1, 1, 1))
+    assert len(queries) == 0 and len(primitives) == 0
+    rays, primitives = bvh.overlap_ray((0, 0, 0), (1, 0, 0))
+    assert len(rays) == 0 and len(primitives) == 0
@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+wgpu = pytest.importorskip("wgpu")
+if wgpu.gpu.request_adapter_sync() is None:
+    pytest.skip("No GPU adapter", allow_module_level=True)
+
+from wgut import compute  # noqa: E402
+from wgut.core import read_buffer  # noqa: E402
+
+
+def run_compact(values: np.ndarray, flags: np.ndarray) -> np.ndarray:
+    out = compute.empty(len(values), np.uint32).buffer
+    args = compute.create_indirect_buffer()
+    compute.compact(
+        compute.array(values).buffer, compute.array(flags).buffer, out, args
+    )
+    count = int(np.frombuffer(read_buffer(args), np.uint32)[3])
+    return np.frombuffer(read_buffer(out), np.uint32)[:count]
+
+
+def test_compact_flags_above_one():
+    values = np.arange(0, 100, 10, dtype=np.uint32)
+    flags = np.array([1, 0, 2, 0, 1, 0, 0, 1, 0, 1], dtype=np.uint32)
+    assert run_compact(values, flags).tolist() == [0, 20, 40, 70, 90]
+
+
+def test_compact_many_blocks():
+    rng = np.random.default_rng(0)
+    values = np.arange(300000, dtype=np.uint32)
+    flags = rng.integers(0, 5, len(values)).astype(np.uint32)
+    assert np.array_equal(run_compact(values, flags), values[flags != 0])
+
+
+def test_array_roundtrip_dtypes():
+    assert compute.array(np.arange(5, dtype=np.float64)).dtype == np.float32
+    assert compute.array(np.arange(5, dtype=np.int64)).dtype == np.int32
+    assert compute.array(np.array([True, False])).numpy().tolist() == [1, 0]
+    values = np.arange(-3, 3, dtype=np.int32)
+    assert np.array_equal(compute.array(values).numpy(), values)
+
+
+@pytest.mark.parametrize("size", [1, 255, 256, 1000, 70000])
+def test_map_and_operators(size):
+    rng = np.random.default_rng(size)
+    a = rng.normal(size=size).astype(np.float32)
+    b = rng.uniform(1, 2, size=size).astype(np.float32)
+    x, y = compute.array(a), compute.array(b)
+    np.testing.assert_allclose((x * 2.0 + y).numpy(), a * 2 + b, rtol=1e-6)
+    np.testing.assert_allclose((1.0 - x / y).numpy(), 1 - a / b, rtol=1e-5)
+    np.testing.assert_allclose((-x).numpy(), -a)
+    np.testing.assert_allclose(x.map("abs(x) * y", y).numpy(), np.abs(a) * b, rtol=1e-6)
+    flags = x.map("u32(x > 0.0)", dtype=np.uint32)
+    assert np.array_equal(flags.numpy(), (a > 0).astype(np.uint32))
+
+
+def test_lazy_fusion():
+    a = np.arange(100, dtype=np.float32)
+    x = compute.array(a)
+    y = x * 2.0 + 1.0
+    z = y * y - x
+    assert y.lazy and z.lazy
+    # Shared inputs are bound once
+    assert len(z._inputs) == 1
+    np.testing.assert_allclose(z.numpy(), (a * 2 + 1) ** 2 - a)
+    assert not z.lazy and y.lazy
+
+
+def test_fusion_past_max_inputs():
+    arrays = [np.full(10, index, dtype=np.int32) for index in range(10)]
+    total = compute.array(arrays[0])
+    for values in arrays[1:]:
+        total = total + compute.array(values)
+    assert len(total._inputs) <= compute.MAX_INPUTS
+    assert total.numpy().tolist() == [45] * 10
+
+
+def test_where():
+    a = np.arange(10, dtype=np.int32)
+    condition = compute.array(a).map("u32(x % 2 == 0)", dtype=np.uint32)
+    result = compute.where(condition, compute.array(a), compute.array(-a))
+    assert np.array_equal(result.numpy(), np.where(a % 2 == 0, a, -a))
+
+
+@pytest.mark.parametrize("size", [1, 256, 257, 70000, 300000])
+@pytest.mark.parametrize("dtype", [np.float32, np.int32, np.uint32])
+def test_reduce(size, dtype):
+    rng = np.random.default_rng(size)
+    low = 0 if dtype == np.uint32 else -50
+    values = rng.integers(low, 50, size).astype(dtype)
+    x = compute.array(values)
+    assert x.sum() == values.sum(dtype=dtype)
+    assert x.min() == values.min()
+    assert x.max() == values.max()
+    # Float products depend on the order of the multiplications
+    product = np.prod(values[:20], dtype=dtype)
+    assert compute.array(values[:20]).reduce("*") == pytest.approx(product, rel=1e-5)
+    with pytest.raises(ValueError):
+        x.reduce("-")
+
+
+@pytest.mark.parametrize("size", [1, 256, 1000, 70000, 300000])
+def test_scan(size):
+    rng = np.random.default_rng(size)
+    values = rng.integers(0, 10, size).astype(np.uint32)
+    x = compute.array(values)
+    # Inclusive scans
+    assert np.array_equal(x.cumsum().numpy(), np.cumsum(values, dtype=np.uint32))
+    assert np.array_equal(x.scan("max").numpy(), np.maximum.accumulate(values))
+    floats = rng.integers(-5, 5, size).astype(np.float32)
+    np.testing.assert_array_equal(
+        compute.array(floats).scan("min").numpy(), np.minimum.accumulate(floats)
+    )
+
+
+def random_keys(key_type: str, size: int, rng) -> np.ndarray:
+    if key_type == "u32":
+        return rng.integers(0, 2**32, size, dtype=np.uint64).astype(np.uint32)
+    if key_type == "i32":
+        # Few distinct keys, so that ties check the stability
+        return rng.integers(-1000, 1000, size).astype(np.int32)
+    return rng.normal(size=size).astype(np.float32)
+
+
+def run_sort(keys: np.ndarray, key_type: str, with_values: bool, **kwargs):
+    key_buffer = compute.array(keys.view(np.uint32)).buffer
+    value_buffer = None
+    if with_values:
+        value_buffer = compute.array(np.arange(len(keys), dtype=np.uint32)).buffer
+    compute.radix_sort(key_buffer, value_buffer, key_type=key_type, **kwargs)
+    sorted_keys = np.frombuffer(read_buffer(key_buffer), keys.dtype)[: len(keys)]
+    if value_buffer is None:
+        return sorted_keys, None
+    return sorted_keys, np.frombuffer(read_buffer(value_buffer), np.uint32)[: len(keys)]
+
+
+@pytest.mark.parametrize("key_type", ["u32", "i32", "f32"])
+@pytest.mark.parametrize("size", [2, 1000, 100000])
+def test_radix_sort(key_type, size):
+    keys = random_keys(key_type, size, np.random.default_rng(size))
+    sorted_keys, values = run_sort(keys, key_type, True)
+    order = np.argsort(keys, kind="stable")
+    assert np.array_equal(sorted_keys, keys[order])
+    assert np.array_equal(values, order)
+
+
+@pytest.mark.parametrize("key_type", ["u32", "i32", "f32"])
+def test_radix_sort_descending(key_type):
+    keys = random_keys(key_type, 5000, np.random.default_rng(1))
+    sorted_keys, values = run_sort(keys, key_type, True, descending=True)
+    order = np.argsort(-keys.astype(np.float64), kind="stable")
+    assert np.array_equal(sorted_keys, keys[order])
+    assert np.array_equal(values, order)
+
+
+def test_radix_sort_key_bits():
+    # Three passes leave the result in the scratch buffers before the copy
+    keys = np.random.default_rng(2).integers(0, 4096, 999).astype(np.uint32)
+    sorted_keys, _ = run_sort(keys, "u32", False, key_bits=12)
+    assert np.array_equal(sorted_keys, np.sort(keys))
+
+
+def test_radix_sort_count():
+    keys = np.array([5, 3, 9, 1, 0, 7], dtype=np.uint32)
+    buffer = compute.array(keys).buffer
+    compute.radix_sort(buffer, count=4)
+    assert np.frombuffer(read_buffer(buffer), np.uint32).tolist() == [1, 3, 5, 9, 0, 7]
+    with pytest.raises(ValueError):
+        compute.radix_sort(buffer, key_type="f64")
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from wgut.ecs import ECS, Entity
+from wgut.ecs_explorer import EntityIndex
+
+
+class A:
+    pass
+
+
+class B:
+    pass
+
+
+class C:
+    pass
+
+
+TYPES = (A, B, C)
+FILTERS = [
+    ("", None, None),
+    ("", A, None),
+    ("", C, None),
+    ("1", None, None),
+    ("orc", B, None),
+    ("", None, frozenset({Entity, A, B})),
+    ("elf", None, frozenset({Entity})),
+]
+
+
+def assert_same(index: EntityIndex, fresh: EntityIndex):
+    assert index.ids == fresh.ids
+    assert index.labels == fresh.labels
+    assert index.archetypes == fresh.archetypes
+    assert index.members == fresh.members
+    # Types whose last archetype went away are kept at zero
+    counts = {ty: count for ty, count in index.type_archetypes.items() if count > 0}
+    assert counts == fresh.type_archetypes
+
+
+def random_edits(ecs: ECS, rng: np.random.Generator, count: int):
+    for _ in range(count):
+        alive = sorted(ecs.entities_with(Entity))
+        action = int(rng.integers(0, 4)) if alive else 0
+        if action == 0:
+            types = [ty for ty in TYPES if rng.random() < 0.5]
+            label = str(rng.choice(["Orc", "Elf", "Tree"]))
+            ecs.spawn([ty() for ty in types], label=label)
+            continue
+        id = int(rng.choice(alive))
+        ty = TYPES[int(rng.integers(0, len(TYPES)))]
+        if action == 1:
+            ecs.kill(id)
+        elif action == 2:
+            ecs.add_component(id, ty())
+        else:
+            ecs.remove_component(id, ty)
+
+
+def populated(seed: int, count: int = 50) -> ECS:
+    ecs = ECS()
+    random_edits(ecs, np.random.default_rng(seed), count)
+    return ecs
+
+
+def test_build_matches_ecs():
+    ecs = populated(0, 100)
+    index = EntityIndex(ecs)
+    assert index.ids == sorted(ecs.entities_with(Entity))
+    for id in index.ids:
+        assert index.archetypes[id] == frozenset(ecs[id])
+        assert index.labels[id] == str(ecs[id][Entity])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_updates_match_rebuild(seed):
+    ecs = populated(seed)
+    index = EntityIndex(ecs)
+    rng = np.random.default_rng(seed + 100)
+    for _ in range(10):
+        random_edits(ecs, rng, 30)
+        assert_same(index, EntityIndex(ecs))
+
+
+@pytest.mark.parametrize("key", FILTERS)
+def test_incremental_filter_matches_rebuild(key):
+    ecs = populated(1)
+    index = EntityIndex(ecs)
+    # The filter is set first, then kept up to date by the events
+    index.filter(*key)
+    rng = np.random.default_rng(7)
+    for _ in range(10):
+        random_edits(ecs, rng, 30)
+        expected = EntityIndex(ecs).filter(*key)
+        assert index.filter(*key) == expected
+        assert expected == sorted(expected)
+
+
+def test_filter_by_type_and_text():
+    ecs = ECS()
+    orc = ecs.spawn([A()], label="Orc")
+    ecs.spawn([A(), B()], label="Elf")
+    ecs.spawn([B()], label="Orc")
+    index = EntityIndex(ecs)
+    assert index.filter("orc", A) == [orc]
+    assert index.filter("ORC") == [orc, 2]
+    assert index.filter(ty=C) == []
+
+    ecs.add_component(orc, C())
+    assert index.filter(ty=C) == [orc]
+    assert index.type_archetypes[C] == 1
+    ecs.kill(orc)
+    assert index.filter(ty=C) == []
+    assert index.type_archetypes[C] == 0
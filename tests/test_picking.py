@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+gfx = pytest.importorskip("pygfx")
+
+from wgut.picking import CPUPicker, MeshTriangles, ray_triangles  # noqa: E402
+
+
+def mesh(position, material=None, **kwargs) -> "gfx.Mesh":
+    material = material or gfx.MeshBasicMaterial(pick_write=True)
+    obj = gfx.Mesh(gfx.box_geometry(1, 1, 1), material, **kwargs)
+    obj.local.position = position
+    return obj
+
+
+def world_triangles(obj) -> np.ndarray:
+    positions = np.asarray(obj.geometry.positions.data, dtype=np.float64)
+    faces = np.asarray(obj.geometry.indices.data).reshape(-1, 3)
+    points = np.c_[positions, np.ones(len(positions))] @ obj.world.matrix.T
+    return points[:, :3][faces]
+
+
+def brute_force(objects, origin, direction) -> tuple[object, int, float] | None:
+    best = None
+    for obj in objects:
+        t, _, _ = ray_triangles(origin, direction, world_triangles(obj))
+        face = int(np.argmin(t))
+        if np.isfinite(t[face]) and (best is None or t[face] < best[2]):
+            best = (obj, face, float(t[face]))
+    return best
+
+
+def test_ray_triangles():
+    vertices = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]]], dtype=np.float64)
+    t, u, v = ray_triangles(
+        np.array([0.25, 0.25, 1.0]), np.array([0, 0, -1.0]), vertices
+    )
+    assert t[0] == pytest.approx(1.0)
+    assert (u[0], v[0]) == pytest.approx((0.25, 0.25))
+    t, _, _ = ray_triangles(np.array([2.0, 2.0, 1.0]), np.array([0, 0, -1.0]), vertices)
+    assert np.isinf(t[0])
+
+
+def test_mesh_triangles_quads():
+    geometry = gfx.Geometry(
+        positions=np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], np.float32),
+        indices=np.array([[0, 1, 2, 3]], dtype=np.int32),
+    )
+    triangles = MeshTriangles(geometry)
+    hit = triangles.raycast(np.array([0.2, 0.7, 1.0]), np.array([0, 0, -1.0]))
+    assert hit is not None
+    assert hit["face_index"] == 0
+    assert len(hit["face_coord"]) == 4
+    assert hit["distance"] == pytest.approx(1.0)
+    assert triangles.raycast(np.array([2.0, 2.0, 1.0]), np.array([0, 0, -1.0])) is None
+
+
+def test_raycast_matches_brute_force():
+    rng = np.random.default_rng(0)
+    scene = gfx.Group()
+    objects = []
+    for _ in range(40):
+        obj = mesh(rng.uniform(-5, 5, 3))
+        obj.local.scale = rng.uniform(0.5, 2.0, 3)
+        rotation = rng.normal(size=4)
+        obj.local.rotation = rotation / np.linalg.norm(rotation)
+        scene.add(obj)
+        objects.append(obj)
+    picker = CPUPicker(None)
+    picker.add(scene)
+
+    for _ in range(100):
+        origin = rng.uniform(-8, 8, 3)
+        direction = rng.normal(size=3)
+        direction /= np.linalg.norm(direction)
+        info = picker.raycast(origin, direction)
+        expected = brute_force(objects, origin, direction)
+        if expected is None:
+            assert info is None
+            continue
+        assert info is not None
+        assert info["world_object"] is expected[0]
+        assert info["face_index"] == expected[1]
+        assert info["distance"] == pytest.approx(expected[2], rel=1e-4)
+        assert info["world_position"] == pytest.approx(
+            origin + expected[2] * direction, abs=1e-3
+        )
+
+
+def test_moves_need_new_frame():
+    obj = mesh((0, 0, 0))
+    picker = CPUPicker(None)
+    picker.add(obj)
+    origin, direction = np.array([0, 0, 5.0]), np.array([0, 0, -1.0])
+    assert picker.raycast(origin, direction)["distance"] == pytest.approx(4.5)
+
+    obj.local.position = (0, 0, 2)
+    picker.new_frame()
+    assert picker.raycast(origin, direction)["distance"] == pytest.approx(2.5)
+    obj.local.position = (10, 0, 0)
+    picker.new_frame()
+    assert picker.raycast(origin, direction) is None
+
+
+def test_layers_visibility_and_removal():
+    near = mesh((0, 0, 2))
+    far = mesh((0, 0, -2))
+    hidden = mesh((0, 0, 0), visible=False)
+    unpickable = mesh((0, 0, 3), gfx.MeshBasicMaterial(pick_write=False))
+    picker = CPUPicker(None)
+    for obj in (near, hidden, unpickable):
+        picker.add(obj)
+    picker.add(far, layer=1)
+    origin, direction = np.array([0, 0, 10.0]), np.array([0, 0, -1.0])
+
+    # The higher layer wins even behind another mesh
+    info = picker.raycast(origin, direction)
+    assert info["world_object"] is far and info["layer"] == 1
+    picker.remove(far)
+    assert picker.raycast(origin, direction)["world_object"] is near
+    picker.remove(near)
+    assert picker.raycast(origin, direction) is None
+    hidden.visible = True
+    assert picker.raycast(origin, direction)["world_object"] is hidden
+
+
+def test_instanced_mesh():
+    obj = gfx.InstancedMesh(
+        gfx.box_geometry(1, 1, 1), gfx.MeshBasicMaterial(pick_write=True), 3
+    )
+    for instance, x in enumerate((-3.0, 0.0, 3.0)):
+        matrix = np.eye(4, dtype=np.float32)
+        matrix[0, 3] = x
+        obj.set_matrix_at(instance, matrix)
+    picker = CPUPicker(None)
+    picker.add(obj)
+    direction = np.array([0, 0, -1.0])
+    for instance, x in enumerate((-3.0, 0.0, 3.0)):
+        info = picker.raycast(np.array([x, 0, 5.0]), direction)
+        assert info["world_object"] is obj
+        assert info["instance_index"] == instance
+        assert info["distance"] == pytest.approx(4.5)
+
+    # Instance moves are seen through the buffer revision
+    matrix = np.eye(4, dtype=np.float32)
+    matrix[1, 3] = 10.0
+    # Revisions only change once the buffer has been uploaded, as the renderer
+    # does between frames
+    obj.instance_buffer._gfx_get_chunk_descriptions()
+    obj.set_matrix_at(1, matrix)
+    picker.new_frame()
+    assert picker.raycast(np.array([0, 0, 5.0]), direction) is None
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from wgut.tools.ring_buffer import RingBuffer
+
+
+def filled(samples: np.ndarray, length: int, stats_interval: int = 1) -> RingBuffer:
+    buffer = RingBuffer(length, stats_interval)
+    for value in samples:
+        buffer.push(float(value))
+    return buffer
+
+
+def expected_low_rate(window: np.ndarray, fraction: float) -> float:
+    count = max(int(len(window) * fraction), 1)
+    return 1.0 / np.sort(window)[-count:].mean()
+
+
+@pytest.mark.parametrize("count", [1, 50, 100, 257, 1000])
+def test_stats_match_numpy(count):
+    rng = np.random.default_rng(count)
+    samples = rng.gamma(2.0, 0.008, count)
+    length = 100
+    buffer = filled(samples, length)
+    window = samples[-length:]
+
+    assert len(buffer) == len(window)
+    assert np.array_equal(buffer.values(), window)
+    assert buffer.last == samples[-1]
+    stats = buffer.stats()
+    assert stats["mean"] == pytest.approx(window.mean())
+    p50, p95, p99 = np.percentile(window, (50, 95, 99))
+    assert stats["p50"] == pytest.approx(p50)
+    assert stats["p95"] == pytest.approx(p95)
+    assert stats["p99"] == pytest.approx(p99)
+    assert stats["max"] == window.max()
+    for fraction in (0.01, 0.1, 0.5):
+        assert buffer.low_rate(fraction) == pytest.approx(
+            expected_low_rate(window, fraction)
+        )
+
+
+def test_values_stay_contiguous_across_wraparound():
+    buffer = RingBuffer(8)
+    for value in range(30):
+        buffer.push(value)
+        window = np.arange(max(value - 7, 0), value + 1, dtype=np.float64)
+        values = buffer.values()
+        assert np.array_equal(values, window)
+        assert values.base is not None
+        assert len(buffer.xs()) == len(values)
+        assert buffer.mean == pytest.approx(window.mean())
+
+
+def test_max_drops_out_of_window():
+    buffer = filled(np.array([100.0] + [1.0] * 10), 10)
+    assert buffer.stats()["max"] == 1.0
+
+
+def test_stats_refresh_interval():
+    buffer = RingBuffer(100, stats_interval=10)
+    for _ in range(20):
+        buffer.push(1.0)
+    assert buffer.stats()["p50"] == 1.0
+
+    for _ in range(5):
+        buffer.push(3.0)
+    stats = buffer.stats()
+    # The mean and a new maximum are live, percentiles wait for the refresh
+    assert stats["mean"] == pytest.approx(35 / 25)
+    assert stats["max"] == 3.0
+    assert stats["p99"] == 1.0
+
+    for _ in range(5):
+        buffer.push(3.0)
+    assert buffer.stats()["p99"] == pytest.approx(3.0)
+
+
+def test_empty_and_clear():
+    buffer = RingBuffer(16)
+    assert buffer.stats() == {
+        "mean": 0.0,
+        "p50": 0.0,
+        "p95": 0.0,
+        "p99": 0.0,
+        "max": 0.0,
+    }
+    assert buffer.low_rate() == 0.0
+
+    for value in range(40):
+        buffer.push(value)
+    buffer.clear()
+    assert len(buffer) == 0
+    assert len(buffer.values()) == 0
+    assert buffer.stats()["max"] == 0.0
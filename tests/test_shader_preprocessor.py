@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from wgut.core import ShaderPreprocessorError, load_shader, preprocess_shader
+
+
+def lines(source: str) -> list[str]:
+    return [line for line in source.splitlines() if line.strip()]
+
+
+def write(path, content: str, mtime: float | None = None):
+    path.write_text(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_include_once(tmp_path):
+    write(tmp_path / "common.wgsl", "const ONE = 1;")
+    write(tmp_path / "a.wgsl", '#include "common.wgsl"\nconst A = ONE;')
+    write(
+        tmp_path / "main.wgsl",
+        '#include "common.wgsl"\n#include "a.wgsl"\n#include "common.wgsl"\n',
+    )
+    source = load_shader(str(tmp_path / "main.wgsl"))
+    assert lines(source) == ["const ONE = 1;", "const A = ONE;"]
+
+
+def test_nested_ifdef_else():
+    source = """
+#ifdef A
+a
+#ifdef B
+ab
+#else
+a_not_b
+#endif
+#else
+not_a
+#ifndef B
+not_a_not_b
+#endif
+#endif
+"""
+    assert lines(preprocess_shader(source, {"A": 1, "B": 1})) == ["a", "ab"]
+    assert lines(preprocess_shader(source, {"A": 1})) == ["a", "a_not_b"]
+    assert lines(preprocess_shader(source, {"B": 1})) == ["not_a"]
+    assert lines(preprocess_shader(source)) == ["not_a", "not_a_not_b"]
+
+
+def test_inactive_block_ignores_directives():
+    source = "#ifdef A\n#define B 1\n#include missing.wgsl\n#endif\nB\n"
+    assert lines(preprocess_shader(source)) == ["B"]
+
+
+def test_define_chaining():
+    source = "#define SIZE 64\n#define HALF SIZE / 2\n#undef SIZE\nSIZE HALF N\n"
+    assert lines(preprocess_shader(source, {"N": 3})) == ["SIZE 64 / 2 3"]
+
+
+def test_defines_match_whole_words():
+    assert lines(preprocess_shader("N N_MAX", {"N": 8})) == ["8 N_MAX"]
+
+
+def test_mtime_invalidation(tmp_path):
+    write(tmp_path / "common.wgsl", "const X = 1;", mtime=1000)
+    write(tmp_path / "main.wgsl", '#include "common.wgsl"', mtime=1000)
+    main = str(tmp_path / "main.wgsl")
+    assert lines(load_shader(main)) == ["const X = 1;"]
+
+    write(tmp_path / "common.wgsl", "const X = 2;", mtime=2000)
+    assert lines(load_shader(main)) == ["const X = 2;"]
+
+
+def test_deleted_include_invalidation(tmp_path):
+    write(tmp_path / "common.wgsl", "const X = 1;")
+    write(tmp_path / "main.wgsl", '#include "common.wgsl"')
+    main = str(tmp_path / "main.wgsl")
+    load_shader(main)
+
+    os.remove(tmp_path / "common.wgsl")
+    with pytest.raises(ShaderPreprocessorError, match="not found"):
+        load_shader(main)
+
+
+def test_cache_is_keyed_by_defines(tmp_path):
+    write(tmp_path / "main.wgsl", "#ifdef A\na\n#else\nb\n#endif")
+    main = str(tmp_path / "main.wgsl")
+    assert lines(load_shader(main, {"A": 1})) == ["a"]
+    assert lines(load_shader(main)) == ["b"]
+
+
+@pytest.mark.parametrize(
+    "source, line, message",
+    [
+        ("#else", 1, "#else without #if"),
+        ("x\n#endif", 2, "#endif without #if"),
+        ("#ifdef A\nx", 2, "Missing #endif"),
+        ("x\n#pragma once", 2, "Unknown directive '#pragma'"),
+        ('#include "nope.wgsl"', 1, "Included file '\"nope.wgsl\"' not found"),
+    ],
+)
+def test_errors(source, line, message):
+    with pytest.raises(ShaderPreprocessorError) as info:
+        preprocess_shader(source, filename="test.wgsl")
+    assert info.value.line == line
+    assert info.value.message == message
+    assert str(info.value) == f"test.wgsl:{line}: {message}"
+
+
+def test_error_reports_included_file(tmp_path):
+    write(tmp_path / "bad.wgsl", "x\ny\n#endif")
+    write(tmp_path / "main.wgsl", '#include "bad.wgsl"')
+    with pytest.raises(ShaderPreprocessorError) as info:
+        load_shader(str(tmp_path / "main.wgsl"))
+    assert info.value.filename == str(tmp_path / "bad.wgsl")
+    assert info.value.line == 3
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+from wgut.ecs import ECS
+from wgut.spatial_index import SpatialBounds, SpatialIndex, Static, ray_spheres
+from wgut.transform_system import Transform, TransformStore
+
+RADIUS = 0.25
+
+
+class Scene:
+    def __init__(self, count: int, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.ecs = ECS()
+        self.store = TransformStore(16)
+        for _ in range(count):
+            self.spawn()
+        self.index = SpatialIndex(self.ecs, 2.0, RADIUS, self.store)
+
+    def spawn(self) -> int:
+        components: list = [Transform(self.rng.uniform(-10, 10, 3), store=self.store)]
+        if self.rng.random() < 0.3:
+            components.append(SpatialBounds(float(self.rng.uniform(0.1, 1.5))))
+        if self.rng.random() < 0.3:
+            components.append(Static())
+        return self.ecs.spawn(components)
+
+    def kill(self, id: int):
+        transform = self.ecs[id][Transform]
+        self.ecs.kill(id)
+        transform.release()
+
+    def ids(self) -> list[int]:
+        return sorted(self.ecs.entities_with(Transform))
+
+    def members(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Ids, positions and radii of every entity, by brute force
+        self.store.flush()
+        ids = np.array(self.ids(), dtype=np.int64)
+        positions = np.array(
+            [self.store.world[self.ecs[id][Transform].index, :3, 3] for id in ids],
+            dtype=np.float32,
+        ).reshape(-1, 3)
+        radii = np.array(
+            [
+                self.ecs[id][SpatialBounds].radius
+                if SpatialBounds in self.ecs[id]
+                else RADIUS
+                for id in ids
+            ],
+            dtype=np.float32,
+        )
+        return ids, positions, radii
+
+    def check(self):
+        ids, positions, radii = self.members()
+        rng = np.random.default_rng(len(ids))
+
+        for _ in range(20):
+            center = rng.uniform(-12, 12, 3).astype(np.float32)
+            radius = np.float32(rng.choice([0.5, 3.0, 50.0]))
+            found = self.index.query_radius(center, radius)
+            distance = np.linalg.norm(positions - center, axis=1)
+            expected = ids[distance <= radius + radii]
+            assert sorted(found.tolist()) == sorted(expected.tolist())
+
+            lo = center - rng.uniform(0, 4, 3).astype(np.float32)
+            hi = center + rng.uniform(0, 4, 3).astype(np.float32)
+            found = self.index.query_aabb(lo, hi)
+            inside = np.all((positions + radii[:, None] >= lo), axis=1) & np.all(
+                (positions - radii[:, None] <= hi), axis=1
+            )
+            assert sorted(found.tolist()) == sorted(ids[inside].tolist())
+
+            found, found_distances = self.index.nearest_k(center, 5)
+            order = np.argsort(distance, kind="stable")[:5]
+            assert found.tolist() == ids[order].tolist()
+            assert found_distances == pytest.approx(distance[order], rel=1e-5)
+
+            direction = rng.normal(size=3).astype(np.float32)
+            direction /= np.linalg.norm(direction)
+            origin = rng.uniform(-15, 15, 3).astype(np.float32)
+            hit = self.index.raycast(origin, direction)
+            t = ray_spheres(
+                np.broadcast_to(origin, positions.shape),
+                np.broadcast_to(direction, positions.shape),
+                positions,
+                radii,
+            )
+            if len(t) == 0 or np.isinf(t.min()):
+                assert hit is None
+            else:
+                assert hit is not None
+                assert hit[0] == ids[np.argmin(t)]
+                assert hit[1] == pytest.approx(float(t.min()), rel=1e-4, abs=1e-5)
+
+
+def test_queries_match_brute_force():
+    Scene(300).check()
+
+
+def test_queries_after_moves():
+    scene = Scene(300, seed=1)
+    scene.check()
+    ids = scene.ids()
+    for id in scene.rng.choice(ids, 100, replace=False):
+        transform = scene.ecs[int(id)][Transform]
+        transform.position = transform.position + scene.rng.normal(0, 3, 3)
+    scene.check()
+
+    # Batch moves written to the store directly
+    rows = [scene.ecs[id][Transform].index for id in ids]
+    scene.store.position[rows] += scene.rng.normal(0, 0.1, (len(rows), 3))
+    scene.store.mark_dirty(rows)
+    scene.check()
+
+
+def test_queries_after_spawns_and_kills():
+    scene = Scene(200, seed=2)
+    scene.check()
+    for id in scene.rng.choice(scene.ids(), 80, replace=False):
+        scene.kill(int(id))
+    scene.check()
+    # Released rows are reused by the new entities
+    for _ in range(50):
+        scene.spawn()
+    scene.check()
+
+
+def test_queries_after_component_changes():
+    scene = Scene(200, seed=3)
+    scene.check()
+    ids = scene.ids()
+    statics = [id for id in ids if Static in scene.ecs[id]]
+    dynamics = [id for id in ids if Static not in scene.ecs[id]]
+    for id in statics[: len(statics) // 2]:
+        scene.ecs.remove_component(id, Static)
+    for id in dynamics[: len(dynamics) // 2]:
+        scene.ecs.add_component(id, Static())
+    scene.check()
+
+    for id in ids[::7]:
+        scene.ecs.add_component(id, SpatialBounds(2.0))
+    scene.check()
+
+    # Without a Transform the entity leaves the index
+    for id in ids[::5]:
+        transform = scene.ecs[id][Transform]
+        scene.ecs.remove_component(id, Transform)
+        transform.release()
+    scene.check()
+
+
+def test_moving_statics():
+    scene = Scene(100, seed=4)
+    scene.check()
+    for id in scene.ids():
+        if Static in scene.ecs[id]:
+            transform = scene.ecs[id][Transform]
+            transform.position = transform.position + (5.0, 0.0, 0.0)
+    scene.check()
+
+
+def test_empty_index():
+    index = SpatialIndex(ECS(), store=TransformStore(4))
+    assert len(index.query_radius((0, 0, 0), 10.0)) == 0
+    assert len(index.query_aabb((-1, -1, -1), (1, 1, 1))) == 0
+    ids, distances = index.nearest_k((0, 0, 0), 3)
+    assert len(ids) == 0 and len(distances) == 0
+    assert index.raycast((0, 0, 0), (1, 0, 0)) is None
+
+
+def test_nearest_k_pads_missing():
+    scene = Scene(3, seed=5)
+    ids, distances = scene.index.nearest_k_batch([(0, 0, 0), (50, 50, 50)], 5)
+    assert ids.shape == (2, 5)
+    assert (ids[:, :3] >= 0).all() and (ids[:, 3:] == -1).all()
+    assert np.isinf(distances[:, 3:]).all()
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from wgut.transform_system import Transform, TransformStore, compose
+
+
+def local_matrix(transform: Transform) -> np.ndarray:
+    return compose(
+        transform.position[None], transform.rotation[None], transform.scale[None]
+    )[0].astype(np.float64)
+
+
+def expected_world(transform: Transform) -> np.ndarray:
+    # Walks the parent chain up to the root
+    store = transform.store
+    matrix = np.eye(4)
+    index = transform.index
+    while index >= 0:
+        matrix = (
+            compose(
+                store.position[index][None],
+                store.rotation[index][None],
+                store.scale[index][None],
+            )[0].astype(np.float64)
+            @ matrix
+        )
+        index = int(store.parent[index])
+    return matrix
+
+
+def quaternion(axis, angle: float) -> tuple[float, float, float, float]:
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    x, y, z = axis * np.sin(angle / 2)
+    return (x, y, z, np.cos(angle / 2))
+
+
+def chain(store: TransformStore, count: int) -> list[Transform]:
+    transforms = []
+    parent = None
+    for level in range(count):
+        parent = Transform(
+            (1.0, float(level), 0.0),
+            quaternion((0, 0, 1), 0.3 * (level + 1)),
+            (1.0, 1.0 + 0.1 * level, 1.0),
+            parent=parent,
+            store=store,
+        )
+        transforms.append(parent)
+    return transforms
+
+
+def test_compose_matches_rotation():
+    matrix = compose(
+        np.array([[1.0, 2.0, 3.0]]),
+        np.array([quaternion((0, 0, 1), np.pi / 2)]),
+        np.array([[2.0, 2.0, 2.0]]),
+    )[0]
+    assert matrix @ np.array([1, 0, 0, 1]) == pytest.approx([1, 4, 3, 1], abs=1e-6)
+
+
+def test_propagation_through_chain():
+    store = TransformStore(2)
+    transforms = chain(store, 6)
+    store.flush()
+    for transform in transforms:
+        assert transform.world_matrix == pytest.approx(
+            expected_world(transform), abs=1e-5
+        )
+
+
+def test_parent_change_reaches_descendants():
+    store = TransformStore()
+    transforms = chain(store, 5)
+    other = Transform((0.0, 0.0, 5.0), store=store)
+    store.flush()
+
+    transforms[1].position = (3.0, -1.0, 2.0)
+    changed = store.update()
+    assert sorted(changed.tolist()) == [t.index for t in transforms[1:]]
+    for transform in [*transforms, other]:
+        assert transform.world_matrix == pytest.approx(
+            expected_world(transform), abs=1e-5
+        )
+
+
+def test_children_created_before_parent():
+    store = TransformStore()
+    child = Transform((1.0, 0.0, 0.0), store=store)
+    parent = Transform((0.0, 2.0, 0.0), quaternion((1, 0, 0), 1.0), store=store)
+    child.set_parent(parent)
+    store.flush()
+    assert child.world_matrix == pytest.approx(expected_world(child), abs=1e-5)
+    assert child.world_matrix == pytest.approx(
+        local_matrix(parent) @ local_matrix(child), abs=1e-5
+    )
+
+
+def test_release_parent_moves_children_to_root():
+    store = TransformStore()
+    root, middle, leaf = chain(store, 3)
+    store.flush()
+
+    middle.release()
+    assert store.parent[leaf.index] == -1
+    changed = store.update()
+    assert leaf.index in changed.tolist()
+    assert leaf.world_matrix == pytest.approx(local_matrix(leaf), abs=1e-5)
+    assert root.world_matrix == pytest.approx(local_matrix(root), abs=1e-5)
+
+    # The released row is reused, without the old children
+    reused = Transform((4.0, 0.0, 0.0), store=store)
+    assert reused.index == middle.index
+    reused.position = (5.0, 0.0, 0.0)
+    store.flush()
+    assert leaf.world_matrix == pytest.approx(local_matrix(leaf), abs=1e-5)
+    assert reused.world_matrix == pytest.approx(local_matrix(reused), abs=1e-5)
+
+
+def test_cycles_are_rejected():
+    store = TransformStore()
+    root, middle, leaf = chain(store, 3)
+    with pytest.raises(ValueError):
+        root.set_parent(leaf)
+    with pytest.raises(ValueError):
+        middle.set_parent(middle)
+
+
+def test_update_without_changes():
+    store = TransformStore()
+    chain(store, 3)
+    store.flush()
+    version = store.version
+    assert len(store.update()) == 0
+    assert store.version == version
+
+
+def test_batch_writes():
+    store = TransformStore()
+    transforms = [Transform(store=store) for _ in range(100)]
+    parent = Transform((0.0, 0.0, 10.0), store=store)
+    for transform in transforms[::2]:
+        transform.set_parent(parent)
+    store.flush()
+
+    rows = [transform.index for transform in transforms]
+    positions = np.random.default_rng(0).normal(size=(100, 3))
+    store.position[rows] = positions
+    store.mark_dirty(rows)
+    store.flush()
+    world = store.world[rows, :3, 3]
+    offset = np.where(np.arange(100)[:, None] % 2 == 0, (0.0, 0.0, 10.0), 0.0)
+    assert world == pytest.approx(positions + offset, abs=1e-5)